@@ -0,0 +1 @@
+"""离线基准测试：本地模拟 OCR 服务、合成 PDF 语料与吞吐/延迟测量脚本"""
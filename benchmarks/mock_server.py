@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""模拟 llama-server 的 OCR 服务，用于离线基准测试。
+
+- `POST /v1/chat/completions`：按配置的延迟分布等待后返回合成 Markdown，支持流式（SSE）
+  与多页批量请求（按请求中的 `<<<PAGE N>>>` 标记分页输出）；
+- 按错误率随机返回 503；
+- 按图片像素数估算提示词 token，超过 `--n-ctx` 时返回与 llama-server 相同格式的上下文超限错误；
+- `GET /health` 始终返回 200；指定 `--slots` 时 `GET /props` 返回 `total_slots`；
+- `GET /stats` 返回请求计数，便于核对客户端行为。
+
+用法：python -m benchmarks.mock_server --port 8090 --latency-dist lognormal --latency-ms 800
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+_PAGE_MARKER = re.compile(r"<<<PAGE[ \t]+(\d+)>>>")
+# 合成输出的段落模板
+_LOREM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt "
+    "ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation."
+)
+
+
+@dataclass
+class MockOptions:
+    """模拟服务的行为参数"""
+    # 延迟分布：fixed / uniform / lognormal
+    latency_dist: str = "lognormal"
+    # 延迟的中位数（毫秒）
+    latency_ms: float = 500.0
+    # 离散程度：uniform 为 ±比例，lognormal 为对数标准差
+    latency_spread: float = 0.3
+    # 每百万像素附加的延迟（毫秒），模拟大图的预填充开销
+    ms_per_megapixel: float = 0.0
+    # 随机返回 503 的比例（0~1）
+    error_rate: float = 0.0
+    # 上下文长度（token），0 表示不模拟上下文超限
+    n_ctx: int = 0
+    # 每个图片 token 对应的像素数
+    pixels_per_token: int = 784
+    # 每页输出的字符数
+    output_chars: int = 1200
+    # /props 返回的槽位数，0 表示不提供 /props
+    slots: int = 0
+    seed: Optional[int] = None
+
+
+def sample_latency(options: MockOptions, rng: random.Random) -> float:
+    """按配置的分布抽取一次延迟（秒）"""
+    base = options.latency_ms / 1000.0
+    if options.latency_dist == "fixed":
+        return base
+    if options.latency_dist == "uniform":
+        return max(0.0, rng.uniform(base * (1 - options.latency_spread), base * (1 + options.latency_spread)))
+    if options.latency_dist == "lognormal":
+        return base * math.exp(rng.gauss(0.0, options.latency_spread))
+    raise ValueError(f"未知的延迟分布：{options.latency_dist}")
+
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """从 PNG / JPEG 头部读取图片宽高，无法识别时返回 None"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:2] == b"\xff\xd8":
+        pos = 2
+        while pos + 9 < len(data):
+            if data[pos] != 0xFF:
+                pos += 1
+                continue
+            marker = data[pos + 1]
+            # SOF0~SOF15（排除 DHT/JPG/DAC）中记录了图片尺寸
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[pos + 5 : pos + 9])
+                return width, height
+            length = struct.unpack(">H", data[pos + 2 : pos + 4])[0]
+            pos += 2 + length
+    return None
+
+
+def _fake_page(page_number: int, chars: int) -> str:
+    lines = [f"## Page {page_number}", ""]
+    body = ""
+    while len(body) < chars:
+        body += _LOREM + " "
+    for i in range(0, len(body[:chars]), 120):
+        lines.append(body[i : i + 120].strip())
+    lines += ["", "| col1 | col2 |", "| --- | --- |", f"| {page_number} | value |"]
+    return "\n".join(lines)
+
+
+class MockOcrServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], options: MockOptions) -> None:
+        super().__init__(address, _Handler)
+        self.options = options
+        self.rng = random.Random(options.seed)
+        self.lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "pages": 0,
+            "errors_injected": 0,
+            "context_exceeded": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+        }
+
+    def draw(self) -> Tuple[float, bool]:
+        """在锁内抽取本次请求的 (延迟, 是否注入错误)，保证给定 seed 时序列可复现"""
+        with self.lock:
+            return sample_latency(self.options, self.rng), self.rng.random() < self.options.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockOcrServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, obj: Any) -> None:
+        out = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/props" and self.server.options.slots > 0:
+            n_ctx = self.server.options.n_ctx or 8192
+            self._send_json(
+                200,
+                {
+                    "total_slots": self.server.options.slots,
+                    "model_path": "mock",
+                    "default_generation_settings": {"n_ctx": n_ctx},
+                },
+            )
+        elif self.path == "/stats":
+            with self.server.lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "File Not Found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length))
+        content = body["messages"][0]["content"]
+        page_numbers: List[int] = []
+        pixels = 0
+        for part in content:
+            if part.get("type") == "text":
+                page_numbers += [int(n) for n in _PAGE_MARKER.findall(part["text"])]
+            elif part.get("type") == "image_url":
+                data = base64.b64decode(part["image_url"]["url"].split(",", 1)[1])
+                size = image_size(data)
+                # 无法识别格式时按 3 字节/像素粗略估算
+                pixels += size[0] * size[1] if size else len(data) // 3
+
+        stats = self.server.stats
+        options = self.server.options
+        with self.server.lock:
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            latency, inject_error = self.server.draw()
+            n_prompt = math.ceil(pixels / options.pixels_per_token) + 64
+            if options.n_ctx and n_prompt > options.n_ctx:
+                with self.server.lock:
+                    stats["context_exceeded"] += 1
+                # 与 llama-server 的错误体一致：客户端据此估算分块数
+                self._send_json(
+                    400,
+                    {
+                        "error": {
+                            "code": 400,
+                            "message": "the request exceeds the available context size, try increasing it",
+                            "type": "exceed_context_size_error",
+                            "n_prompt_tokens": n_prompt,
+                            "n_ctx": options.n_ctx,
+                        }
+                    },
+                )
+                return
+            time.sleep(latency + options.ms_per_megapixel * pixels / 1e6 / 1000.0)
+            if inject_error:
+                with self.server.lock:
+                    stats["errors_injected"] += 1
+                self._send_json(503, {"error": {"code": 503, "message": "injected error"}})
+                return
+
+            if page_numbers:
+                text = "\n\n".join(f"<<<PAGE {n}>>>\n{_fake_page(n, options.output_chars)}" for n in page_numbers)
+            else:
+                text = _fake_page(0, options.output_chars)
+            with self.server.lock:
+                stats["pages"] += max(1, len(page_numbers))
+            usage = {"prompt_tokens": n_prompt, "completion_tokens": len(text) // 4}
+            # 与 llama-server 的 timings 字段一致：模拟延迟按 3:7 计为预填充与生成耗时
+            timings = {"prompt_ms": latency * 300, "predicted_ms": latency * 700}
+            if body.get("stream"):
+                self._send_stream(text, usage, timings)
+            else:
+                self._send_json(
+                    200,
+                    {
+                        "choices": [{"message": {"content": text}, "finish_reason": "stop"}],
+                        "usage": usage,
+                        "timings": timings,
+                    },
+                )
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.server.lock:
+                stats["in_flight"] -= 1
+
+    def _send_stream(self, text: str, usage: Dict[str, int], timings: Dict[str, float]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(obj: Any) -> None:
+            self.wfile.write(b"data: " + json.dumps(obj).encode() + b"\n\n")
+
+        for i in range(0, len(text), 64):
+            send({"choices": [{"delta": {"content": text[i : i + 64]}}]})
+        send({"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": usage, "timings": timings})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = MockOptions()
+    parser = argparse.ArgumentParser(description="模拟 llama-server 的 OCR 服务（离线基准测试用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default=defaults.latency_dist)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="延迟中位数（毫秒）")
+    parser.add_argument("--latency-spread", type=float, default=defaults.latency_spread, help="延迟离散程度")
+    parser.add_argument("--ms-per-megapixel", type=float, default=defaults.ms_per_megapixel)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="随机返回 503 的比例")
+    parser.add_argument("--n-ctx", type=int, default=defaults.n_ctx, help="上下文长度，0 表示不模拟超限")
+    parser.add_argument("--pixels-per-token", type=int, default=defaults.pixels_per_token)
+    parser.add_argument("--output-chars", type=int, default=defaults.output_chars)
+    parser.add_argument("--slots", type=int, default=defaults.slots, help="/props 返回的槽位数，0 表示不提供")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args()
+
+
+def options_from_args(args: argparse.Namespace) -> MockOptions:
+    return MockOptions(**{name: getattr(args, name) for name in asdict(MockOptions())})
+
+
+def main() -> None:
+    args = parse_args()
+    server = MockOcrServer((args.host, args.port), options_from_args(args))
+    print(f"模拟 OCR 服务已启动：http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
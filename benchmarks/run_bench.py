@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""离线基准测试：在合成语料与模拟 OCR 服务上，按不同并发数运行完整转换流程并记录性能指标。
+
+每个并发档位在独立子进程中运行（峰值内存与事件循环互不干扰），记录：
+- 吞吐：页/秒；
+- 页面 OCR 延迟 p50/p95/p99（客户端观测，含重试；分块 OCR 的每块单独计入，批量请求中每页计为整次请求的耗时）；
+- 峰值 RSS：主进程与最大的子进程（渲染/探测进程）；
+- 事件循环延迟：定时唤醒的实际滞后 p50/p99/最大值。
+
+结果保存为 JSON，可用 --baseline 与历史结果对比。
+
+用法：python -m benchmarks.run_bench --concurrency 1,4,8 --latency-ms 300
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from benchmarks.mock_server import MockOptions
+from benchmarks.synth_pdfs import generate_corpus, parse_int_list
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+# 事件循环延迟的采样间隔（秒）
+_LAG_INTERVAL = 0.05
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """最近秩法计算百分位数，空序列返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(-(-q * len(ordered) // 100))))
+    return ordered[rank - 1]
+
+
+def _summary_ms(values: Sequence[float], quantiles: Sequence[int]) -> Dict[str, Optional[float]]:
+    out: Dict[str, Optional[float]] = {}
+    for q in quantiles:
+        value = percentile(values, q)
+        out[f"p{q}"] = round(value * 1000, 2) if value is not None else None
+    out["max"] = round(max(values) * 1000, 2) if values else None
+    return out
+
+
+def _peak_rss_mb(who: int) -> float:
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# ---------------------------------------------------------------------------
+# 子进程：运行单个并发档位
+
+
+def _instrument_ocr_client(latencies: List[float]) -> None:
+    """包装 OcrClient 的单页与批量请求，记录每页的请求耗时（仅在基准子进程内生效）"""
+    from pdf_ocr_md.ocr.client import OcrClient
+
+    complete = OcrClient.complete
+
+    async def timed_complete(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await complete(self, request, *args, **kwargs)
+        finally:
+            # 延迟包含请求体的构造耗时（在 complete 之前完成）
+            latencies.extend([time.perf_counter() - start + request.build_seconds] * request.page_count)
+
+    OcrClient.complete = timed_complete
+
+
+async def _monitor_loop_lag(samples: List[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + _LAG_INTERVAL
+        await asyncio.sleep(_LAG_INTERVAL)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def _run_level(spec: Dict[str, Any]) -> Dict[str, Any]:
+    from pdf_ocr_md.config import AppConfig
+    from pdf_ocr_md.orchestrator import run
+
+    output_dir = Path(spec["output_dir"])
+    shutil.rmtree(output_dir, ignore_errors=True)
+    base = (
+        AppConfig.load_from_toml(Path(spec["config"]))
+        if spec.get("config")
+        else AppConfig(input_dir=Path(spec["corpus"]), output_dir=output_dir)
+    )
+    config = dataclasses.replace(
+        base,
+        input_dir=Path(spec["corpus"]),
+        output_dir=output_dir,
+        server_url=spec["server_url"],
+        ocr_endpoints=[],
+        max_concurrency=spec["concurrency"],
+        # 档位由基准测试指定，不按服务端槽位数调整
+        auto_concurrency=False,
+        incremental=False,
+    )
+
+    latencies: List[float] = []
+    lag: List[float] = []
+    _instrument_ocr_client(latencies)
+    monitor = asyncio.create_task(_monitor_loop_lag(lag))
+    start = time.perf_counter()
+    try:
+        results, stats = await run(config, force_restart=True)
+    finally:
+        elapsed = time.perf_counter() - start
+        monitor.cancel()
+
+    pages = sum(spec["files"].values())
+    return {
+        "concurrency": spec["concurrency"],
+        "seconds": round(elapsed, 3),
+        "pages": pages,
+        "pages_per_sec": round(pages / elapsed, 3) if elapsed > 0 else None,
+        "failed_files": sum(1 for r in results if not r.success),
+        "ocr_calls": len(latencies),
+        "page_latency_ms": _summary_ms(latencies, (50, 95, 99)),
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "peak_child_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "loop_lag_ms": _summary_ms(lag, (50, 99)),
+        "stats": stats,
+    }
+
+
+def _worker_main(spec_json: str) -> None:
+    spec = json.loads(spec_json)
+    logging.basicConfig(level=spec.get("log_level", "WARNING"), stream=sys.stderr)
+    result = asyncio.run(_run_level(spec))
+    # 结果作为 stdout 的最后一行交给父进程
+    print(json.dumps(result, ensure_ascii=False))
+
+
+# ---------------------------------------------------------------------------
+# 父进程：准备语料与模拟服务，逐档运行并汇总
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_mock(options: MockOptions) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    cmd = [sys.executable, "-m", "benchmarks.mock_server", "--port", str(port)]
+    for name, value in dataclasses.asdict(options).items():
+        if value is not None:
+            cmd += [f"--{name.replace('_', '-')}", str(value)]
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("模拟 OCR 服务启动超时")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(levels: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]]) -> None:
+    base_by_level = {r["concurrency"]: r for r in (baseline or {}).get("results", [])}
+    header = f"{'并发':>4} {'页/秒':>8} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'RSS MB':>8} {'子进程MB':>8} {'循环p99ms':>9}"
+    if baseline:
+        header += f" {'对比基线':>8}"
+    print(header)
+    for r in levels:
+        lat = r["page_latency_ms"]
+        line = (
+            f"{r['concurrency']:>4} {r['pages_per_sec'] or 0:>8.2f} {lat['p50'] or 0:>8.0f} {lat['p95'] or 0:>8.0f} "
+            f"{lat['p99'] or 0:>8.0f} {r['peak_rss_mb']:>8.1f} {r['peak_child_rss_mb']:>8.1f} "
+            f"{r['loop_lag_ms']['p99'] or 0:>9.1f}"
+        )
+        base = base_by_level.get(r["concurrency"])
+        if base and base.get("pages_per_sec") and r["pages_per_sec"]:
+            line += f" {(r['pages_per_sec'] / base['pages_per_sec'] - 1) * 100:>+7.1f}%"
+        print(line)
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    defaults = MockOptions()
+    parser = argparse.ArgumentParser(description="离线基准测试：合成语料 + 模拟 OCR 服务，按并发档位测量吞吐与延迟")
+    parser.add_argument("--concurrency", type=parse_int_list, default=[1, 2, 4, 8], help="并发档位，逗号分隔")
+    parser.add_argument("--config", type=Path, help="基础配置文件（默认使用 AppConfig 默认值）")
+    parser.add_argument("--server-url", help="使用已有的 OCR 服务，而不启动模拟服务")
+    parser.add_argument("--corpus", type=Path, default=REPO_ROOT / "bench_corpus", help="合成语料目录")
+    parser.add_argument("--pages", type=parse_int_list, default=[1, 5, 20], help="语料中各文件页数")
+    parser.add_argument("--docs-per-kind", type=int, default=2, help="每种类型、每种页数的文件数")
+    parser.add_argument("--work-dir", type=Path, default=REPO_ROOT / "bench_output", help="转换输出目录（每档清空）")
+    parser.add_argument("--output", type=Path, help="结果 JSON 路径（默认 benchmarks/results/bench-<时间>.json）")
+    parser.add_argument("--baseline", type=Path, help="用于对比的历史结果 JSON")
+    parser.add_argument("--log-level", default="WARNING", help="基准子进程的日志级别")
+    mock = parser.add_argument_group("模拟服务参数（见 benchmarks/mock_server.py）")
+    mock.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default=defaults.latency_dist)
+    mock.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    mock.add_argument("--latency-spread", type=float, default=defaults.latency_spread)
+    mock.add_argument("--ms-per-megapixel", type=float, default=defaults.ms_per_megapixel)
+    mock.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    mock.add_argument("--n-ctx", type=int, default=defaults.n_ctx)
+    mock.add_argument("--output-chars", type=int, default=defaults.output_chars)
+    mock.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker-spec", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.worker_spec:
+        _worker_main(args.worker_spec)
+        return
+
+    files = generate_corpus(args.corpus, args.pages, args.docs_per_kind, seed=args.seed)
+    print(f"语料：{args.corpus}（{len(files)} 个 PDF，共 {sum(files.values())} 页）")
+
+    mock_options = MockOptions(
+        latency_dist=args.latency_dist,
+        latency_ms=args.latency_ms,
+        latency_spread=args.latency_spread,
+        ms_per_megapixel=args.ms_per_megapixel,
+        error_rate=args.error_rate,
+        n_ctx=args.n_ctx,
+        output_chars=args.output_chars,
+        seed=args.seed,
+    )
+    mock_proc: Optional[subprocess.Popen] = None
+    server_url = args.server_url
+    if server_url is None:
+        mock_proc, server_url = _start_mock(mock_options)
+
+    levels: List[Dict[str, Any]] = []
+    try:
+        for concurrency in args.concurrency:
+            spec = {
+                "concurrency": concurrency,
+                "corpus": str(args.corpus.resolve()),
+                "files": files,
+                "output_dir": str(args.work_dir.resolve()),
+                "server_url": server_url,
+                "config": str(args.config.resolve()) if args.config else None,
+                "log_level": args.log_level,
+            }
+            print(f"运行并发 {concurrency} ...", flush=True)
+            proc = subprocess.run(
+                [sys.executable, "-m", "benchmarks.run_bench", "--worker-spec", json.dumps(spec)],
+                cwd=REPO_ROOT,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            if proc.returncode != 0:
+                raise RuntimeError(f"并发 {concurrency} 的基准子进程失败（退出码 {proc.returncode}）")
+            levels.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    finally:
+        if mock_proc is not None:
+            mock_proc.terminate()
+            mock_proc.wait()
+
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": {
+            "dir": str(args.corpus),
+            "files": len(files),
+            "pages": sum(files.values()),
+            "page_counts": args.pages,
+        },
+        "server": {
+            "url": args.server_url,
+            "mock": None if args.server_url else dataclasses.asdict(mock_options),
+        },
+        "results": levels,
+    }
+    output = args.output or DEFAULT_RESULTS_DIR / f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline else None
+    _print_table(levels, baseline)
+    print(f"结果已保存：{output}")
+
+
+if __name__ == "__main__":
+    main()
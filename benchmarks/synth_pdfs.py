@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""生成基准测试用的合成 PDF 语料。
+
+- born-digital：直接写入文字（带文本层），模拟电子文档；
+- scanned：先把文字页渲染为灰度位图，加入扫描噪点后作为整页图片写入（无文本层），模拟扫描件。
+
+同一参数与 seed 生成的语料内容相同，语料目录中写入 corpus.json 记录各文件页数。
+
+用法：python -m benchmarks.synth_pdfs --out bench_corpus --pages 1,5,20 --docs-per-kind 2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import zlib
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import fitz  # PyMuPDF
+
+CORPUS_MANIFEST = "corpus.json"
+
+_WORDS = (
+    "ocr markdown pipeline render page token latency server slot context batch table figure "
+    "section result document layout column header footer paragraph value total invoice report"
+).split()
+# 扫描件的渲染分辨率与噪点比例
+_SCAN_DPI = 150
+_SCAN_NOISE = 0.004
+
+
+def _paragraphs(rng: random.Random, count: int) -> List[str]:
+    return [" ".join(rng.choice(_WORDS) for _ in range(rng.randint(40, 90))).capitalize() + "." for _ in range(count)]
+
+
+def _draw_text_page(page: fitz.Page, rng: random.Random, page_number: int) -> None:
+    rect = page.rect
+    page.insert_text((72, 60), f"Synthetic document - page {page_number}", fontsize=14)
+    y = 90.0
+    for paragraph in _paragraphs(rng, rng.randint(3, 6)):
+        box = fitz.Rect(72, y, rect.width - 72, rect.height - 72)
+        # insert_textbox 返回剩余空间（负数表示放不下）
+        left = page.insert_textbox(box, paragraph, fontsize=10)
+        if left < 0:
+            break
+        y = box.y1 - left + 12
+    # 简单表格：若干行网格与数字
+    top = min(y + 10, rect.height - 200)
+    for row in range(6):
+        for col in range(4):
+            cell = fitz.Rect(72 + col * 110, top + row * 18, 182 + col * 110, top + (row + 1) * 18)
+            page.draw_rect(cell, width=0.5)
+            page.insert_text((cell.x0 + 4, cell.y1 - 5), str(rng.randint(0, 99999)), fontsize=8)
+
+
+def _add_speckle(pix: fitz.Pixmap, rng: random.Random) -> fitz.Pixmap:
+    """在灰度位图上随机撒黑白噪点，模拟扫描件"""
+    samples = bytearray(pix.samples)
+    for _ in range(int(len(samples) * _SCAN_NOISE)):
+        samples[rng.randrange(len(samples))] = rng.choice((0, 96, 255))
+    return fitz.Pixmap(fitz.csGRAY, pix.width, pix.height, bytes(samples), False)
+
+
+def make_pdf(path: Path, kind: str, pages: int, seed: int) -> None:
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        if kind == "born-digital":
+            _draw_text_page(doc.new_page(), rng, number)
+            continue
+        scratch = fitz.open()
+        source = scratch.new_page()
+        _draw_text_page(source, rng, number)
+        pix = _add_speckle(source.get_pixmap(dpi=_SCAN_DPI, colorspace=fitz.csGRAY), rng)
+        page = doc.new_page(width=source.rect.width, height=source.rect.height)
+        page.insert_image(page.rect, pixmap=pix)
+        scratch.close()
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def generate_corpus(
+    out_dir: Path,
+    page_counts: Sequence[int] = (1, 5, 20),
+    docs_per_kind: int = 2,
+    kinds: Sequence[str] = ("scanned", "born-digital"),
+    seed: int = 0,
+) -> Dict[str, int]:
+    """生成语料并返回 {相对路径: 页数}；目录中已有同参数语料时直接复用"""
+    params = {"page_counts": list(page_counts), "docs_per_kind": docs_per_kind, "kinds": list(kinds), "seed": seed}
+    manifest_path = out_dir / CORPUS_MANIFEST
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("params") == params and all((out_dir / name).exists() for name in manifest["files"]):
+            return manifest["files"]
+
+    files: Dict[str, int] = {}
+    for kind in kinds:
+        (out_dir / kind).mkdir(parents=True, exist_ok=True)
+        for pages in page_counts:
+            for i in range(docs_per_kind):
+                name = f"{kind}/{kind}-{pages:03d}p-{i}.pdf"
+                # 每个文件单独派生 seed，内容互不相同，不会被整本去重合并
+                make_pdf(out_dir / name, kind, pages, zlib.crc32(f"{seed}:{name}".encode()))
+                files[name] = pages
+    manifest_path.write_text(
+        json.dumps({"params": params, "files": files}, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    return files
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="生成基准测试用的合成 PDF 语料")
+    parser.add_argument("--out", type=Path, default=Path("bench_corpus"), help="语料输出目录")
+    parser.add_argument("--pages", type=parse_int_list, default=[1, 5, 20], help="各文件页数，逗号分隔")
+    parser.add_argument("--docs-per-kind", type=int, default=2, help="每种类型、每种页数生成的文件数")
+    parser.add_argument(
+        "--kinds", default="scanned,born-digital", help="文件类型，逗号分隔：scanned / born-digital"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    files = generate_corpus(
+        args.out, args.pages, args.docs_per_kind, [k.strip() for k in args.kinds.split(",") if k.strip()], args.seed
+    )
+    print(f"已生成 {len(files)} 个 PDF，共 {sum(files.values())} 页：{args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ from pathlib import Path
 from pdf_ocr_md.config import AppConfig, build_config_from_args
 from pdf_ocr_md.logging_utils import setup_logging
 from pdf_ocr_md.orchestrator import run as run_pipeline
+from pdf_ocr_md.state_manager import query_progress
 
 
 def parse_args() -> argparse.Namespace:
@@ -36,6 +37,27 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="强制重新开始所有转换（删除已有状态文件）",
     )
+    parser.add_argument(
+        "--no-incremental",
+        action="store_true",
+        help="关闭增量模式（不跳过输入清单中未变化的 PDF）",
+    )
+    parser.add_argument(
+        "--distributed",
+        action="store_true",
+        help="启用分布式模式：多个进程/机器共享输出目录，通过租约文件分工",
+    )
+    parser.add_argument("--worker-id", help="分布式模式下的工作进程标识（默认：主机名-进程号）")
+    parser.add_argument(
+        "--no-merge",
+        action="store_true",
+        help="分布式模式下本进程只处理页段，不负责合并 Markdown",
+    )
+    parser.add_argument(
+        "--show-progress",
+        action="store_true",
+        help="只查询状态库并输出各 PDF 的转换进度，不执行转换（可在转换运行时使用）",
+    )
     return parser.parse_args()
 
 
@@ -54,10 +76,13 @@ def load_config(args: argparse.Namespace) -> AppConfig:
         config.output_dir = args.output_dir
     if args.server_url:
         config.server_url = args.server_url
+        # 命令行指定单个服务地址时，忽略配置文件中的多端点列表
+        config.ocr_endpoints = []
     if args.model:
         config.model = args.model
     if args.max_concurrency is not None:
         config.max_concurrency = args.max_concurrency
+        config.max_concurrency_configured = True
     if args.max_retries is not None:
         config.max_retries = args.max_retries
     if args.request_timeout is not None:
@@ -66,6 +91,14 @@ def load_config(args: argparse.Namespace) -> AppConfig:
         config.log_level = args.log_level
     if args.ocr_prompt_preset:
         config.ocr_prompt_preset = args.ocr_prompt_preset
+    if args.no_incremental:
+        config.incremental = False
+    if args.distributed:
+        config.distributed_enabled = True
+    if args.worker_id:
+        config.distributed_worker_id = args.worker_id
+    if args.no_merge:
+        config.distributed_merger = False
     
     return config
 
@@ -75,19 +108,55 @@ async def async_main(config: AppConfig, force_restart: bool = False) -> None:
     results, stats = await run_pipeline(config, force_restart=force_restart)
 
     logger.info(
-        "转换完成：成功 %d 个，失败 %d 个，总文件 %d，用时 %.2f 秒，平均每文件 %.2f 秒",
+        "转换完成：成功 %d 个，失败 %d 个，总文件 %d，跳过未变化 %d 个，用时 %.2f 秒，平均每文件 %.2f 秒",
         stats["success_count"],
         stats["failed_count"],
         stats["total_files"],
+        stats["skipped_count"],
         stats["total_seconds"],
         stats["avg_seconds_per_file"],
     )
 
 
+def show_progress(config: AppConfig) -> None:
+    """输出状态库中记录的全部 PDF 进度与汇总"""
+    logger = logging.getLogger(__name__)
+    rows = query_progress(config.output_dir)
+    if not rows:
+        logger.info("输出目录 %s 下没有状态记录", config.output_dir)
+        return
+    for row in rows:
+        if row["status"] == "completed":
+            continue
+        logger.info(
+            "进行中：%s：已完成 %d/%s 页，失败 %d 页",
+            row["output_path"],
+            row["completed_pages"],
+            row["total_pages"] if row["total_pages"] is not None else "?",
+            row["failed_pages"],
+        )
+    done = sum(1 for row in rows if row["status"] == "completed")
+    total_pages = sum(row["total_pages"] or 0 for row in rows)
+    completed_pages = sum(row["completed_pages"] for row in rows)
+    failed_pages = sum(row["failed_pages"] for row in rows)
+    logger.info(
+        "进度汇总：PDF 已完成 %d/%d 个；页面已完成 %d/%d，失败 %d；累计请求 %d 次",
+        done,
+        len(rows),
+        completed_pages,
+        total_pages,
+        failed_pages,
+        sum(row["attempts"] for row in rows),
+    )
+
+
 def main() -> None:
     args = parse_args()
     config = load_config(args)
     setup_logging(config.log_level)
+    if args.show_progress:
+        show_progress(config)
+        return
     asyncio.run(async_main(config, force_restart=args.force_restart))
 
 
@@ -1,25 +1,88 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
 
-from pdf_ocr_md.markdown.postprocess import postprocess_markdown
+from pdf_ocr_md.markdown.postprocess import formatter_version, postprocess_markdown
 
+CACHE_FILE_NAME = ".format_cache.json"
+# 每处理这么多个文件保存一次缓存，中断后已完成的部分不必重做
+_CACHE_SAVE_EVERY = 500
 
-def format_md_file(path: Path) -> bool:
+
+@dataclass
+class FormatResult:
+    """单个文件的格式化结果"""
+    path: Path
+    # changed / unchanged / cached / failed
+    status: str
+    # 处理后文件内容的 SHA-256（失败时为 None）
+    sha256: Optional[str] = None
+    size: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class FormatSummary:
+    """一次运行的统计"""
+    total: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    cached: int = 0
+    failed: int = 0
+    # 实际格式化（未命中缓存）的文件字节数
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.total - self.cached
+
+    def add(self, result: FormatResult) -> None:
+        self.total += 1
+        setattr(self, result.status, getattr(self, result.status) + 1)
+        if result.status in ("changed", "unchanged"):
+            self.bytes += result.size
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def format_md_file(path: Path, known_sha256: Optional[str] = None) -> FormatResult:
     """对单个 Markdown 文件执行二次格式化。
 
-    返回是否发生了内容变更。
+    文件内容的哈希等于 known_sha256（缓存中记录的上次格式化结果）时直接跳过。
     """
 
-    original = path.read_text(encoding="utf-8")
-    formatted = postprocess_markdown(original)
+    try:
+        data = path.read_bytes()
+        sha256 = _sha256(data)
+        if sha256 == known_sha256:
+            return FormatResult(path, "cached", sha256, len(data))
+
+        original = data.decode("utf-8")
+        formatted = postprocess_markdown(original)
+
+        if formatted == original or formatted.strip() == original.strip():
+            return FormatResult(path, "unchanged", sha256, len(data))
+
+        path.write_text(formatted, encoding="utf-8")
+        return FormatResult(path, "changed", _sha256(formatted.encode("utf-8")), len(data))
+    except Exception as exc:  # noqa: BLE001
+        return FormatResult(path, "failed", error=str(exc))
 
-    if formatted == original or formatted.strip() == original.strip():
-        return False
 
-    path.write_text(formatted, encoding="utf-8")
-    return True
+def _format_in_worker(args: Tuple[Path, Optional[str]]) -> FormatResult:
+    return format_md_file(*args)
 
 
 def iter_md_files(target: Path):
@@ -39,6 +102,96 @@ def iter_md_files(target: Path):
             yield p
 
 
+class FormatCache:
+    """格式化缓存：记录每个文件上次格式化后的内容哈希与格式化器版本。
+
+    保存在目标目录（目标为单个文件时为其所在目录）下的 .format_cache.json，键为相对路径。
+    文件内容未变且格式化器版本相同的文件不再重复格式化。
+    """
+
+    def __init__(self, path: Path, version: str) -> None:
+        self.path = path
+        self.root = path.parent
+        self.version = version
+        self._entries: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, path: Path, version: str) -> "FormatCache":
+        cache = cls(path, version)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return cache
+        # 格式化器版本变化后旧记录全部失效
+        if data.get("version") == version:
+            cache._entries = dict(data.get("files", {}))
+        return cache
+
+    def _key(self, md_path: Path) -> str:
+        return md_path.relative_to(self.root).as_posix()
+
+    def get(self, md_path: Path) -> Optional[str]:
+        return self._entries.get(self._key(md_path))
+
+    def put(self, md_path: Path, sha256: str) -> None:
+        self._entries[self._key(md_path)] = sha256
+
+    def save(self) -> None:
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(
+            json.dumps({"version": self.version, "files": self._entries}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.path)
+
+
+def run_format(
+    target: Path,
+    workers: int,
+    cache: Optional[FormatCache],
+    use_cache: bool = True,
+    verbose: bool = True,
+) -> FormatSummary:
+    """并行格式化 target 下的全部 Markdown 文件，返回统计信息。
+
+    use_cache 为 False 时不跳过缓存中的文件，但仍把本次结果写入缓存。
+    """
+    summary = FormatSummary()
+    tasks: Iterator[Tuple[Path, Optional[str]]] = (
+        (md_file, cache.get(md_file) if cache is not None and use_cache else None)
+        for md_file in iter_md_files(target)
+    )
+
+    executor: Optional[ProcessPoolExecutor] = None
+    if workers > 0:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    start = time.perf_counter()
+    try:
+        results = (
+            executor.map(_format_in_worker, tasks, chunksize=4)
+            if executor is not None
+            else map(_format_in_worker, tasks)
+        )
+        for result in results:
+            summary.add(result)
+            if result.status == "failed":
+                print(f"[失败] {result.path}：{result.error}")
+                continue
+            if verbose and result.status != "cached":
+                print(f"[{'修改' if result.status == 'changed' else '未变化'}] {result.path}")
+            if cache is not None and result.sha256 is not None:
+                cache.put(result.path, result.sha256)
+                if summary.total % _CACHE_SAVE_EVERY == 0:
+                    cache.save()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if cache is not None:
+            cache.save()
+    summary.seconds = time.perf_counter() - start
+    return summary
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description=(
@@ -56,6 +209,22 @@ def main() -> None:
         action="store_true",
         help="只显示将要处理的文件，不实际写回",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="格式化进程数（默认：CPU 核数），0 表示在当前进程内逐个处理",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="忽略格式化缓存，重新格式化全部文件（仍会更新缓存）",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="不逐个输出文件处理结果，只输出失败文件与汇总",
+    )
 
     args = parser.parse_args()
     target = Path(args.path).expanduser().resolve()
@@ -63,25 +232,31 @@ def main() -> None:
     if not target.exists():
         raise SystemExit(f"路径不存在: {target}")
 
-    changed_count = 0
-    total_count = 0
-
-    for md_file in iter_md_files(target):
-        total_count += 1
-        if args.dry_run:
+    if args.dry_run:
+        total_count = 0
+        for md_file in iter_md_files(target):
+            total_count += 1
             print(f"[DRY-RUN] 将处理: {md_file}")
-            continue
+        print(f"共发现 {total_count} 个 Markdown 文件（预览模式，不做修改）")
+        return
 
-        changed = format_md_file(md_file)
-        status = "修改" if changed else "未变化"
-        print(f"[{status}] {md_file}")
-        if changed:
-            changed_count += 1
+    cache_root = target if target.is_dir() else target.parent
+    version = formatter_version()
+    cache = FormatCache.load(cache_root / CACHE_FILE_NAME, version)
+    workers = max(0, args.workers)
 
-    if args.dry_run:
-        print(f"共发现 {total_count} 个 Markdown 文件（预览模式，不做修改）")
-    else:
-        print(f"共处理 {total_count} 个 Markdown 文件，其中 {changed_count} 个发生变更")
+    summary = run_format(target, workers, cache, use_cache=not args.no_cache, verbose=not args.quiet)
+
+    seconds = max(summary.seconds, 1e-9)
+    print(
+        f"共处理 {summary.total} 个 Markdown 文件，其中 {summary.changed} 个发生变更，"
+        f"{summary.unchanged} 个未变化，{summary.cached} 个命中缓存跳过，{summary.failed} 个失败"
+    )
+    print(
+        f"用时 {summary.seconds:.2f} 秒（{workers} 个进程，格式化器版本 {version}）："
+        f"格式化 {summary.processed} 个文件 / {summary.bytes / 1e6:.1f} MB，"
+        f"{summary.processed / seconds:.1f} 文件/秒，{summary.bytes / 1e6 / seconds:.1f} MB/秒"
+    )
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,11 +1,48 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import toml
 
+
+@dataclass
+class EndpointConfig:
+    """单个 OCR 服务端点配置"""
+    url: str
+    weight: float = 1.0
+    max_concurrency: int = 4
+    # 服务端槽位数（启动探测 /props 得到，未探测或非 llama-server 时为 None）
+    slots: Optional[int] = None
+    # 并发数是否由用户显式指定（auto_concurrency 只会把显式值下调到槽位数，不会调高）
+    concurrency_configured: bool = False
+
+
+def _parse_endpoints(
+    raw: list, default_concurrency: int, default_configured: bool = False
+) -> List[EndpointConfig]:
+    """解析 [ocr].endpoints：元素可以是 URL 字符串，也可以是 {url, weight, max_concurrency} 表"""
+    endpoints: List[EndpointConfig] = []
+    for item in raw:
+        if isinstance(item, str):
+            endpoints.append(
+                EndpointConfig(
+                    url=item, max_concurrency=default_concurrency, concurrency_configured=default_configured
+                )
+            )
+        else:
+            endpoints.append(
+                EndpointConfig(
+                    url=item["url"],
+                    weight=item.get("weight", 1.0),
+                    max_concurrency=item.get("max_concurrency", default_concurrency),
+                    concurrency_configured=default_configured or "max_concurrency" in item,
+                )
+            )
+    return endpoints
+
+
 @dataclass
 class AppConfig:
     input_dir: Path
@@ -13,33 +50,190 @@ class AppConfig:
     server_url: str = "http://0.0.0.0:8082"
     model: str = "chandra-ocr"
     max_concurrency: int = 4
+    # max_concurrency 是否由配置文件或命令行显式指定
+    max_concurrency_configured: bool = False
+    adaptive_concurrency: bool = False
+    min_concurrency: int = 1
+    max_open_pdfs: int = 8
+    scheduler_policy: str = "srpt"
+    scheduler_priority_patterns: List[str] = field(default_factory=list)
     max_retries: int = 3
     request_timeout: float = 60.0
     log_level: str = "INFO"
     ocr_prompt_preset: str = "default"
+    ocr_endpoints: List[EndpointConfig] = field(default_factory=list)
+    health_check_interval: float = 10.0
+    server_ready_timeout: float = 300.0
+    auto_concurrency: bool = True
+    slot_pinning: bool = True
+    # 单端点模式下探测到的服务端槽位数（运行期填充）
+    server_slots: Optional[int] = None
+    max_tokens: int = 0
+    stream_enabled: bool = False
+    stream_first_token_timeout: float = 60.0
+    stream_stall_timeout: float = 30.0
+    repetition_min_repeats: int = 10
+    repetition_min_chars: int = 400
+    incremental: bool = True
+    probe_workers: int = 2
+    batching_enabled: bool = False
+    batching_max_pages: int = 4
+    batching_max_image_tokens: int = 4096
+    batching_pixels_per_token: int = 784
+    tiling_enabled: bool = True
+    tiling_max_tiles: int = 8
+    tiling_overlap: float = 0.05
+    blank_enabled: bool = False
+    blank_max_ink_ratio: float = 0.0005
+    blank_max_std: float = 8.0
+    dedup_documents: bool = True
+    dedup_pages: bool = True
+    dedup_page_cache_size: int = 4096
+    max_open_documents: int = 8
+    render_workers: int = 2
+    render_lookahead: int = 0
+    render_dpi: int = 72
+    render_max_pixels: int = 0
+    render_grayscale: bool = False
+    image_format: str = "png"
+    image_quality: int = 85
+    text_layer_enabled: bool = False
+    text_layer_min_chars: int = 50
+    text_layer_min_quality: float = 0.9
+    report_enabled: bool = True
+    report_json_path: str = ""
+    report_csv_path: str = ""
+    report_files_csv_path: str = ""
+    report_prometheus_path: str = ""
+    report_progress_interval: float = 30.0
+    distributed_enabled: bool = False
+    distributed_worker_id: str = ""
+    distributed_lease_ttl: float = 120.0
+    distributed_heartbeat_interval: float = 20.0
+    distributed_range_pages: int = 200
+    distributed_merger: bool = True
 
     @classmethod
     def load_from_toml(cls, config_path: Path) -> "AppConfig":
         """从 TOML 文件加载配置"""
         data = toml.load(config_path)
         input_dir = Path(data["input"]["dir"])
+        input_ = data.get("input", {})
         output_dir = Path(data["output"]["dir"])
+        output = data.get("output", {})
         ocr = data.get("ocr", {})
         concurrency = data.get("concurrency", {})
         retry = data.get("retry", {})
         logging = data.get("logging", {})
+        render = data.get("render", {})
+        text_layer = data.get("text_layer", {})
+        stream = data.get("stream", {})
+        dedup = data.get("dedup", {})
+        blank = data.get("blank_page", {})
+        tiling = data.get("tiling", {})
+        batching = data.get("batching", {})
+        report = data.get("report", {})
+        scheduler = data.get("scheduler", {})
+        distributed = data.get("distributed", {})
         return cls(
             input_dir=input_dir,
             output_dir=output_dir,
             server_url=ocr.get("server_url", "http://0.0.0.0:8082"),
             model=ocr.get("model", "chandra-ocr"),
             max_concurrency=concurrency.get("max_concurrency", 4),
+            max_concurrency_configured="max_concurrency" in concurrency,
+            adaptive_concurrency=concurrency.get("adaptive", False),
+            min_concurrency=concurrency.get("min_concurrency", 1),
+            max_open_pdfs=concurrency.get("max_open_pdfs", 8),
+            scheduler_policy=scheduler.get("policy", "srpt"),
+            scheduler_priority_patterns=list(scheduler.get("priority_patterns", [])),
             max_retries=retry.get("max_retries", 3),
             request_timeout=retry.get("request_timeout", 60.0),
             log_level=logging.get("level", "INFO"),
             ocr_prompt_preset=ocr.get("prompt_preset", "default"),
+            ocr_endpoints=_parse_endpoints(
+                ocr.get("endpoints", []),
+                concurrency.get("max_concurrency", 4),
+                "max_concurrency" in concurrency,
+            ),
+            health_check_interval=ocr.get("health_check_interval", 10.0),
+            server_ready_timeout=ocr.get("ready_timeout", 300.0),
+            auto_concurrency=ocr.get("auto_concurrency", True),
+            slot_pinning=ocr.get("slot_pinning", True),
+            max_tokens=ocr.get("max_tokens", 0),
+            stream_enabled=stream.get("enabled", False),
+            stream_first_token_timeout=stream.get("first_token_timeout", 60.0),
+            stream_stall_timeout=stream.get("stall_timeout", 30.0),
+            repetition_min_repeats=stream.get("repetition_min_repeats", 10),
+            repetition_min_chars=stream.get("repetition_min_chars", 400),
+            incremental=output.get("incremental", True),
+            probe_workers=input_.get("probe_workers", 2),
+            batching_enabled=batching.get("enabled", False),
+            batching_max_pages=batching.get("max_pages", 4),
+            batching_max_image_tokens=batching.get("max_image_tokens", 4096),
+            batching_pixels_per_token=batching.get("pixels_per_token", 784),
+            tiling_enabled=tiling.get("enabled", True),
+            tiling_max_tiles=tiling.get("max_tiles", 8),
+            tiling_overlap=tiling.get("overlap", 0.05),
+            blank_enabled=blank.get("enabled", False),
+            blank_max_ink_ratio=blank.get("max_ink_ratio", 0.0005),
+            blank_max_std=blank.get("max_std", 8.0),
+            dedup_documents=dedup.get("documents", True),
+            dedup_pages=dedup.get("pages", True),
+            dedup_page_cache_size=dedup.get("page_cache_size", 4096),
+            max_open_documents=render.get("max_open_documents", 8),
+            render_workers=render.get("workers", 2),
+            render_lookahead=render.get("lookahead", 0),
+            render_dpi=render.get("dpi", 72),
+            render_max_pixels=render.get("max_pixels", 0),
+            render_grayscale=render.get("grayscale", False),
+            image_format=render.get("image_format", "png"),
+            image_quality=render.get("image_quality", 85),
+            text_layer_enabled=text_layer.get("enabled", False),
+            text_layer_min_chars=text_layer.get("min_chars", 50),
+            text_layer_min_quality=text_layer.get("min_quality", 0.9),
+            report_enabled=report.get("enabled", True),
+            report_json_path=report.get("json_path", ""),
+            report_csv_path=report.get("csv_path", ""),
+            report_files_csv_path=report.get("files_csv_path", ""),
+            report_prometheus_path=report.get("prometheus_path", ""),
+            report_progress_interval=report.get("progress_interval", 30.0),
+            distributed_enabled=distributed.get("enabled", False),
+            distributed_worker_id=distributed.get("worker_id", ""),
+            distributed_lease_ttl=distributed.get("lease_ttl", 120.0),
+            distributed_heartbeat_interval=distributed.get("heartbeat_interval", 20.0),
+            distributed_range_pages=distributed.get("range_pages", 200),
+            distributed_merger=distributed.get("merger", True),
         )
 
+    def endpoint_configs(self) -> List[EndpointConfig]:
+        """返回实际使用的端点列表：未配置 endpoints 时使用 server_url 单端点"""
+        if self.ocr_endpoints:
+            return list(self.ocr_endpoints)
+        return [
+            EndpointConfig(
+                url=self.server_url,
+                max_concurrency=self.max_concurrency,
+                slots=self.server_slots,
+                concurrency_configured=self.max_concurrency_configured,
+            )
+        ]
+
+    @property
+    def total_concurrency(self) -> int:
+        """全局最大在途 OCR 请求数：多端点时为各端点并发数之和"""
+        if self.ocr_endpoints:
+            return sum(ep.max_concurrency for ep in self.ocr_endpoints)
+        return self.max_concurrency
+
+    @property
+    def pages_in_flight(self) -> int:
+        """同时处于 OCR 阶段的页数上限：批量模式下每个请求最多携带 batching_max_pages 页"""
+        if self.batching_enabled:
+            return self.total_concurrency * max(1, self.batching_max_pages)
+        return self.total_concurrency
+
+
 def build_config_from_args(args) -> AppConfig:
     """从命令行参数构建配置（保留兼容性）"""
     return AppConfig(
@@ -48,8 +242,10 @@ def build_config_from_args(args) -> AppConfig:
         server_url=args.server_url,
         model=args.model,
         max_concurrency=args.max_concurrency,
+        max_concurrency_configured=True,
         max_retries=args.max_retries,
         request_timeout=args.request_timeout,
         log_level=getattr(args, "log_level", "INFO"),
         ocr_prompt_preset=getattr(args, "ocr_prompt_preset", "default"),
+        incremental=not getattr(args, "no_incremental", False),
     )
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from pdf_ocr_md.types_ import PdfTask
+
+if TYPE_CHECKING:
+    from pdf_ocr_md.manifest import InputManifest
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentDeduplicator:
+    """整本 PDF 去重：内容哈希相同的 PDF 只转换一次，其余副本复制第一份的 Markdown。
+
+    已知结果来自两处：增量清单中记录的往次成功转换（输出仍存在），以及本次运行中已完成的转换。
+    同一哈希的 PDF 正在转换时，后到的副本等待其结束：成功则复制，失败则由其中一个副本接手转换。
+    所有方法都在事件循环线程中调用。
+    """
+
+    def __init__(self, output_root: Path, manifest: Optional["InputManifest"] = None) -> None:
+        self._known: Dict[str, Path] = {}
+        self._in_progress: Dict[str, "asyncio.Future[None]"] = {}
+        if manifest is not None:
+            for relative, entry in manifest.entries.items():
+                if entry.get("model") != manifest.model or entry.get("prompt_preset") != manifest.prompt_preset:
+                    continue
+                sha256 = entry.get("sha256")
+                if sha256:
+                    self._known.setdefault(sha256, output_root / Path(relative).with_suffix("") / "file.md")
+
+    async def find_source(self, pdf_task: PdfTask) -> Optional[Path]:
+        """返回内容相同且已转换完成的 Markdown 路径；返回 None 表示由调用方负责转换。
+
+        返回 None 后调用方必须在结束时调用 finish()，否则等待同一内容的副本会一直阻塞。
+        """
+        content_hash = pdf_task.content_hash
+        assert content_hash is not None, "去重前需先计算 PDF 内容哈希"
+        while True:
+            source = self._known.get(content_hash)
+            if source is not None and source != pdf_task.output_md_path and source.exists():
+                return source
+            pending = self._in_progress.get(content_hash)
+            if pending is None:
+                self._in_progress[content_hash] = asyncio.get_running_loop().create_future()
+                return None
+            logger.info("PDF 内容与正在转换的文件相同，等待其完成后复用：%s", pdf_task.pdf_path)
+            await asyncio.shield(pending)
+
+    def finish(self, pdf_task: PdfTask, success: bool) -> None:
+        """登记转换结束；成功时后续相同内容的 PDF 直接复用本次输出"""
+        content_hash = pdf_task.content_hash
+        if content_hash is None:
+            return
+        if success:
+            self._known[content_hash] = pdf_task.output_md_path
+        pending = self._in_progress.pop(content_hash, None)
+        if pending is not None and not pending.done():
+            pending.set_result(None)
+
+
+def copy_markdown(source_md_path: Path, pdf_task: PdfTask) -> None:
+    """复制已有的 Markdown 作为本 PDF 的输出，并把一级标题替换为本 PDF 的文件名（原子写入）"""
+    markdown = source_md_path.read_text(encoding="utf-8")
+    first_line, sep, rest = markdown.partition("\n")
+    if first_line.startswith("# "):
+        markdown = f"# {pdf_task.pdf_path.stem}{sep}{rest}"
+    output_md_path = pdf_task.output_md_path
+    output_md_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_md_path.with_suffix(".tmp")
+    tmp_path.write_text(markdown, encoding="utf-8")
+    tmp_path.replace(output_md_path)
+
+
+class PageDeduplicator:
+    """页面级去重：渲染图片哈希相同的页只 OCR 一次，结果分发给所有重复页。
+
+    最近 cache_size 个不同图片的 OCR 文本保存在 LRU 中；同一图片正在 OCR 时，
+    重复页等待其结果。失败或被截断的结果不缓存，重复页会自行 OCR。
+    所有方法都在事件循环线程中调用。
+    """
+
+    def __init__(self, cache_size: int = 4096) -> None:
+        self.cache_size = max(1, cache_size)
+        self._texts: "OrderedDict[str, str]" = OrderedDict()
+        self._in_flight: Dict[str, "asyncio.Future[None]"] = {}
+
+    async def claim(self, image_hash: str) -> Tuple[Optional[str], bool]:
+        """查询图片哈希，返回 (已有的 OCR 文本, 调用方是否负责 OCR)。
+
+        返回 (None, True) 时调用方必须在 OCR 结束后调用 resolve()。
+        """
+        while True:
+            text = self._texts.get(image_hash)
+            if text is not None:
+                self._texts.move_to_end(image_hash)
+                return text, False
+            pending = self._in_flight.get(image_hash)
+            if pending is None:
+                self._in_flight[image_hash] = asyncio.get_running_loop().create_future()
+                return None, True
+            await asyncio.shield(pending)
+
+    def resolve(self, image_hash: str, text: Optional[str]) -> None:
+        """登记 OCR 结果（text 为 None 表示失败），唤醒等待同一图片的重复页"""
+        if text is not None:
+            self._texts[image_hash] = text
+            self._texts.move_to_end(image_hash)
+            while len(self._texts) > self.cache_size:
+                self._texts.popitem(last=False)
+        pending = self._in_flight.pop(image_hash, None)
+        if pending is not None and not pending.done():
+            pending.set_result(None)
@@ -0,0 +1,691 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import socket
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pdf_ocr_md.markdown.writer import StreamingMarkdownWriter
+from pdf_ocr_md.page_store import PageResultStore, clear_page_store
+from pdf_ocr_md.pdf.loader import compute_pdf_hash
+from pdf_ocr_md.types_ import FileConvertResult, PageOcrResult, PdfTask
+
+if TYPE_CHECKING:
+    from pdf_ocr_md.config import AppConfig
+    from pdf_ocr_md.manifest import InputManifest
+
+logger = logging.getLogger(__name__)
+
+# 每个 PDF 输出目录下的协调目录：租约、完成标记与各页段的页结果存储
+WORK_DIR_NAME = ".work"
+_MERGED_MARKER = "merged.json"
+_MERGE_LEASE = "merge"
+# 输出根目录协调目录下的全局租约：串行化各进程对输入清单的写盘
+_MANIFEST_LEASE = "manifest"
+_LEASE_PATTERN = re.compile(r"^(?P<name>.+)\.lease\.(?P<generation>\d+)$")
+# 页段处理出错（如状态库或页结果存储初始化失败）时本进程最多尝试的次数，之后其页面记为失败
+_MAX_UNIT_ATTEMPTS = 3
+# 合并出错（如磁盘已满）时最多尝试的次数，之后该文档记为失败
+_MAX_MERGE_ATTEMPTS = 3
+
+
+def default_worker_id() -> str:
+    """默认工作进程标识：主机名-进程号（只保留可用于文件名的字符）"""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", f"{socket.gethostname()}-{os.getpid()}")
+
+
+def _write_json_atomic(path: Path, data: dict, worker_id: str) -> None:
+    # 临时文件名带工作进程标识，多个进程同时写同一目标时互不覆盖临时文件
+    tmp_path = path.with_name(f"{path.name}.{worker_id}.tmp")
+    tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: Path) -> Optional[dict]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+@dataclass
+class Lease:
+    """当前进程持有的一份租约（某一代租约文件）"""
+    path: Path
+    generation: int
+    # 心跳发现更高一代的租约（已被其他进程接管）时置为 True
+    lost: bool = False
+
+
+class LeaseFiles:
+    """基于共享目录中原子创建文件的租约。
+
+    租约文件名为 `<名称>.lease.<代数>`，内容记录持有者与过期时间，持有者按心跳间隔续期。
+    - 获取：目录中没有租约时以 O_CREAT | O_EXCL 创建第 1 代；
+    - 接管：最新一代已过期时以同样方式创建下一代，多个进程同时接管时只有一个能创建成功；
+    - 续期：确认没有更新的一代后原子替换自己的租约文件，发现更新的一代即视为租约丢失。
+    过期判断使用各机器的本地时钟，各机器需保持时钟同步（误差应远小于 ttl）。
+    租约内容还记录本进程的会话标识：同一工作进程标识在此前运行中遗留的租约（进程崩溃后重启）
+    可直接接管，本进程仍持有的租约则与其他进程的一样，未过期时不能再次获取。
+    """
+
+    def __init__(self, worker_id: str, ttl: float) -> None:
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.session = uuid.uuid4().hex
+
+    def _generations(self, work_dir: Path, name: str) -> List[Tuple[int, Path]]:
+        try:
+            entries = os.listdir(work_dir)
+        except FileNotFoundError:
+            return []
+        found = []
+        for entry in entries:
+            match = _LEASE_PATTERN.match(entry)
+            if match and match.group("name") == name:
+                found.append((int(match.group("generation")), work_dir / entry))
+        return sorted(found)
+
+    def _expired(self, path: Path, now: float) -> bool:
+        info = _read_json(path)
+        if info is None:
+            # 刚创建尚未写入内容，或已被删除：按文件修改时间判断
+            try:
+                return now - path.stat().st_mtime > self.ttl
+            except FileNotFoundError:
+                return True
+        # 同一工作进程标识在此前运行中遗留的租约（进程重启）可直接接管
+        if info.get("worker") == self.worker_id and info.get("session") != self.session:
+            return True
+        return float(info.get("expires_at", 0.0)) < now
+
+    def _content(self, acquired_at: float) -> dict:
+        now = time.time()
+        return {
+            "worker": self.worker_id,
+            "session": self.session,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "acquired_at": acquired_at,
+            "renewed_at": now,
+            "expires_at": now + self.ttl,
+        }
+
+    def acquire(self, work_dir: Path, name: str) -> Optional[Lease]:
+        """尝试获取租约，被其他进程持有且未过期时返回 None"""
+        generations = self._generations(work_dir, name)
+        generation = 1
+        if generations:
+            latest, latest_path = generations[-1]
+            if not self._expired(latest_path, time.time()):
+                return None
+            generation = latest + 1
+        work_dir.mkdir(parents=True, exist_ok=True)
+        path = work_dir / f"{name}.lease.{generation}"
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._content(time.time()), f)
+            f.flush()
+            os.fsync(f.fileno())
+        if generations:
+            logger.warning("接管已过期的租约：%s（第 %d 代）", work_dir / name, generation)
+        # 清理更早的租约文件
+        for _, old_path in generations:
+            try:
+                old_path.unlink()
+            except FileNotFoundError:
+                pass
+        return Lease(path=path, generation=generation)
+
+    def renew(self, lease: Lease) -> bool:
+        """续期；租约已被接管（出现更新的一代）时返回 False"""
+        name = _LEASE_PATTERN.match(lease.path.name).group("name")
+        generations = self._generations(lease.path.parent, name)
+        if not generations or generations[-1][0] != lease.generation:
+            return False
+        info = _read_json(lease.path) or {}
+        _write_json_atomic(lease.path, self._content(info.get("acquired_at", time.time())), self.worker_id)
+        return True
+
+    def is_held(self, lease: Lease) -> bool:
+        """租约是否仍由本进程持有：最新一代仍是该租约、内容为本进程的会话且未过期（只读，不续期）"""
+        if lease.lost:
+            return False
+        name = _LEASE_PATTERN.match(lease.path.name).group("name")
+        generations = self._generations(lease.path.parent, name)
+        if not generations or generations[-1][0] != lease.generation:
+            return False
+        info = _read_json(lease.path)
+        return (
+            info is not None
+            and info.get("session") == self.session
+            and float(info.get("expires_at", 0.0)) >= time.time()
+        )
+
+    def release(self, lease: Lease) -> None:
+        try:
+            lease.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+@dataclass
+class DocumentPlan:
+    """单个 PDF 在分布式模式下的工作计划：按页段切分的工作单元"""
+    pdf_task: PdfTask
+    units: List["WorkUnit"] = field(default_factory=list)
+    merged: bool = False
+    # 本进程合并出错的次数
+    merge_attempts: int = 0
+    # 同一进程内串行化合并：页段完成后的合并与轮询中的合并可能同时触发
+    merge_lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    @property
+    def work_dir(self) -> Path:
+        return self.pdf_task.output_md_path.parent / WORK_DIR_NAME
+
+    @property
+    def merged_path(self) -> Path:
+        return self.work_dir / _MERGED_MARKER
+
+
+@dataclass
+class WorkUnit:
+    """可被单个工作进程租用的工作单元：一个 PDF 的连续页段 [first_page, last_page]"""
+    plan: DocumentPlan
+    first_page: int
+    last_page: int
+    lease: Optional[Lease] = None
+    # 被其他进程持有或处理出错时，下次尝试获取的时刻（monotonic）
+    retry_at: float = 0.0
+    # 本进程处理该单元出错的次数
+    attempts: int = 0
+
+    @property
+    def pdf_task(self) -> PdfTask:
+        return self.plan.pdf_task
+
+    @property
+    def name(self) -> str:
+        return f"pages-{self.first_page:05d}-{self.last_page:05d}"
+
+    def contains(self, page_number: int) -> bool:
+        return self.first_page <= page_number <= self.last_page
+
+    @property
+    def state_path(self) -> Path:
+        """本页段在状态库与页结果存储中使用的键（占位路径，不会生成该文件）"""
+        return self.plan.work_dir / f"{self.name}.md"
+
+    @property
+    def done_path(self) -> Path:
+        return self.plan.work_dir / f"{self.name}.done"
+
+
+class _UnitPageStores:
+    """合并时按页号把读取分派到各页段的页结果存储（供 StreamingMarkdownWriter 使用）"""
+
+    def __init__(self, stores: List[Tuple[WorkUnit, PageResultStore]]) -> None:
+        self._stores = stores
+
+    def get(self, page_number: int) -> Optional[str]:
+        for unit, store in self._stores:
+            if unit.contains(page_number):
+                return store.get(page_number)
+        return None
+
+
+class DistributedCoordinator:
+    """分布式模式：多个进程（可在不同机器上）通过共享输出目录中的租约文件协调转换。
+
+    - 每个进程独立扫描输入目录，把 PDF 按 range_pages 切成页段工作单元，按扫描顺序尝试租用；
+      租用成功后照常渲染与 OCR，页结果写入该页段自己的存储，完成后写出完成标记并释放租约；
+    - 持有租约期间按心跳间隔续期；其他进程崩溃后其租约过期，由仍在运行的进程接管，
+      接管者从该页段存储中已有的结果继续；发现自己的租约被接管时立即放弃该单元；
+    - merger 为 True 的进程负责合并：某个 PDF 的全部页段完成后，获取合并租约，
+      把各页段结果按页序写成 file.md，并写入 merged.json 标记，之后其他进程扫描到该 PDF 直接跳过。
+    所有协程方法都在事件循环线程中调用，文件操作放到线程池执行。
+    """
+
+    def __init__(
+        self,
+        config: "AppConfig",
+        next_task: Callable[[], Awaitable[Optional[PdfTask]]],
+        manifest: Optional["InputManifest"] = None,
+    ) -> None:
+        if config.distributed_heartbeat_interval <= 0:
+            raise ValueError("distributed.heartbeat_interval 必须大于 0")
+        if config.distributed_lease_ttl < 2 * config.distributed_heartbeat_interval:
+            raise ValueError("distributed.lease_ttl 至少应为 heartbeat_interval 的 2 倍，否则租约可能在续期前过期")
+        self.worker_id = config.distributed_worker_id or default_worker_id()
+        self.model = config.model
+        self.prompt_preset = config.ocr_prompt_preset
+        self.range_pages = max(0, config.distributed_range_pages)
+        self.heartbeat_interval = config.distributed_heartbeat_interval
+        self.merger = config.distributed_merger
+        self.leases = LeaseFiles(self.worker_id, config.distributed_lease_ttl)
+        self.manifest = manifest
+        if manifest is not None:
+            manifest.auto_save = False
+        self._root_work_dir = config.output_dir / WORK_DIR_NAME
+        self._next_task = next_task
+        self._scan_done = False
+        self._backlog: List[WorkUnit] = []
+        self._unmerged: List[DocumentPlan] = []
+        self._active: Dict[Path, Tuple[WorkUnit, asyncio.Task]] = {}
+        # 正在进行的合并持有的合并租约（在线程池中合并，心跳负责续期）
+        self._merge_leases: Dict[Path, Lease] = {}
+        self._lock = asyncio.Lock()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.units_done = 0
+        self.documents_merged = 0
+        self.documents_skipped = 0
+        # 无法合并的文档（合并多次出错），由编排器计入失败结果
+        self.failed_results: List[FileConvertResult] = []
+
+    # ---- 标记文件 ----
+
+    def _identity(self, plan: DocumentPlan) -> dict:
+        return {"pdf_hash": plan.pdf_task.content_hash, "model": self.model, "prompt_preset": self.prompt_preset}
+
+    def _valid_marker(self, path: Path, plan: DocumentPlan) -> Optional[dict]:
+        """读取完成/合并标记；PDF 内容、模型或提示词变化后的旧标记视为无效"""
+        marker = _read_json(path)
+        if marker is None:
+            return None
+        identity = self._identity(plan)
+        if any(marker.get(key) != value for key, value in identity.items()):
+            return None
+        return marker
+
+    # ---- 计划与租用 ----
+
+    def _plan_sync(self, pdf_task: PdfTask) -> Optional[DocumentPlan]:
+        metadata = pdf_task.metadata
+        if metadata is not None and metadata.error is not None:
+            logger.error("跳过无法处理的 PDF：%s：%s", pdf_task.pdf_path, metadata.error)
+            return None
+        if pdf_task.content_hash is None:
+            pdf_task.content_hash = compute_pdf_hash(pdf_task.pdf_path)
+        plan = DocumentPlan(pdf_task=pdf_task)
+        if self._merged(plan):
+            self.documents_skipped += 1
+            return None
+        num_pages = metadata.page_count if metadata is not None else 0
+        pdf_task.num_pages = num_pages
+        size = self.range_pages or max(1, num_pages)
+        plan.units = [
+            WorkUnit(plan=plan, first_page=first, last_page=min(first + size - 1, num_pages))
+            for first in range(1, num_pages + 1, size)
+        ]
+        return plan
+
+    def _merged(self, plan: DocumentPlan) -> bool:
+        return plan.pdf_task.output_md_path.exists() and self._valid_marker(plan.merged_path, plan) is not None
+
+    def _claim_sync(self, unit: WorkUnit) -> str:
+        """尝试租用工作单元，返回 claimed / done / busy"""
+        # 其他进程可能已合并该文档并清理了完成标记
+        if self._merged(unit.plan) or self._valid_marker(unit.done_path, unit.plan) is not None:
+            return "done"
+        lease = self.leases.acquire(unit.plan.work_dir, unit.name)
+        if lease is None:
+            return "busy"
+        # 获得租约后再确认一次：原持有者可能刚写完完成标记并释放租约
+        if self._valid_marker(unit.done_path, unit.plan) is not None:
+            self.leases.release(lease)
+            return "done"
+        unit.lease = lease
+        return "claimed"
+
+    async def next_unit(self) -> Optional[WorkUnit]:
+        """返回下一个已租用的工作单元；没有可做的单元时返回 None。
+
+        其余单元都由其他进程持有时按心跳间隔轮询，等待其完成或租约过期后接管。
+        合并进程在本进程计划中的文档全部合并（或记为失败）之前不返回 None：
+        其他进程持有的页段若因持有者崩溃而没有完成，租约过期后由本进程重新租用。
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                for unit in list(self._backlog):
+                    if unit.retry_at > now:
+                        continue
+                    status = await asyncio.to_thread(self._claim_sync, unit)
+                    if status == "busy":
+                        unit.retry_at = time.monotonic() + self.heartbeat_interval
+                        continue
+                    self._backlog.remove(unit)
+                    if status == "claimed":
+                        logger.info(
+                            "租用工作单元：%s 第 %d~%d 页", unit.pdf_task.pdf_path, unit.first_page, unit.last_page
+                        )
+                        return unit
+                if not self._scan_done:
+                    pdf_task = await self._next_task()
+                    if pdf_task is None:
+                        self._scan_done = True
+                        continue
+                    plan = await asyncio.to_thread(self._plan_sync, pdf_task)
+                    if plan is not None:
+                        self._backlog.extend(plan.units)
+                        if self.merger:
+                            self._unmerged.append(plan)
+                    continue
+                if not self._backlog:
+                    if not self.merger or not self._unmerged:
+                        return None
+                    await self.merge_ready()
+                    if not self._unmerged:
+                        continue
+                    self._backlog.extend(await self._unfinished_units())
+                    if not self._backlog:
+                        # 页段均已完成，等待其他合并进程完成合并或下一次重试合并
+                        await asyncio.sleep(self.heartbeat_interval)
+                    continue
+                # 剩余单元都由其他进程持有：顺便合并已全部完成的文档，然后等待
+                await self.merge_ready()
+                await asyncio.sleep(
+                    max(0.0, min(unit.retry_at for unit in self._backlog) - time.monotonic())
+                )
+
+    async def _unfinished_units(self) -> List[WorkUnit]:
+        """未合并文档中尚无完成标记、且不在本进程处理中的页段（由其他进程持有或已无人持有）"""
+        plans = list(self._unmerged)
+        active = {id(unit) for unit, _ in self._active.values()}
+
+        def collect() -> List[WorkUnit]:
+            units = []
+            for plan in plans:
+                if self._merged(plan):
+                    continue
+                units.extend(
+                    unit
+                    for unit in plan.units
+                    if id(unit) not in active and self._valid_marker(unit.done_path, plan) is None
+                )
+            return units
+
+        return await asyncio.to_thread(collect)
+
+    # ---- 执行与心跳 ----
+
+    def start(self) -> None:
+        logger.info(
+            "分布式模式：工作进程 %s，页段 %s 页，租约 %.0f 秒，心跳 %.0f 秒，%s合并",
+            self.worker_id,
+            self.range_pages or "整本",
+            self.leases.ttl,
+            self.heartbeat_interval,
+            "负责" if self.merger else "不负责",
+        )
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            for unit, task in list(self._active.values()):
+                assert unit.lease is not None
+                try:
+                    renewed = await asyncio.to_thread(self.leases.renew, unit.lease)
+                except OSError as exc:
+                    logger.warning("续期租约失败，稍后重试：%s：%s", unit.lease.path, exc)
+                    continue
+                # 续期期间单元可能刚完成并释放了租约，此时租约文件已不存在
+                active = self._active.get(unit.lease.path)
+                if active is None or active[0] is not unit:
+                    continue
+                if not renewed:
+                    unit.lease.lost = True
+                    logger.error(
+                        "租约已被其他工作进程接管，放弃工作单元：%s 第 %d~%d 页",
+                        unit.pdf_task.pdf_path,
+                        unit.first_page,
+                        unit.last_page,
+                    )
+                    task.cancel()
+            for lease in list(self._merge_leases.values()):
+                try:
+                    renewed = await asyncio.to_thread(self.leases.renew, lease)
+                except OSError as exc:
+                    logger.warning("续期合并租约失败，稍后重试：%s：%s", lease.path, exc)
+                    continue
+                # 续期期间合并可能刚结束并释放了租约
+                if lease.path in self._merge_leases and not renewed:
+                    lease.lost = True
+                    logger.error("合并租约已被其他进程接管：%s", lease.path)
+
+    async def run_unit(
+        self, unit: WorkUnit, process: Callable[[], Awaitable[FileConvertResult]]
+    ) -> Optional[FileConvertResult]:
+        """在持有租约的情况下处理工作单元。
+
+        租约丢失时返回 None；处理出错时放回待办列表稍后重试（同样返回 None），
+        连续出错 _MAX_UNIT_ATTEMPTS 次后写入全部页面失败的完成标记并返回失败结果，
+        文档仍可合并（失败页写入占位），不会让等待合并的进程无限等待。
+        """
+        assert unit.lease is not None
+        task = asyncio.create_task(process())
+        self._active[unit.lease.path] = (unit, task)
+        try:
+            result = await task
+            if not unit.lease.lost:
+                if result.error is None:
+                    await asyncio.to_thread(self._write_done, unit, result)
+                    self.units_done += 1
+                else:
+                    unit.attempts += 1
+                    if unit.attempts >= _MAX_UNIT_ATTEMPTS:
+                        logger.error(
+                            "页段连续 %d 次处理失败，其页面记为失败：%s 第 %d~%d 页：%s",
+                            unit.attempts,
+                            unit.pdf_task.pdf_path,
+                            unit.first_page,
+                            unit.last_page,
+                            result.error,
+                        )
+                        await asyncio.to_thread(self._write_done, unit, result, result.error)
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if unit.lease.lost and (current is None or not current.cancelling()):
+                return None
+            raise
+        finally:
+            self._active.pop(unit.lease.path, None)
+            if not unit.lease.lost:
+                self.leases.release(unit.lease)
+        if unit.lease.lost:
+            return None
+        if result.error is not None and unit.attempts < _MAX_UNIT_ATTEMPTS:
+            logger.warning(
+                "页段处理失败（第 %d 次），稍后重试：%s 第 %d~%d 页：%s",
+                unit.attempts,
+                unit.pdf_task.pdf_path,
+                unit.first_page,
+                unit.last_page,
+                result.error,
+            )
+            unit.retry_at = time.monotonic() + self.heartbeat_interval
+            self._backlog.append(unit)
+            return None
+        if self.merger:
+            await self._merge(unit.plan)
+        return result
+
+    def _write_done(self, unit: WorkUnit, result: FileConvertResult, error: Optional[str] = None) -> None:
+        """写出完成标记；error 不为 None 时该页段全部页面记为失败"""
+        if error is not None:
+            failed = {str(page): error for page in range(unit.first_page, unit.last_page + 1)}
+        else:
+            failed = {
+                str(r.page_number): r.error or "Failed"
+                for r in result.page_results
+                if not r.success and unit.contains(r.page_number)
+            }
+        marker = {
+            **self._identity(unit.plan),
+            "worker": self.worker_id,
+            "finished_at": time.time(),
+            "failed": failed,
+        }
+        _write_json_atomic(unit.done_path, marker, self.worker_id)
+
+    # ---- 合并 ----
+
+    def _merge_sync(self, plan: DocumentPlan) -> Optional[bool]:
+        """合并已全部完成的文档；返回 None 表示尚不能合并，否则返回是否全部页面成功"""
+        if self._merged(plan):
+            plan.merged = True
+            return None
+        markers = [self._valid_marker(unit.done_path, plan) for unit in plan.units]
+        if any(marker is None for marker in markers):
+            return None
+        lease = self.leases.acquire(plan.work_dir, _MERGE_LEASE)
+        if lease is None:
+            return None
+        self._merge_leases[lease.path] = lease
+        try:
+            if self._merged(plan):
+                plan.merged = True
+                return None
+            pdf_task = plan.pdf_task
+            errors: Dict[int, str] = {}
+            for marker in markers:
+                errors.update({int(page): error for page, error in marker["failed"].items()})
+            stores = []
+            for unit in plan.units:
+                store = PageResultStore(unit.state_path, pdf_task.content_hash, self.model, self.prompt_preset)
+                store.load_index()
+                stores.append((unit, store))
+            num_pages = pdf_task.num_pages or 0
+            writer = StreamingMarkdownWriter(pdf_task, num_pages, _UnitPageStores(stores))
+            writer.open()
+            try:
+                for page_number in range(1, num_pages + 1):
+                    if page_number in errors:
+                        writer.add(
+                            PageOcrResult(page_number=page_number, text=None, success=False, error=errors[page_number])
+                        )
+                    else:
+                        writer.add_stored(page_number)
+                # 替换 file.md 之前确认合并租约仍由本进程持有：合并期间若曾停顿超过租约有效期，
+                # 其他合并进程可能已接管并正在写同一文档
+                if not self.leases.is_held(lease):
+                    logger.error("合并租约已被其他进程接管，放弃本次合并：%s", pdf_task.output_md_path)
+                    writer.close()
+                    return None
+                writer.finalize()
+            except BaseException:
+                writer.close()
+                raise
+            _write_json_atomic(
+                plan.merged_path,
+                {
+                    **self._identity(plan),
+                    "worker": self.worker_id,
+                    "merged_at": time.time(),
+                    "failed_pages": sorted(errors),
+                },
+                self.worker_id,
+            )
+            # 合并标记写入后即可清理各页段的中间文件，只保留 merged.json
+            for unit in plan.units:
+                clear_page_store(unit.state_path)
+                unit.done_path.unlink(missing_ok=True)
+            plan.merged = True
+            logger.info("合并完成：%s（%d 个页段）", pdf_task.output_md_path, len(plan.units))
+            return not errors
+        finally:
+            self._merge_leases.pop(lease.path, None)
+            if not lease.lost:
+                self.leases.release(lease)
+
+    async def _merge(self, plan: DocumentPlan) -> None:
+        async with plan.merge_lock:
+            if plan.merged:
+                return
+            try:
+                complete = await asyncio.to_thread(self._merge_sync, plan)
+            except Exception as exc:  # noqa: BLE001
+                plan.merge_attempts += 1
+                logger.exception(
+                    "合并 Markdown 失败（第 %d 次）：%s", plan.merge_attempts, plan.pdf_task.output_md_path
+                )
+                if plan.merge_attempts >= _MAX_MERGE_ATTEMPTS:
+                    self._fail_plan(plan, f"合并 Markdown 失败: {exc}")
+                return
+        if plan.merged:
+            self._unmerged.remove(plan)
+        if complete is None:
+            return
+        self.documents_merged += 1
+        if complete and self.manifest is not None:
+            self.manifest.record(plan.pdf_task.pdf_path, plan.pdf_task.content_hash)
+            if self.manifest.save_due:
+                # 其他进程正在写盘时跳过，记录保留到下次保存
+                await asyncio.to_thread(self._save_manifest_sync)
+
+    def _save_manifest_sync(self) -> bool:
+        """持有清单租约时保存输入清单；租约被其他进程持有时返回 False"""
+        assert self.manifest is not None
+        lease = self.leases.acquire(self._root_work_dir, _MANIFEST_LEASE)
+        if lease is None:
+            return False
+        try:
+            self.manifest.save()
+        finally:
+            self.leases.release(lease)
+        return True
+
+    async def save_manifest(self) -> None:
+        """保存输入清单（与其他进程串行）；持有者崩溃时最多等待其租约过期"""
+        if self.manifest is None:
+            return
+        deadline = time.monotonic() + 2 * self.leases.ttl
+        while not await asyncio.to_thread(self._save_manifest_sync):
+            if time.monotonic() >= deadline:
+                logger.warning("等待输入清单租约超时，本次未保存输入清单：%s", self.manifest.path)
+                return
+            await asyncio.sleep(min(self.heartbeat_interval, 0.5))
+
+    async def merge_ready(self) -> None:
+        """合并所有页段均已完成的文档（非合并进程不做任何事）"""
+        for plan in list(self._unmerged):
+            await self._merge(plan)
+
+    def _fail_plan(self, plan: DocumentPlan, error: str) -> None:
+        """放弃合并该文档，记为失败结果"""
+        if plan in self._unmerged:
+            self._unmerged.remove(plan)
+        logger.error("文档未能合并，记为失败：%s：%s", plan.pdf_task.output_md_path, error)
+        self.failed_results.append(FileConvertResult(pdf_task=plan.pdf_task, success=False, error=error))
+
+    async def drain(self) -> None:
+        """工作协程全部退出后合并剩余文档。
+
+        合并进程的 next_unit 已等到全部文档合并或记为失败，这里只做最后一次合并，
+        仍未合并的文档（如被取消）记为失败，不再等待。
+        """
+        await self.merge_ready()
+        for plan in list(self._unmerged):
+            self._fail_plan(plan, "文档未合并")
+
+    def close(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        # 异常退出时释放仍持有的租约，其他进程无需等待过期即可接管
+        for unit, _ in list(self._active.values()):
+            if unit.lease is not None and not unit.lease.lost:
+                self.leases.release(unit.lease)
+        self._active.clear()
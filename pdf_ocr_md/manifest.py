@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+from typing import Dict
+
+from pdf_ocr_md.pdf.loader import compute_pdf_hash
+
+logger = logging.getLogger(__name__)
+
+_MANIFEST_FILE_NAME = ".convert_manifest.json"
+_SAVE_EVERY = 10
+
+
+class InputManifest:
+    """已完成 PDF 的输入清单，用于增量模式下跳过未变化的文件。
+
+    清单保存在输出根目录下的 `.convert_manifest.json`，以相对路径为键，
+    记录 (大小, mtime, 内容哈希, 模型, 提示词模板)。
+    写盘前重新读取磁盘上的清单并只叠加本进程改动过的记录，多个进程共享输出目录时
+    （分布式模式）不会用各自过时的副本互相覆盖；并发写盘由调用方加锁（见 DistributedCoordinator）。
+    """
+
+    def __init__(self, input_root: Path, output_root: Path, model: str, prompt_preset: str) -> None:
+        self.input_root = input_root
+        self.path = output_root / _MANIFEST_FILE_NAME
+        self.model = model
+        self.prompt_preset = prompt_preset
+        self.entries: Dict[str, dict] = {}
+        self.skipped_count = 0
+        # 为 False 时 record 不自动写盘，由调用方在 save_due 时加锁保存
+        self.auto_save = True
+        # 本进程新增或修改、尚未写盘的记录
+        self._changed: Dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, input_root: Path, output_root: Path, model: str, prompt_preset: str) -> "InputManifest":
+        """从输出根目录加载清单，不存在或损坏时返回空清单"""
+        manifest = cls(input_root, output_root, model, prompt_preset)
+        if manifest.path.exists():
+            try:
+                manifest.entries = manifest._read_entries()
+                logger.info("加载输入清单：%s，共 %d 条记录", manifest.path, len(manifest.entries))
+            except Exception as exc:
+                logger.warning("读取输入清单失败，将全部重新处理：%s", exc)
+        return manifest
+
+    def _read_entries(self) -> Dict[str, dict]:
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        return dict(data.get("files", {}))
+
+    @property
+    def save_due(self) -> bool:
+        """未写盘的记录是否已累计到自动保存的数量"""
+        return len(self._changed) >= _SAVE_EVERY
+
+    def _relative_key(self, pdf_path: Path) -> str:
+        return pdf_path.relative_to(self.input_root).as_posix()
+
+    def is_unchanged(self, pdf_path: Path, output_md_path: Path) -> bool:
+        """判断 PDF 自上次成功转换后是否未发生变化（且输出仍存在）
+
+        大小与 mtime 均一致时直接判定未变化；仅 mtime 变化时再比对内容哈希，
+        避免 touch/复制导致的无谓重跑。
+        """
+        entry = self.entries.get(self._relative_key(pdf_path))
+        if entry is None:
+            return False
+        if entry.get("model") != self.model or entry.get("prompt_preset") != self.prompt_preset:
+            return False
+        if not output_md_path.exists():
+            return False
+
+        stat = pdf_path.stat()
+        if stat.st_size != entry.get("size"):
+            return False
+        if stat.st_mtime_ns == entry.get("mtime_ns"):
+            return True
+
+        if compute_pdf_hash(pdf_path) != entry.get("sha256"):
+            return False
+        entry["mtime_ns"] = stat.st_mtime_ns
+        self._changed[self._relative_key(pdf_path)] = entry
+        return True
+
+    def record(self, pdf_path: Path, content_hash: str) -> None:
+        """记录一个已成功转换的 PDF，累计一定数量后自动写盘"""
+        stat = pdf_path.stat()
+        key = self._relative_key(pdf_path)
+        self.entries[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": content_hash,
+            "model": self.model,
+            "prompt_preset": self.prompt_preset,
+        }
+        self._changed[key] = self.entries[key]
+        if self.auto_save and self.save_due:
+            self.save()
+
+    def save(self) -> None:
+        """保存清单（原子写入）：以磁盘上的最新清单为基础叠加本进程的改动"""
+        if not self._changed:
+            return
+        try:
+            if self.path.exists():
+                try:
+                    entries = self._read_entries()
+                except ValueError as exc:
+                    logger.warning("磁盘上的输入清单已损坏，将以本进程的记录覆盖：%s", exc)
+                    entries = dict(self.entries)
+            else:
+                entries = {}
+            entries.update(self._changed)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps({"files": entries}, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(self.path)
+            self.entries = entries
+            self._changed = {}
+        except Exception as exc:
+            logger.warning("保存输入清单失败：%s", exc)
@@ -1,9 +1,26 @@
 from __future__ import annotations
 
 import re
+from html.parser import HTMLParser
+from importlib.metadata import PackageNotFoundError, version
+from typing import List, Optional
 
+from bs4.builder import HTMLTreeBuilder
 from markdownify import markdownify as html2markdown
 
+# 后处理规则的版本号：修改 postprocess_markdown 的输出时递增，
+# format_existing_md.py 的格式化缓存据此（连同 markdownify 版本）判定旧结果失效
+POSTPROCESS_VERSION = 1
+
+
+def formatter_version() -> str:
+    """后处理规则与 markdownify 的组合版本，任一变化都会产生不同的输出"""
+    try:
+        markdownify_version = version("markdownify")
+    except PackageNotFoundError:
+        markdownify_version = "unknown"
+    return f"{POSTPROCESS_VERSION}+markdownify-{markdownify_version}"
+
 
 def postprocess_markdown(md: str) -> str:
     """对 Markdown 文本做简单清洗与格式优化。"""
@@ -15,3 +32,107 @@ def postprocess_markdown(md: str) -> str:
     md = re.sub(r"\n{3,}", "\n\n", md)
     # 去掉首尾多余空白，并保证文件末尾有换行
     return md.strip() + "\n"
+
+
+# ---- 分片后处理 ----
+#
+# StreamingMarkdownWriter 按页写出时逐片段调用 postprocess_fragment，全部片段拼接后再由
+# finish_markdown 收尾，结果与对整篇文档调用 postprocess_markdown 逐字节一致。前提：
+# - 每个片段（标题块、单页块、失败汇总块）都以 "#" 开头，拼接处不会落在空白串中间；
+# - 含 HTML 的片段自身标签闭合（_is_self_contained），不会把后续片段包进某个元素。
+# 不含 "<" 与 "&" 的片段在 markdownify 中只是一个文本节点，直接按其文本规则处理：
+# 含换行的空白串压成一个换行、其余空白串压成一个空格、转义 * 与 _（与 markdownify 1.x 一致）。
+
+_HTML_HINT = re.compile(r"[<&]")
+_WHITESPACE = re.compile(r"[\t ]+")
+# 下一个片段总以 "#" 开头：在片段末尾补上它，让 markdownify 看到与整篇转换时相同的后继文本节点
+_NEXT_FRAGMENT_SENTINEL = "#"
+# 转换结果依赖父元素或前面兄弟元素的标签，出现在片段顶层时不能单独转换
+_CONTEXT_DEPENDENT_TAGS = frozenset({"li", "tr", "td", "th", "thead", "tbody", "tfoot", "dt", "dd"})
+
+
+class _BalanceChecker(HTMLParser):
+    """按 BeautifulSoup（html.parser）的规则跟踪未闭合的元素"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.stack: List[str] = []
+        self.self_contained = True
+
+    def handle_starttag(self, tag, attrs) -> None:
+        if not self.stack and tag in _CONTEXT_DEPENDENT_TAGS:
+            self.self_contained = False
+        if tag not in HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS:
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs) -> None:
+        if not self.stack and tag in _CONTEXT_DEPENDENT_TAGS:
+            self.self_contained = False
+
+    def handle_endtag(self, tag) -> None:
+        # 与 BeautifulSoup 相同：关闭最近的同名元素（及其内部未闭合的元素），没有同名元素时忽略
+        if tag in self.stack:
+            while self.stack.pop() != tag:
+                pass
+
+
+def _is_self_contained(fragment: str) -> bool:
+    checker = _BalanceChecker()
+    checker.feed(fragment)
+    # rawdata 中剩余未解析的内容说明片段以不完整的标签或注释结尾
+    return checker.self_contained and not checker.stack and not checker.rawdata
+
+
+def _collapse_whitespace(text: str) -> str:
+    """等价于 markdownify 对文本节点的两步正则替换，按行处理避免在每个空格处回溯"""
+    # \r 与 \n 同属“含换行的空白串”，统一按 \n 处理
+    if "\r" in text:
+        text = text.replace("\r", "\n")
+    lines = text.split("\n")
+    last = len(lines) - 1
+    kept: List[str] = []
+    for index, line in enumerate(lines):
+        if "\t" in line or "  " in line:
+            line = _WHITESPACE.sub(" ", line)
+        # 与换行相邻的空白并入换行
+        if index > 0:
+            line = line.lstrip(" ")
+        if index < last:
+            line = line.rstrip(" ")
+        if line:
+            kept.append(line)
+    collapsed = "\n".join(kept)
+    if last == 0:
+        return collapsed
+    if not kept:
+        return "\n"
+    if not lines[0].strip(" \t"):
+        collapsed = "\n" + collapsed
+    if not lines[-1].strip(" \t"):
+        collapsed += "\n"
+    return collapsed
+
+
+def postprocess_fragment(fragment: str, last: bool = False) -> Optional[str]:
+    """对文档中的单个片段做与 postprocess_markdown 等价的转换。
+
+    last 表示文档中的最后一个片段。保留片段首尾的换行，由 finish_markdown 统一处理；
+    含未闭合标签、无法单独转换时返回 None，调用方需退回整篇转换。
+    """
+    if not _HTML_HINT.search(fragment):
+        return _collapse_whitespace(fragment).replace("*", r"\*").replace("_", r"\_")
+    if not _is_self_contained(fragment):
+        return None
+    if last:
+        return html2markdown(fragment, heading_style="ATX", strip_document=None)
+    converted = html2markdown(fragment + _NEXT_FRAGMENT_SENTINEL, heading_style="ATX", strip_document=None)
+    if not converted.endswith(_NEXT_FRAGMENT_SENTINEL):
+        return None
+    return converted[: -len(_NEXT_FRAGMENT_SENTINEL)]
+
+
+def finish_markdown(md: str) -> str:
+    """对拼接后的片段做文档级收尾（与 postprocess_markdown 的整篇处理相同）"""
+    md = md.strip("\n")
+    md = re.sub(r"\n{3,}", "\n\n", md)
+    return md.strip() + "\n"
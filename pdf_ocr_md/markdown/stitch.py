@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import difflib
+import re
+from typing import List
+
+# 在上一块末尾与下一块开头各取多少行寻找重叠区
+_OVERLAP_WINDOW_LINES = 30
+# 判定为重叠区所需的最少匹配字符数，避免短行（如表格分隔行）误匹配
+_MIN_OVERLAP_CHARS = 16
+# 重叠区外允许丢弃的块边界残行数（上一块末尾、下一块开头各自计算，不含空行）
+_MAX_EDGE_LINES = 2
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(line: str) -> str:
+    return _WHITESPACE.sub(" ", line).strip()
+
+
+def _merge_pair(upper: List[str], lower: List[str]) -> List[str]:
+    """合并上下相邻两块的文本行，去掉重叠区中重复识别的行"""
+    upper_start = max(0, len(upper) - _OVERLAP_WINDOW_LINES)
+    # 只在非空行上匹配，空行的多少在两块之间常有出入
+    upper_idx = [i for i in range(upper_start, len(upper)) if _normalize(upper[i])]
+    lower_idx = [i for i in range(min(len(lower), _OVERLAP_WINDOW_LINES)) if _normalize(lower[i])]
+    upper_keys = [_normalize(upper[i]) for i in upper_idx]
+    lower_keys = [_normalize(lower[i]) for i in lower_idx]
+
+    matcher = difflib.SequenceMatcher(None, upper_keys, lower_keys, autojunk=False)
+    match = matcher.find_longest_match(0, len(upper_keys), 0, len(lower_keys))
+    matched_chars = sum(len(key) for key in upper_keys[match.a : match.a + match.size])
+    at_edges = len(upper_keys) - (match.a + match.size) <= _MAX_EDGE_LINES and match.b <= _MAX_EDGE_LINES
+    if match.size == 0 or matched_chars < _MIN_OVERLAP_CHARS or not at_edges:
+        return upper + [""] + lower
+
+    # 重叠区保留上一块的识别结果：上一块在重叠区之后的行是被块边界截断的残行，下一块有完整版本；
+    # 下一块在重叠区之前的行同理
+    upper_end = upper_idx[match.a + match.size - 1] + 1
+    lower_begin = lower_idx[match.b + match.size - 1] + 1
+    return upper[:upper_end] + lower[lower_begin:]
+
+
+def stitch_tiles(texts: List[str]) -> str:
+    """按自上而下的阅读顺序拼接各块的 OCR 文本，去除相邻块重叠区中重复的行"""
+    lines: List[str] = []
+    for text in texts:
+        tile_lines = text.strip("\n").splitlines()
+        if not tile_lines:
+            continue
+        lines = _merge_pair(lines, tile_lines) if lines else tile_lines
+    return "\n".join(lines)
@@ -1,42 +1,218 @@
 from __future__ import annotations
 
-from typing import List
+import logging
+import threading
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Dict, List, Optional
 
+from pdf_ocr_md.markdown.postprocess import finish_markdown, postprocess_fragment, postprocess_markdown
 from pdf_ocr_md.types_ import PageOcrResult, PdfTask
 
+if TYPE_CHECKING:
+    from pdf_ocr_md.page_store import PageResultStore
 
-def build_markdown(pdf_task: PdfTask, page_results: List[PageOcrResult]) -> str:
-    """根据单个 PDF 的页级 OCR 结果生成完整 Markdown 文本。"""
+logger = logging.getLogger(__name__)
+
+_PARTIAL_SUFFIX = ".partial.md"
+_FORMATTED_SUFFIX = ".formatted.tmp"
+
+
+def _header_lines(pdf_task: PdfTask) -> List[str]:
+    return [f"# {pdf_task.pdf_path.stem}", ""]
 
-    lines: List[str] = []
-    title = pdf_task.pdf_path.stem
-    lines.append(f"# {title}")
+
+def _page_lines(result: PageOcrResult) -> List[str]:
+    lines = [f"## Page {result.page_number}", ""]
+    if result.success and result.text:
+        lines.append(result.text.rstrip())
+    else:
+        lines.append(f"> [OCR FAILED] Page {result.page_number}")
+        if result.error:
+            lines.append(f"> 错误信息: {result.error}")
+    lines.append("")
+    return lines
+
+
+def _failed_summary_lines(failed_pages: List[PageOcrResult]) -> List[str]:
+    if not failed_pages:
+        return []
+    lines = ["## OCR 失败页列表", ""]
+    for r in failed_pages:
+        if r.error:
+            lines.append(f"- Page {r.page_number}: {r.error}")
+        else:
+            lines.append(f"- Page {r.page_number}")
     lines.append("")
+    return lines
 
+
+def _is_failed(result: PageOcrResult) -> bool:
+    return not (result.success and result.text)
+
+
+def build_markdown(pdf_task: PdfTask, page_results: List[PageOcrResult]) -> str:
+    """根据单个 PDF 的页级 OCR 结果生成完整 Markdown 文本。"""
+
+    lines: List[str] = _header_lines(pdf_task)
     failed_pages: List[PageOcrResult] = []
 
     for result in sorted(page_results, key=lambda r: r.page_number):
-        lines.append(f"## Page {result.page_number}")
-        lines.append("")
+        if _is_failed(result):
+            failed_pages.append(result)
+        lines.extend(_page_lines(result))
+
+    lines.extend(_failed_summary_lines(failed_pages))
+    return "\n".join(lines)
+
 
-        if result.success and result.text:
-            lines.append(result.text.rstrip())
+def partial_markdown_path(output_md_path: Path) -> Path:
+    """返回转换进行中的 Markdown 文件路径（file.partial.md）"""
+    return output_md_path.with_suffix(_PARTIAL_SUFFIX)
+
+
+def formatted_markdown_path(output_md_path: Path) -> Path:
+    """返回逐页后处理结果的临时文件路径（file.formatted.tmp）"""
+    return output_md_path.with_suffix(_FORMATTED_SUFFIX)
+
+
+class StreamingMarkdownWriter:
+    """按页序增量写出 Markdown。
+
+    页面结果可乱序到达；每当从第 1 页起的连续前缀推进时，就把新完成的页追加写入
+    file.partial.md 并刷盘，下游可以提前阅读已完成的章节。
+    乱序到达的成功页不在内存中保留文本（文本已在页结果存储中），轮到它时再按索引读取，
+    因此单本书的内存占用只与在途页数有关。
+    每写出一块（标题、单页、失败页汇总）就同时对它做后处理，追加到 file.formatted.tmp：
+    不含 HTML 的页不经过 markdownify。全部页面到齐后 finalize() 只做文档级收尾，
+    经临时文件原子替换为 file.md。某一页含未闭合的 HTML 而无法单独转换时，
+    退回对整篇 file.partial.md 调用 postprocess_markdown，两种方式的输出完全相同。
+
+    所有方法都是同步的（含文件 I/O），编排器通过 asyncio.to_thread 调用。
+    """
+
+    def __init__(self, pdf_task: PdfTask, total_pages: int, page_store: "PageResultStore") -> None:
+        self.pdf_task = pdf_task
+        self.total_pages = total_pages
+        self.page_store = page_store
+        self.partial_path = partial_markdown_path(pdf_task.output_md_path)
+        self._lock = threading.Lock()
+        # 已到达但尚未写出的页：None 表示成功页，文本需从页结果存储读取
+        self._ready: Dict[int, Optional[PageOcrResult]] = {}
+        self._next_page = 1
+        self._failed: List[PageOcrResult] = []
+        self._file: Optional[IO[str]] = None
+        self.formatted_path = formatted_markdown_path(pdf_task.output_md_path)
+        # 逐块后处理结果；退回整篇后处理后为 None
+        self._formatted: Optional[IO[str]] = None
+
+    def open(self) -> None:
+        """创建（覆盖）进行中文件并写入标题"""
+        with self._lock:
+            self.partial_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self.partial_path.open("w", encoding="utf-8")
+            self._formatted = self.formatted_path.open("w", encoding="utf-8")
+            self._write_lines(_header_lines(self.pdf_task), last=self.total_pages == 0)
+
+    def _write_lines(self, lines: List[str], last: bool = False) -> None:
+        """写出文档中的一块；last 表示这是文档的最后一块"""
+        assert self._file is not None, "StreamingMarkdownWriter 未打开"
+        block = "".join(line + "\n" for line in lines)
+        self._file.write(block)
+        if self._formatted is None or not block:
+            return
+        formatted = postprocess_fragment(block, last=last)
+        if formatted is None:
+            logger.debug("%s 中含无法单独转换的 HTML，改为整篇后处理", self.partial_path.name)
+            self._discard_formatted()
         else:
-            failed_pages.append(result)
-            lines.append(f"> [OCR FAILED] Page {result.page_number}")
-            if result.error:
-                lines.append(f"> 错误信息: {result.error}")
-
-        lines.append("")
-
-    if failed_pages:
-        lines.append("## OCR 失败页列表")
-        lines.append("")
-        for r in failed_pages:
-            if r.error:
-                lines.append(f"- Page {r.page_number}: {r.error}")
+            self._formatted.write(formatted)
+
+    def _discard_formatted(self) -> None:
+        if self._formatted is not None:
+            self._formatted.close()
+            self._formatted = None
+        self.formatted_path.unlink(missing_ok=True)
+
+    def add(self, result: PageOcrResult) -> None:
+        """提交一页结果（成功页的文本必须已写入页结果存储）"""
+        with self._lock:
+            if result.page_number == self._next_page:
+                self._emit(result)
+            elif _is_failed(result):
+                self._ready[result.page_number] = result
             else:
-                lines.append(f"- Page {r.page_number}")
-        lines.append("")
+                self._ready[result.page_number] = None
+            self._advance()
 
-    return "\n".join(lines)
+    def add_stored(self, page_number: int) -> None:
+        """提交一页此前运行中已完成的结果（文本从页结果存储读取）"""
+        with self._lock:
+            self._ready[page_number] = None
+            self._advance()
+
+    def _emit(self, result: PageOcrResult) -> None:
+        if _is_failed(result):
+            self._failed.append(result)
+        # 最后一页之后只有存在失败页时才会再写出汇总块
+        last = result.page_number == self.total_pages and not self._failed
+        self._write_lines(_page_lines(result), last=last)
+        self._next_page += 1
+
+    def _advance(self) -> None:
+        advanced = False
+        while self._next_page in self._ready:
+            result = self._ready.pop(self._next_page)
+            if result is None:
+                text = self.page_store.get(self._next_page)
+                result = PageOcrResult(page_number=self._next_page, text=text, success=text is not None)
+            self._emit(result)
+            advanced = True
+        if advanced:
+            assert self._file is not None
+            self._file.flush()
+            if self._formatted is not None:
+                self._formatted.flush()
+
+    @property
+    def written_pages(self) -> int:
+        """已写出的连续前缀页数"""
+        return self._next_page - 1
+
+    def finalize(self) -> None:
+        """补齐未提交的页、写出失败页汇总，后处理后原子替换为 file.md"""
+        with self._lock:
+            while self._next_page <= self.total_pages:
+                if self._next_page not in self._ready:
+                    self._ready[self._next_page] = PageOcrResult(
+                        page_number=self._next_page, text=None, success=False, error="Not processed"
+                    )
+                self._advance()
+            self._write_lines(_failed_summary_lines(self._failed), last=True)
+            assert self._file is not None
+            self._file.close()
+            self._file = None
+
+            if self._formatted is not None:
+                self._formatted.close()
+                self._formatted = None
+                markdown = finish_markdown(self.formatted_path.read_text(encoding="utf-8"))
+            else:
+                markdown = self.partial_path.read_text(encoding="utf-8")
+                # 与 build_markdown 的 "\n".join 保持一致：去掉最后一行之后多写的换行
+                markdown = postprocess_markdown(markdown[:-1] if markdown.endswith("\n") else markdown)
+            output_md_path = self.pdf_task.output_md_path
+            tmp_path = output_md_path.with_suffix(".tmp")
+            tmp_path.write_text(markdown, encoding="utf-8")
+            tmp_path.replace(output_md_path)
+            self.partial_path.unlink()
+            self.formatted_path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        """异常退出时关闭文件（保留进行中文件供排查）"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._formatted is not None:
+                self._formatted.close()
+                self._formatted = None
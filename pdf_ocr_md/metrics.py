@@ -0,0 +1,378 @@
+from __future__ import annotations
+
+import bisect
+import csv
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+from pdf_ocr_md.types_ import FileConvertResult, PageOcrResult
+
+logger = logging.getLogger(__name__)
+
+# 页级阶段（秒）。render_wait 为等待渲染槽位（页面调度）；渲染进程内：open / text_layer / rasterize / blank_check / encode / hash；
+# render_overhead 为渲染执行器排队与进程间传输；request 为 HTTP 往返总时长（含全部重试），
+# inference_prompt / inference_generate 是服务端 timings 报告的推理耗时（包含在 request 内）
+STAGES: Tuple[str, ...] = (
+    "render_wait",
+    "open",
+    "text_layer",
+    "rasterize",
+    "blank_check",
+    "encode",
+    "hash",
+    "render_overhead",
+    "queue_wait",
+    "ocr_wait",
+    "request_build",
+    "request",
+    "inference_prompt",
+    "inference_generate",
+    "retry_backoff",
+    "tile_render",
+    "store",
+    "write",
+)
+# 文件级阶段：Markdown 后处理与原子替换；整本在渲染槽位与 OCR 槽位上的累计排队时间
+FILE_STAGES: Tuple[str, ...] = ("finalize", "render_queue_wait", "ocr_queue_wait")
+
+# 与 Prometheus 直方图一致的桶上界（秒）
+_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+_CSV_COUNTERS = ("attempts", "tiles", "batch_size", "bytes_sent", "prompt_tokens", "completion_tokens")
+# 逐文件 CSV 的计数列：(列名, FileConvertResult 字段)
+_FILE_CSV_COUNTERS: Tuple[Tuple[str, str], ...] = (
+    ("ocr_pages", "ocr_page_count"),
+    ("text_layer_pages", "text_layer_page_count"),
+    ("blank_pages", "blank_page_count"),
+    ("dedup_pages", "dedup_page_count"),
+    ("tiled_pages", "tiled_page_count"),
+    ("batched_pages", "batched_page_count"),
+    ("truncated_pages", "truncated_page_count"),
+)
+
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], stage: str) -> Iterator[None]:
+    """把代码块耗时累加到 timings[stage]；timings 为 None 时不计时"""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def merge_timings(target: Dict[str, float], source: Dict[str, float]) -> None:
+    for stage, seconds in source.items():
+        target[stage] = target.get(stage, 0.0) + seconds
+
+
+class _Histogram:
+    """固定桶直方图：内存占用与页数无关，分位数按桶内线性插值估算"""
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if n and cumulative + n >= rank:
+                if i == len(_BUCKETS):
+                    return self.max
+                lower = _BUCKETS[i - 1] if i > 0 else 0.0
+                return min(self.max, lower + (_BUCKETS[i] - lower) * (rank - cumulative) / n)
+            cumulative += n
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "total_s": round(self.sum, 3),
+            "mean_ms": round(self.sum / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.50) * 1000, 2),
+            "p95_ms": round(self.quantile(0.95) * 1000, 2),
+            "p99_ms": round(self.quantile(0.99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours:d}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+class RunMetrics:
+    """汇总一次运行的页级阶段耗时与计数，并输出运行报告。
+
+    - 每页完成后调用 record_page：阶段耗时进入直方图，字节数/重试/token 累加，
+      同时向 CSV 追加一行（缓冲写入，不在内存中保留页级明细）；
+    - 每个文件完成后调用 record_file：文件级阶段与完成用时进入直方图，文件数累加，
+      明细同样流式追加到逐文件 CSV，内存占用与文件数无关；
+    - progress_line 给出近 window 秒的滚动吞吐（页/分钟）与按已发现页数估算的剩余时间；
+    - write_reports 在结束时写出 JSON 报告与可选的 Prometheus 文本格式指标文件。
+    所有方法都在事件循环线程中调用。
+    """
+
+    def __init__(
+        self,
+        csv_path: Optional[Path] = None,
+        window: float = 60.0,
+        run_info: Optional[Dict[str, Any]] = None,
+        files_csv_path: Optional[Path] = None,
+    ) -> None:
+        self.csv_path = csv_path
+        self.files_csv_path = files_csv_path
+        self.window = window
+        self.run_info = run_info or {}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.stages: Dict[str, _Histogram] = {stage: _Histogram() for stage in STAGES + FILE_STAGES}
+        self.pages_by_source: Dict[str, int] = {}
+        self.failed_pages = 0
+        self.bytes_sent = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.expected_pages = 0
+        self.done_pages = 0
+        self.done_files = 0
+        self.failed_files = 0
+        self.duplicate_files = 0
+        self.file_elapsed = _Histogram()
+        self._recent: Deque[Tuple[float, int]] = deque()
+        self._csv_file = None
+        self._csv = None
+        self._files_csv_file = None
+        self._files_csv = None
+
+    def open(self) -> None:
+        if self.csv_path is not None:
+            self.csv_path.parent.mkdir(parents=True, exist_ok=True)
+            self._csv_file = self.csv_path.open("w", encoding="utf-8", newline="")
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(
+                ["pdf_path", "page", "source", "success", *_CSV_COUNTERS, *(f"{stage}_ms" for stage in STAGES)]
+            )
+        if self.files_csv_path is not None:
+            self.files_csv_path.parent.mkdir(parents=True, exist_ok=True)
+            self._files_csv_file = self.files_csv_path.open("w", encoding="utf-8", newline="")
+            self._files_csv = csv.writer(self._files_csv_file)
+            self._files_csv.writerow(
+                [
+                    "pdf_path",
+                    "output_md_path",
+                    "success",
+                    "error",
+                    "pages",
+                    "elapsed_seconds",
+                    *(column for column, _ in _FILE_CSV_COUNTERS),
+                    "duplicate_of",
+                    *(f"{stage}_ms" for stage in FILE_STAGES),
+                ]
+            )
+
+    def close(self) -> None:
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+            self._csv = None
+        if self._files_csv_file is not None:
+            self._files_csv_file.close()
+            self._files_csv_file = None
+            self._files_csv = None
+
+    def expect_pages(self, count: int) -> None:
+        """登记新发现的待处理页数（用于估算剩余时间）"""
+        self.expected_pages += count
+
+    def record_page(self, pdf_path: Path, result: PageOcrResult) -> None:
+        for stage, seconds in result.timings.items():
+            histogram = self.stages.get(stage)
+            if histogram is not None:
+                histogram.observe(seconds)
+        if result.success:
+            self.pages_by_source[result.source] = self.pages_by_source.get(result.source, 0) + 1
+        else:
+            self.failed_pages += 1
+        self.bytes_sent += result.bytes_sent
+        self.retries += max(0, result.attempts - 1)
+        self.prompt_tokens += result.prompt_tokens or 0
+        self.completion_tokens += result.completion_tokens or 0
+        self.done_pages += 1
+
+        now = time.perf_counter()
+        self._recent.append((now, self.done_pages))
+        while len(self._recent) > 1 and self._recent[0][0] < now - self.window:
+            self._recent.popleft()
+
+        if self._csv is not None:
+            self._csv.writerow(
+                [
+                    str(pdf_path),
+                    result.page_number,
+                    result.source,
+                    int(result.success),
+                    *(getattr(result, name) if getattr(result, name) is not None else "" for name in _CSV_COUNTERS),
+                    *(
+                        round(result.timings[stage] * 1000, 3) if stage in result.timings else ""
+                        for stage in STAGES
+                    ),
+                ]
+            )
+
+    def record_file(self, result: FileConvertResult) -> None:
+        for stage, seconds in result.timings.items():
+            histogram = self.stages.get(stage)
+            if histogram is not None:
+                histogram.observe(seconds)
+        self.done_files += 1
+        if not result.success:
+            self.failed_files += 1
+        if result.duplicate_of is not None:
+            self.duplicate_files += 1
+        self.file_elapsed.observe(result.elapsed_seconds)
+
+        if self._files_csv is not None:
+            self._files_csv.writerow(
+                [
+                    str(result.pdf_task.pdf_path),
+                    str(result.pdf_task.output_md_path),
+                    int(result.success),
+                    result.error or "",
+                    result.pdf_task.num_pages if result.pdf_task.num_pages is not None else "",
+                    round(result.elapsed_seconds, 3),
+                    *(getattr(result, name) for _, name in _FILE_CSV_COUNTERS),
+                    str(result.duplicate_of) if result.duplicate_of is not None else "",
+                    *(
+                        round(result.timings[stage] * 1000, 3) if stage in result.timings else ""
+                        for stage in FILE_STAGES
+                    ),
+                ]
+            )
+
+    def pages_per_minute(self) -> float:
+        """近 window 秒内的滚动吞吐"""
+        if len(self._recent) < 2:
+            return 0.0
+        (t0, n0), (t1, n1) = self._recent[0], self._recent[-1]
+        return (n1 - n0) / (t1 - t0) * 60 if t1 > t0 else 0.0
+
+    def progress_line(self) -> str:
+        rate = self.pages_per_minute()
+        remaining = max(0, self.expected_pages - self.done_pages)
+        eta = _format_duration(remaining / rate * 60) if rate > 0 else "未知"
+        return (
+            f"进度：已完成 {self.done_pages}/{self.expected_pages} 页（已发现），"
+            f"近 {self.window:g} 秒 {rate:.1f} 页/分钟，预计剩余 {eta}"
+        )
+
+    def summary(self, stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "elapsed_seconds": round(time.perf_counter() - self._start, 3),
+            "run": self.run_info,
+            "stats": stats or {},
+            "pages": {
+                "done": self.done_pages,
+                "failed": self.failed_pages,
+                "by_source": dict(self.pages_by_source),
+            },
+            "counters": {
+                "bytes_sent": self.bytes_sent,
+                "retries": self.retries,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            },
+            "stages": {stage: h.summary() for stage, h in self.stages.items() if h.count},
+            "files": {
+                "done": self.done_files,
+                "failed": self.failed_files,
+                "duplicate": self.duplicate_files,
+                "elapsed": self.file_elapsed.summary(),
+                "csv_path": str(self.files_csv_path) if self.files_csv_path is not None else None,
+            },
+        }
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP pdf_ocr_pages_total 已完成的页数（按结果来源）",
+            "# TYPE pdf_ocr_pages_total counter",
+        ]
+        for source, count in sorted(self.pages_by_source.items()):
+            lines.append(f'pdf_ocr_pages_total{{source="{source}"}} {count}')
+        counters = (
+            ("pdf_ocr_page_failures_total", "失败页数", self.failed_pages),
+            ("pdf_ocr_request_bytes_total", "发送的请求体字节数", self.bytes_sent),
+            ("pdf_ocr_retries_total", "OCR 重试次数", self.retries),
+            ("pdf_ocr_prompt_tokens_total", "服务端报告的提示词 token 数", self.prompt_tokens),
+            ("pdf_ocr_completion_tokens_total", "服务端报告的生成 token 数", self.completion_tokens),
+        )
+        for name, help_text, value in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+        gauges = (
+            ("pdf_ocr_pages_expected", "已发现的待处理页数", self.expected_pages),
+            ("pdf_ocr_pages_per_minute", "滚动吞吐（页/分钟）", round(self.pages_per_minute(), 3)),
+            ("pdf_ocr_run_start_timestamp_seconds", "本次运行开始时间", round(self.started_at, 3)),
+        )
+        for name, help_text, value in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+        lines += ["# HELP pdf_ocr_stage_seconds 页级各阶段耗时", "# TYPE pdf_ocr_stage_seconds histogram"]
+        for stage, histogram in self.stages.items():
+            cumulative = 0
+            for bound, count in zip(_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'pdf_ocr_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'pdf_ocr_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'pdf_ocr_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'pdf_ocr_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def write_prometheus(path: Path, text: str) -> None:
+        """写出 Prometheus 文本格式指标（先写临时文件再替换，供 node_exporter textfile 采集）。
+
+        text 由 prometheus_text() 在事件循环线程中生成，本方法可在线程池中执行。
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def write_reports(
+        self,
+        json_path: Optional[Path],
+        prometheus_path: Optional[Path],
+        stats: Optional[Dict[str, Any]] = None,
+        prometheus_text: Optional[str] = None,
+    ) -> None:
+        """运行结束时写出 JSON 报告与 Prometheus 指标文件（路径为 None 时跳过）"""
+        self.close()
+        if json_path is not None:
+            json_path.parent.mkdir(parents=True, exist_ok=True)
+            json_path.write_text(json.dumps(self.summary(stats), ensure_ascii=False, indent=2), encoding="utf-8")
+            logger.info("运行报告：%s", json_path)
+        if prometheus_path is not None:
+            self.write_prometheus(prometheus_path, prometheus_text or self.prometheus_text())
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, Union
+
+from pdf_ocr_md.ocr.client import CONTEXT_EXCEEDED_ERROR, EncodedImage
+from pdf_ocr_md.pdf.renderer import RenderOptions
+from pdf_ocr_md.types_ import PageOcrResult
+
+if TYPE_CHECKING:
+    from pdf_ocr_md.ocr.client import OcrClient
+    from pdf_ocr_md.ocr.limiter import AdaptiveLimiter
+    from pdf_ocr_md.scheduler import DocumentSlot
+
+logger = logging.getLogger(__name__)
+
+_PAGE_MARKER_LINE = re.compile(r"^[ \t]*<<<PAGE[ \t]+(\d+)>>>[ \t]*$", re.MULTILINE)
+# 批量请求连续成功多少次后把批次上限加 1
+_GROW_AFTER_SUCCESSES = 4
+
+
+@dataclass
+class BatchingOptions:
+    """多页批量 OCR 参数"""
+    # 单次请求最多包含的页数
+    max_pages: int = 4
+    # 单次请求中图片 token 的估算上限
+    max_image_tokens: int = 4096
+    # 每个图片 token 对应的像素数（如 Qwen2-VL 系列为 28×28）
+    pixels_per_token: int = 784
+
+
+def estimate_image_tokens(page_size: Tuple[float, float], render: RenderOptions, pixels_per_token: int) -> int:
+    """按页面尺寸（pt）与渲染参数估算该页图片占用的 token 数，与渲染时的缩放规则一致"""
+    width, height = page_size
+    zoom = render.dpi / 72.0
+    pixels = width * height * zoom * zoom
+    if render.max_pixels > 0:
+        pixels = min(pixels, render.max_pixels)
+    return max(1, math.ceil(pixels / max(1, pixels_per_token)))
+
+
+def _share(total: Optional[int], count: int, index: int) -> Optional[int]:
+    """把整次请求的计数（字节、token）均分到各页，余数计入前几页，保证各页之和不变"""
+    if total is None:
+        return None
+    return total // count + (1 if index < total % count else 0)
+
+
+def _per_page_result(result: PageOcrResult, page_number: int, index: int, count: int, **fields) -> PageOcrResult:
+    """由批量请求的整体结果构造单页结果：各页耗时为整次请求的耗时，字节与 token 均分"""
+    return PageOcrResult(
+        page_number=page_number,
+        attempts=result.attempts,
+        timings=dict(result.timings),
+        bytes_sent=_share(result.bytes_sent, count, index) or 0,
+        prompt_tokens=_share(result.prompt_tokens, count, index),
+        completion_tokens=_share(result.completion_tokens, count, index),
+        **fields,
+    )
+
+
+def split_batch_response(text: str, page_numbers: Sequence[int]) -> Optional[Dict[int, str]]:
+    """按 `<<<PAGE N>>>` 标记把批量响应拆回各页；标记缺失、重复或顺序不符时返回 None"""
+    markers = list(_PAGE_MARKER_LINE.finditer(text))
+    if [int(m.group(1)) for m in markers] != list(page_numbers):
+        return None
+    if text[: markers[0].start()].strip():
+        return None
+    pages: Dict[int, str] = {}
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        pages[int(marker.group(1))] = text[marker.end() : end].strip("\n")
+    return pages
+
+
+@dataclass(eq=False)
+class _PendingPage:
+    page_number: int
+    # 已编码的图片：批量请求与退回单页请求时复用，不重复编码
+    image: EncodedImage = field(repr=False)
+    image_tokens: int
+    # 结果为 None 表示批量解析失败，需由页面自己单独请求
+    future: "asyncio.Future[Optional[PageOcrResult]]" = field(
+        repr=False, default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class OcrBatcher:
+    """把同一 PDF 中同时等待 OCR 槽位的页面合并为一次多页请求。
+
+    每个页面先登记到待处理列表，再争抢 OCR 并发槽位；抢到槽位的页面若尚未被其他请求带走，
+    就按页序带上其余等待中的页面（不超过批次上限与图片 token 预算）发出一次批量请求。
+    服务端空闲时页面各自单独请求，不增加延迟；槽位紧张时等待的页面自然合并。
+
+    响应按分页标记拆回各页；解析失败、截断或上下文超限时各页退回单页请求，
+    并把批次上限减半，连续成功后再逐步加 1。所有方法都在事件循环线程中调用。
+    """
+
+    def __init__(
+        self,
+        client: "OcrClient",
+        semaphore: Union[asyncio.Semaphore, "AdaptiveLimiter", "DocumentSlot"],
+        prompt: str,
+        options: BatchingOptions,
+    ) -> None:
+        self._client = client
+        self._semaphore = semaphore
+        self._prompt = prompt
+        self.options = options
+        self._limit = max(1, options.max_pages)
+        self._successes = 0
+        self._pending: List[_PendingPage] = []
+        self.batch_requests = 0
+        self.fallback_batches = 0
+
+    async def ocr(self, page_number: int, image: EncodedImage, image_tokens: int) -> PageOcrResult:
+        """OCR 单页，可能与其他等待中的页面合并为一次请求"""
+        item = _PendingPage(page_number, image, image_tokens)
+        self._pending.append(item)
+        try:
+            async with self._semaphore:
+                # 已被其他页面带进批次（结果可能尚未返回）时直接归还槽位
+                if item in self._pending:
+                    await self._run(self._take_batch(item))
+        finally:
+            if item in self._pending:
+                self._pending.remove(item)
+
+        result = await item.future
+        if result is None:
+            async with self._semaphore:
+                result = await self._client.ocr_page(image, page_number, self._prompt)
+        return result
+
+    def _take_batch(self, leader: _PendingPage) -> List[_PendingPage]:
+        self._pending.remove(leader)
+        batch = [leader]
+        tokens = leader.image_tokens
+        for item in sorted(self._pending, key=lambda p: p.page_number):
+            if len(batch) >= self._limit:
+                break
+            if tokens + item.image_tokens > self.options.max_image_tokens:
+                continue
+            batch.append(item)
+            tokens += item.image_tokens
+        for item in batch[1:]:
+            self._pending.remove(item)
+        batch.sort(key=lambda p: p.page_number)
+        return batch
+
+    async def _run(self, batch: List[_PendingPage]) -> None:
+        try:
+            if len(batch) == 1:
+                item = batch[0]
+                result = await self._client.ocr_page(item.image, item.page_number, self._prompt)
+                item.future.set_result(result)
+                return
+            results = await self._run_batch(batch)
+        except BaseException as exc:
+            # 被带走的页面由各自的调用方等待结果，异常（含取消）同样转交给它们
+            for item in batch:
+                if item.future.done():
+                    continue
+                if isinstance(exc, asyncio.CancelledError):
+                    item.future.cancel()
+                else:
+                    item.future.set_exception(exc)
+            raise
+        for item in batch:
+            item.future.set_result(results.get(item.page_number) if results is not None else None)
+
+    async def _run_batch(self, batch: List[_PendingPage]) -> Optional[Dict[int, PageOcrResult]]:
+        page_numbers = [item.page_number for item in batch]
+        self.batch_requests += 1
+        logger.info("批量 OCR：第 %s 页（%d 页）", ",".join(map(str, page_numbers)), len(batch))
+        result = await self._client.ocr_batch([(item.page_number, item.image) for item in batch], self._prompt)
+        if not result.success and result.error != CONTEXT_EXCEEDED_ERROR:
+            # 网络/服务端错误已在客户端重试耗尽，逐页重试只会放大压力，直接记为各页失败
+            return {
+                n: _per_page_result(result, n, i, len(page_numbers), text=None, success=False, error=result.error)
+                for i, n in enumerate(page_numbers)
+            }
+
+        pages = split_batch_response(result.text or "", page_numbers) if result.success else None
+        if pages is None or result.truncated:
+            reason = result.error or result.truncated or "无法按分页标记拆分响应"
+            self.fallback_batches += 1
+            self._limit = max(1, len(batch) // 2)
+            self._successes = 0
+            logger.warning("批量 OCR 失败（%s），第 %s 页改为单页请求，批次上限降为 %d", reason, page_numbers, self._limit)
+            return None
+
+        self._successes += 1
+        if self._successes >= _GROW_AFTER_SUCCESSES and self._limit < self.options.max_pages:
+            self._limit += 1
+            self._successes = 0
+        return {
+            n: _per_page_result(result, n, i, len(page_numbers), text=pages[n], success=True, batch_size=len(batch))
+            for i, n in enumerate(page_numbers)
+        }
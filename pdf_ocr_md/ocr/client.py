@@ -2,123 +2,520 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import json
 import logging
-from typing import Any, Dict, Optional
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import httpx
 
 from pdf_ocr_md.config import AppConfig
+from pdf_ocr_md.metrics import timed
+from pdf_ocr_md.ocr.prompts import build_batch_prompt, page_marker
+from pdf_ocr_md.ocr.endpoints import Endpoint, EndpointPool
+from pdf_ocr_md.ocr.limiter import AdaptiveLimiter
+from pdf_ocr_md.ocr.stream import RepetitionDetector, StreamAborted, parse_sse_line
 from pdf_ocr_md.types_ import PageOcrResult
 
 
 logger = logging.getLogger(__name__)
 
+# 上下文超限时 PageOcrResult.error 的固定取值，编排器据此改用分块 OCR
+CONTEXT_EXCEEDED_ERROR = "the request exceeds the available context size"
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# 除 5xx 外可重试的状态码：请求超时与限流（429 按 Retry-After 等待）
+_RETRYABLE_STATUS = frozenset({408, 429})
+# Retry-After 的等待上限（秒），避免异常的响应头让页面长时间挂起
+_MAX_RETRY_AFTER = 60.0
+
+# 请求模板中图片 URL 的占位符：模板序列化后按出现顺序替换为各图片的 data URL，
+# base64 字节直接拼入请求体，不经过 str 与 JSON 编码
+_IMAGE_PLACEHOLDER = "\x00image\x00"
+_IMAGE_PLACEHOLDER_JSON = json.dumps(_IMAGE_PLACEHOLDER).strip('"').encode("ascii")
+_IMAGE_PART = {"type": "image_url", "image_url": {"url": _IMAGE_PLACEHOLDER}}
+
+
+@dataclass(eq=False)
+class EncodedImage:
+    """base64 编码后的页面图片，可直接拼入请求体；编码完成后原始图片即可释放"""
+    mime_type: str
+    data: bytes = field(repr=False)
+    # 编码耗时（秒），计入使用它的请求的 request_build
+    seconds: float = 0.0
+
+    @classmethod
+    def encode(cls, image_bytes: bytes, mime_type: str) -> "EncodedImage":
+        start = time.perf_counter()
+        data = base64.b64encode(image_bytes)
+        return cls(mime_type, data, time.perf_counter() - start)
+
+
+@dataclass(eq=False)
+class PreparedRequest:
+    """预先序列化的 Chat Completion 请求体，各次重试原样重发同一份字节"""
+    body: bytes = field(repr=False)
+    # 请求中包含的页数（批量请求为多页）
+    page_count: int = 1
+    # 编码与序列化的耗时（秒）
+    build_seconds: float = 0.0
+    # 按槽位缓存的请求体：重试通常复用同一槽位，无需每次都复制整个请求体
+    _slot_bodies: Dict[int, bytes] = field(default_factory=dict, repr=False)
+
+    def body_for_slot(self, slot: Optional[int]) -> bytes:
+        """固定槽位时在请求体末尾追加 id_slot 与 cache_prompt，其余部分不重新序列化"""
+        if slot is None:
+            return self.body
+        body = self._slot_bodies.get(slot)
+        if body is None:
+            # 与 {**payload, "id_slot": slot, "cache_prompt": True} 的序列化结果相同
+            body = b"".join((memoryview(self.body)[:-1], b',"id_slot":%d,"cache_prompt":true}' % slot))
+            self._slot_bodies[slot] = body
+        return body
+
+
+def _serialize_request(payload: Dict[str, Any], images: Sequence[EncodedImage]) -> bytes:
+    """序列化 payload，并把其中的图片占位符按顺序替换为 images 的 data URL"""
+    template = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    pieces = template.split(_IMAGE_PLACEHOLDER_JSON)
+    if len(pieces) != len(images) + 1:
+        raise ValueError("提示词中包含图片占位符，无法构造请求体")
+    parts = [pieces[0]]
+    for image, piece in zip(images, pieces[1:]):
+        parts += (b"data:", image.mime_type.encode("ascii"), b";base64,", image.data, piece)
+    return b"".join(parts)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(0.0, seconds), _MAX_RETRY_AFTER)
+
+
+def _parse_error_body(body: str) -> Optional[dict]:
+    """解析 llama-server 的 JSON 错误体，无法解析时返回 None"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@dataclass
+class _Completion:
+    """一次 Chat Completion 请求的结果（流式与非流式统一表示）"""
+    status_code: int
+    body: str = ""
+    content: str = ""
+    completion_tokens: Optional[int] = None
+    raw_response: Optional[dict] = None
+    # 提前截断原因（复读、超出 token 预算），None 表示正常结束
+    truncated: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    # llama-server 响应中的 timings（prompt_ms / predicted_ms 等），其他服务端为 None
+    server_timings: Optional[dict] = None
+    # 错误响应的 Retry-After（秒）
+    retry_after: Optional[float] = None
+
 
 class OcrClient:
-    """基于 httpx 的异步 OCR 客户端。"""
+    """基于 httpx 的异步 OCR 客户端。
+
+    请求通过 EndpointPool 分发到一个或多个 llama-server 端点，每次重试都会重新选择端点。
+    启用流式模式时逐个消费 SSE 增量：首 token 或 token 间隔超时立即中止并重试，
+    检测到复读或超出单页 token 预算时提前截断并保留已生成的文本。
+    """
 
-    def __init__(self, config: AppConfig) -> None:
+    def __init__(self, config: AppConfig, limiter: Optional[AdaptiveLimiter] = None) -> None:
         self._config = config
-        self._client: Optional[httpx.AsyncClient] = None
+        self._pool: Optional[EndpointPool] = None
+        # 自适应并发限制器：每次请求的延迟与 5xx/超时都会反馈给它
+        self._limiter = limiter
 
     async def __aenter__(self) -> "OcrClient":
-        self._client = httpx.AsyncClient(base_url=self._config.server_url.rstrip("/"))
+        self._pool = EndpointPool(
+            self._config.endpoint_configs(),
+            health_check_interval=self._config.health_check_interval,
+        )
+        await self._pool.start()
         return self
 
     async def __aexit__(self, exc_type, exc, tb) -> None:
-        if self._client is not None:
-            await self._client.aclose()
-            self._client = None
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def ocr_page(
+        self,
+        image: Union[bytes, EncodedImage],
+        page_number: int,
+        prompt: str,
+        mime_type: str = "image/png",
+    ) -> PageOcrResult:
+        """对单页图片执行 OCR 并返回结果。
+
+        mime_type 需与图片编码格式一致（image/png、image/jpeg、image/webp）。
+        需要尽早释放原始图片的调用方应分别调用 prepare_page 与 complete。
+        """
+        return await self.complete(await self.prepare_page(image, prompt, mime_type), page_number)
+
+    async def ocr_batch(
+        self,
+        images: Sequence[Tuple[int, EncodedImage]],
+        prompt: str,
+    ) -> PageOcrResult:
+        """把多页图片放进同一次请求 OCR，返回整段响应（page_number 为首页页号）。
+
+        每张图片前插入 `<<<PAGE N>>>` 分隔标记，并要求模型按同样的标记分页输出，
+        调用方用 `ocr/batching.py` 中的 split_batch_response 拆回各页。
+        """
+        return await self.complete(await self.prepare_batch(images, prompt), images[0][0])
+
+    async def encode_image(self, image_bytes: bytes, mime_type: str) -> EncodedImage:
+        """在线程中对图片做 base64 编码"""
+        return await asyncio.to_thread(EncodedImage.encode, image_bytes, mime_type)
 
-    async def ocr_page(self, image_bytes: bytes, page_number: int, prompt: str) -> PageOcrResult:
-        """对单页图片执行 OCR 并返回结果。"""
+    async def prepare_page(
+        self, image: Union[bytes, EncodedImage], prompt: str, mime_type: str = "image/png"
+    ) -> PreparedRequest:
+        """在线程中构造单页请求体；image 为原始图片字节时先做 base64 编码"""
+        return await asyncio.to_thread(self._build_page, image, prompt, mime_type)
 
-        assert self._client is not None, "OcrClient 未初始化，请使用 async with OcrClient(...)"
+    async def prepare_batch(self, images: Sequence[Tuple[int, EncodedImage]], prompt: str) -> PreparedRequest:
+        """在线程中构造多页批量请求体"""
+        return await asyncio.to_thread(self._build_batch, images, prompt)
 
-        b64 = base64.b64encode(image_bytes).decode("ascii")
+    def _payload(self, content: List[Dict[str, Any]]) -> Dict[str, Any]:
         payload: Dict[str, Any] = {
             "model": self._config.model,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{b64}"},
-                        },
-                    ],
-                }
-            ],
-            "stream": False,
+            "messages": [{"role": "user", "content": content}],
+            "stream": self._config.stream_enabled,
         }
+        if self._config.max_tokens > 0:
+            payload["max_tokens"] = self._config.max_tokens
+        return payload
 
+    def _build_page(self, image: Union[bytes, EncodedImage], prompt: str, mime_type: str) -> PreparedRequest:
+        start = time.perf_counter()
+        if not isinstance(image, EncodedImage):
+            image = EncodedImage.encode(image, mime_type)
+        body = _serialize_request(self._payload([{"type": "text", "text": prompt}, _IMAGE_PART]), [image])
+        return PreparedRequest(body, 1, image.seconds + time.perf_counter() - start)
+
+    def _build_batch(self, images: Sequence[Tuple[int, EncodedImage]], prompt: str) -> PreparedRequest:
+        start = time.perf_counter()
+        page_numbers = [page_number for page_number, _ in images]
+        content: List[Dict[str, Any]] = [{"type": "text", "text": build_batch_prompt(prompt, page_numbers)}]
+        for page_number, _ in images:
+            content.append({"type": "text", "text": page_marker(page_number)})
+            content.append(_IMAGE_PART)
+        body = _serialize_request(self._payload(content), [image for _, image in images])
+        encode_seconds = sum(image.seconds for _, image in images)
+        return PreparedRequest(body, len(images), encode_seconds + time.perf_counter() - start)
+
+    async def complete(self, request: PreparedRequest, page_number: int) -> PageOcrResult:
+        """发送一次 Chat Completion（含重试、端点选择与流式中止处理），page_number 仅用于日志与结果。
+
+        各次重试重发同一份请求体。请求构造、HTTP 往返、服务端推理与重试等待的耗时累加到
+        结果的 timings 中。
+        """
+        assert self._pool is not None, "OcrClient 未初始化，请使用 async with OcrClient(...)"
+
+        timings: Dict[str, float] = {"request_build": request.build_seconds}
         last_error: Optional[str] = None
+        attempts = 0
+        # 各次中止尝试中最长的部分文本，重试耗尽时作为截断结果返回
+        best_partial = ""
+        bytes_sent = 0
+        usage: Dict[str, Optional[int]] = {"prompt_tokens": None, "completion_tokens": None}
+
+        def finish(result: PageOcrResult) -> PageOcrResult:
+            result.timings = timings
+            result.bytes_sent = bytes_sent
+            result.prompt_tokens = usage["prompt_tokens"]
+            result.completion_tokens = usage["completion_tokens"]
+            return result
 
         for attempt in range(1, self._config.max_retries + 2):
+            attempts = attempt
+            retry_after: Optional[float] = None
+            endpoint = await self._pool.acquire()
+            endpoint_ok = True
+            # 固定到一个槽位：同一槽位上一次请求的提示词前缀仍在 KV cache 中，cache_prompt 可直接复用
+            slot = endpoint.take_slot() if self._config.slot_pinning else None
             try:
-                resp = await self._client.post(
-                    "/v1/chat/completions",
-                    json=payload,
-                    timeout=self._config.request_timeout,
-                )
+                body = request.body_for_slot(slot)
+                bytes_sent += len(body)
+                attempt_start = time.perf_counter()
+                try:
+                    if self._config.stream_enabled:
+                        completion = await self._post_streaming(endpoint, body, page_number)
+                    else:
+                        completion = await self._post(endpoint, body)
+                finally:
+                    latency = time.perf_counter() - attempt_start
+                    timings["request"] = timings.get("request", 0.0) + latency
+                self._record_usage(completion, usage, timings)
 
-                if resp.status_code == 400:
-                    text = resp.text
+                if completion.status_code == 400:
+                    text = completion.body
                     if "context" in text and "exceeds" in text:
-                        msg = "the request exceeds the available context size"
                         logger.warning("页面 %s 上下文超限：%s", page_number, text)
-                        return PageOcrResult(
-                            page_number=page_number,
-                            text=None,
-                            success=False,
-                            error=msg,
+                        return finish(
+                            PageOcrResult(
+                                page_number=page_number,
+                                text=None,
+                                success=False,
+                                error=CONTEXT_EXCEEDED_ERROR,
+                                # 保留服务端错误体（含 n_prompt_tokens / n_ctx），用于估算分块数
+                                raw_response=_parse_error_body(text),
+                                attempts=attempt,
+                            )
                         )
 
                     last_error = f"HTTP 400: {text}"
                     break
 
-                if resp.status_code >= 500:
-                    last_error = f"HTTP {resp.status_code}: {resp.text}"
+                if completion.status_code >= 500 or completion.status_code in _RETRYABLE_STATUS:
+                    # 429 说明端点正常但已满载，不计为端点故障
+                    endpoint_ok = completion.status_code == 429
+                    retry_after = completion.retry_after
+                    last_error = f"HTTP {completion.status_code}: {completion.body}"
+                    if self._limiter is not None:
+                        self._limiter.record_overload(f"HTTP {completion.status_code}")
                     logger.warning(
-                        "OCR 请求失败（第 %d 次重试，页面 %d）：%s",
+                        "OCR 请求失败（第 %d 次重试，页面 %d，端点 %s）：%s",
                         attempt,
                         page_number,
+                        endpoint.url,
                         last_error,
                     )
+                elif not 200 <= completion.status_code < 300:
+                    # 其余 4xx（如 404、413）重试也不会成功，直接记为失败
+                    last_error = f"HTTP {completion.status_code}: {completion.body}"
+                    logger.warning("OCR 请求被拒绝（页面 %d，端点 %s）：%s", page_number, endpoint.url, last_error)
+                    break
                 else:
-                    data = resp.json()
-                    content = (
-                        data.get("choices", [{}])[0]
-                        .get("message", {})
-                        .get("content", "")
-                    )
-                    if not isinstance(content, str):
-                        content = str(content)
-
-                    return PageOcrResult(
-                        page_number=page_number,
-                        text=content,
-                        success=True,
-                        error=None,
-                        raw_response=data,
+                    if self._limiter is not None:
+                        self._limiter.record_success(latency, completion.completion_tokens)
+                    if completion.truncated:
+                        logger.warning("页面 %d 输出被提前截断（%s），保留已生成的文本", page_number, completion.truncated)
+
+                    return finish(
+                        PageOcrResult(
+                            page_number=page_number,
+                            text=completion.content,
+                            success=True,
+                            error=None,
+                            raw_response=completion.raw_response,
+                            truncated=completion.truncated,
+                            attempts=attempt,
+                        )
                     )
 
+            except StreamAborted as exc:
+                endpoint_ok = False
+                last_error = exc.reason
+                if len(exc.partial_text) > len(best_partial):
+                    best_partial = exc.partial_text
+                if self._limiter is not None:
+                    self._limiter.record_overload(exc.reason)
+                logger.warning(
+                    "OCR 流式响应中止（第 %d 次重试，页面 %d，端点 %s）：%s，已收到 %d 字符",
+                    attempt,
+                    page_number,
+                    endpoint.url,
+                    exc.reason,
+                    len(exc.partial_text),
+                )
             except (httpx.RequestError, httpx.TimeoutException) as exc:
+                endpoint_ok = False
                 last_error = repr(exc)
+                if self._limiter is not None:
+                    self._limiter.record_overload(type(exc).__name__)
                 logger.warning(
-                    "OCR 请求异常（第 %d 次重试，页面 %d）：%s",
+                    "OCR 请求异常（第 %d 次重试，页面 %d，端点 %s）：%s",
                     attempt,
                     page_number,
+                    endpoint.url,
                     last_error,
                 )
+            finally:
+                endpoint.return_slot(slot)
+                await self._pool.release(endpoint, endpoint_ok)
 
             if attempt <= self._config.max_retries:
-                await asyncio.sleep(2 ** (attempt - 1))
+                with timed(timings, "retry_backoff"):
+                    await asyncio.sleep(max(2 ** (attempt - 1), retry_after or 0.0))
+
+        if best_partial:
+            logger.warning("页面 %d 重试耗尽，使用中止前已收到的部分文本（%d 字符）", page_number, len(best_partial))
+            return finish(
+                PageOcrResult(
+                    page_number=page_number,
+                    text=best_partial,
+                    success=True,
+                    error=None,
+                    truncated=last_error,
+                    attempts=attempts,
+                )
+            )
+
+        return finish(
+            PageOcrResult(
+                page_number=page_number,
+                text=None,
+                success=False,
+                error=last_error or "OCR 请求失败",
+                attempts=attempts,
+            )
+        )
+
+    @staticmethod
+    def _record_usage(
+        completion: _Completion, usage: Dict[str, Optional[int]], timings: Dict[str, float]
+    ) -> None:
+        """累加服务端报告的 token 数与推理耗时（llama-server 的 timings 字段，单位毫秒）"""
+        for key in ("prompt_tokens", "completion_tokens"):
+            value = getattr(completion, key)
+            if isinstance(value, int):
+                usage[key] = (usage[key] or 0) + value
+        server = completion.server_timings or {}
+        for stage, key in (("inference_prompt", "prompt_ms"), ("inference_generate", "predicted_ms")):
+            value = server.get(key)
+            if isinstance(value, (int, float)):
+                timings[stage] = timings.get(stage, 0.0) + value / 1000.0
+
+    async def _post(self, endpoint: Endpoint, body: bytes) -> _Completion:
+        """非流式请求：等待完整响应体"""
+        resp = await endpoint.client.post(
+            "/v1/chat/completions",
+            content=body,
+            headers=_JSON_HEADERS,
+            timeout=self._config.request_timeout,
+        )
+        if resp.status_code >= 400:
+            return _Completion(
+                status_code=resp.status_code,
+                body=resp.text,
+                retry_after=_parse_retry_after(resp.headers.get("Retry-After")),
+            )
+
+        data = resp.json()
+        choice = data.get("choices", [{}])[0]
+        content = choice.get("message", {}).get("content", "")
+        if not isinstance(content, str):
+            content = str(content)
+        usage = data.get("usage") or {}
+        truncated = "超出单页 token 预算" if choice.get("finish_reason") == "length" else None
+        return _Completion(
+            status_code=resp.status_code,
+            content=content,
+            completion_tokens=usage.get("completion_tokens"),
+            raw_response=data,
+            truncated=truncated,
+            prompt_tokens=usage.get("prompt_tokens"),
+            server_timings=data.get("timings"),
+        )
+
+    async def _post_streaming(self, endpoint: Endpoint, body: bytes, page_number: int) -> _Completion:
+        """流式请求：逐个消费 SSE 增量，按首 token / token 间隔超时、复读与 token 预算提前中止。
+
+        整次尝试仍受 request_timeout 总时长限制。
+        """
+        config = self._config
+        detector = RepetitionDetector(config.repetition_min_repeats, config.repetition_min_chars)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        overall_deadline = started + config.request_timeout
+        token_deadline = started + config.stream_first_token_timeout
+        content = ""
+        tokens = 0
+        usage: Dict[str, Any] = {}
+        finish_reason: Optional[str] = None
+        truncated: Optional[str] = None
+        server_timings: Optional[dict] = None
+
+        async with endpoint.client.stream(
+            "POST",
+            "/v1/chat/completions",
+            content=body,
+            headers=_JSON_HEADERS,
+            timeout=config.request_timeout,
+        ) as resp:
+            if resp.status_code >= 400:
+                await resp.aread()
+                return _Completion(
+                    status_code=resp.status_code,
+                    body=resp.text,
+                    retry_after=_parse_retry_after(resp.headers.get("Retry-After")),
+                )
+
+            lines = resp.aiter_lines()
+            while True:
+                deadline = min(token_deadline, overall_deadline)
+                try:
+                    line = await asyncio.wait_for(lines.__anext__(), timeout=max(0.0, deadline - loop.time()))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    if deadline == overall_deadline:
+                        reason = f"流式响应超过总超时 {config.request_timeout:g} 秒"
+                    elif tokens == 0:
+                        reason = f"首 token 超时（{config.stream_first_token_timeout:g} 秒）"
+                    else:
+                        reason = f"token 间隔超时（{config.stream_stall_timeout:g} 秒）"
+                    raise StreamAborted(reason, content) from None
+
+                event = parse_sse_line(line)
+                if event is None:
+                    continue
+                if not event:
+                    break
+                if "error" in event:
+                    # 服务端在流中报告错误（如生成过程中出错），按 5xx 处理并重试
+                    return _Completion(status_code=500, body=str(event["error"]))
+                if event.get("usage"):
+                    usage = event["usage"]
+                if event.get("timings"):
+                    server_timings = event["timings"]
+                choices = event.get("choices") or [{}]
+                finish_reason = choices[0].get("finish_reason") or finish_reason
+                delta = (choices[0].get("delta") or {}).get("content")
+                if not delta:
+                    continue
+
+                content += delta
+                tokens += 1
+                token_deadline = loop.time() + config.stream_stall_timeout
+
+                keep = detector.check(content)
+                if keep is not None:
+                    content = content[:keep]
+                    truncated = f"检测到复读循环（已生成 {tokens} 个 token）"
+                    break
+                if config.max_tokens > 0 and tokens >= config.max_tokens:
+                    truncated = "超出单页 token 预算"
+                    break
 
-        return PageOcrResult(
-            page_number=page_number,
-            text=None,
-            success=False,
-            error=last_error or "OCR 请求失败",
+        if truncated is None and finish_reason == "length":
+            truncated = "超出单页 token 预算"
+        logger.debug("页面 %d 流式响应完成：%d 个 token，用时 %.2f 秒", page_number, tokens, loop.time() - started)
+        return _Completion(
+            status_code=200,
+            content=content,
+            completion_tokens=usage.get("completion_tokens") or tokens,
+            truncated=truncated,
+            prompt_tokens=usage.get("prompt_tokens"),
+            server_timings=server_timings,
         )
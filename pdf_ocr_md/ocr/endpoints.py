@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import List, Optional
+
+import httpx
+
+from pdf_ocr_md.config import EndpointConfig
+
+logger = logging.getLogger(__name__)
+
+# 连续失败多少次后摘除端点
+_EJECT_AFTER_ERRORS = 3
+_HEALTH_CHECK_TIMEOUT = 5.0
+
+
+class Endpoint:
+    """运行期端点状态：HTTP 客户端、在途请求数、空闲槽位与健康状况"""
+
+    def __init__(self, config: EndpointConfig) -> None:
+        self.url = config.url.rstrip("/")
+        self.weight = max(config.weight, 1e-6)
+        self.max_concurrency = max(1, config.max_concurrency)
+        self.client = httpx.AsyncClient(base_url=self.url)
+        self.outstanding = 0
+        self.consecutive_errors = 0
+        self.healthy = True
+        self.completed = 0
+        self.failed = 0
+        # 空闲的服务端槽位编号（栈），优先复用最近用过的槽位
+        self._free_slots: List[int] = list(reversed(range(config.slots or 0)))
+
+    @property
+    def load(self) -> float:
+        """按权重归一化的在途请求数，越小越优先"""
+        return self.outstanding / self.weight
+
+    def take_slot(self) -> Optional[int]:
+        """占用一个服务端槽位编号；未探测到槽位或槽位已用尽时返回 None（由服务端自行分配）"""
+        return self._free_slots.pop() if self._free_slots else None
+
+    def return_slot(self, slot: Optional[int]) -> None:
+        if slot is not None:
+            self._free_slots.append(slot)
+
+
+class EndpointPool:
+    """多个 llama-server 端点的负载均衡池。
+
+    - 按“在途请求数 / 权重”最小优先分配，单端点在途数不超过其 max_concurrency；
+    - 连续出错或健康检查失败的端点被摘除，健康检查恢复后重新加入；
+    - 所有端点都被摘除时仍按负载选择，让请求走正常的重试/失败流程而不是无限等待。
+    """
+
+    def __init__(self, endpoints: List[EndpointConfig], health_check_interval: float = 10.0) -> None:
+        if not endpoints:
+            raise ValueError("至少需要配置一个 OCR 端点")
+        self.endpoints = [Endpoint(ep) for ep in endpoints]
+        self.health_check_interval = health_check_interval
+        self._available = asyncio.Condition()
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def total_concurrency(self) -> int:
+        return sum(ep.max_concurrency for ep in self.endpoints)
+
+    async def start(self) -> None:
+        if self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+        logger.info(
+            "OCR 端点池：%s",
+            ", ".join(f"{ep.url}(权重 {ep.weight:g}, 并发 {ep.max_concurrency})" for ep in self.endpoints),
+        )
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for ep in self.endpoints:
+            await ep.client.aclose()
+            logger.info("端点 %s：成功 %d 次，失败 %d 次", ep.url, ep.completed, ep.failed)
+
+    def _pick(self) -> Optional[Endpoint]:
+        candidates = [ep for ep in self.endpoints if ep.outstanding < ep.max_concurrency]
+        healthy = [ep for ep in candidates if ep.healthy]
+        if healthy:
+            candidates = healthy
+        elif any(ep.healthy for ep in self.endpoints):
+            # 仍有健康端点只是暂时满载，等待其空出槽位
+            return None
+        if not candidates:
+            return None
+        return min(candidates, key=lambda ep: ep.load)
+
+    async def acquire(self) -> Endpoint:
+        """选择负载最低的可用端点并占用一个在途名额"""
+        async with self._available:
+            while True:
+                endpoint = self._pick()
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    return endpoint
+                await self._available.wait()
+
+    async def release(self, endpoint: Endpoint, ok: bool) -> None:
+        """归还在途名额并记录本次请求结果（ok=False 表示 5xx/超时/网络错误）"""
+        async with self._available:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.completed += 1
+                endpoint.consecutive_errors = 0
+            else:
+                endpoint.failed += 1
+                endpoint.consecutive_errors += 1
+                if endpoint.healthy and endpoint.consecutive_errors >= _EJECT_AFTER_ERRORS:
+                    endpoint.healthy = False
+                    logger.warning("端点连续出错 %d 次，暂时摘除：%s", endpoint.consecutive_errors, endpoint.url)
+            self._available.notify_all()
+
+    async def _check(self, endpoint: Endpoint) -> bool:
+        try:
+            resp = await endpoint.client.get("/health", timeout=_HEALTH_CHECK_TIMEOUT)
+            return resp.status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            results = await asyncio.gather(*(self._check(ep) for ep in self.endpoints))
+            async with self._available:
+                for endpoint, ok in zip(self.endpoints, results):
+                    if ok and not endpoint.healthy:
+                        endpoint.healthy = True
+                        endpoint.consecutive_errors = 0
+                        logger.info("端点健康检查恢复，重新加入：%s", endpoint.url)
+                    elif not ok and endpoint.healthy:
+                        endpoint.healthy = False
+                        logger.warning("端点健康检查失败，暂时摘除：%s", endpoint.url)
+                self._available.notify_all()
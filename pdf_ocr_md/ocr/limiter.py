@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Optional
+
+logger = logging.getLogger(__name__)
+
+# 短期延迟超过长期基线的该倍数时认为服务端开始排队，温和降低并发
+_LATENCY_TOLERANCE = 2.0
+# 5xx / 超时时的乘性减小系数
+_OVERLOAD_BACKOFF = 0.7
+# 延迟升高时的乘性减小系数
+_LATENCY_BACKOFF = 0.9
+# 短期 / 长期延迟 EWMA 平滑系数
+_SHORT_EWMA_ALPHA = 0.2
+_LONG_EWMA_ALPHA = 0.02
+
+
+class AdaptiveLimiter:
+    """自适应并发限制器（AIMD + 延迟梯度），可替代 asyncio.Semaphore 使用。
+
+    - 成功请求：每累计约 limit 个成功样本，上限加 1（加性增）；
+    - 5xx / 超时：上限乘以 0.7（乘性减）；
+    - 短期延迟 EWMA 超过长期 EWMA 基线的 2 倍：上限乘以 0.9；
+    延迟按输出 token 数归一化（响应带 usage 时），以减小页面内容长短差异的影响。
+    上限始终保持在 [min_limit, max_limit] 之间，每次整数上限变化都会记录日志。
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, initial_limit: Optional[int] = None) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        if initial_limit is None:
+            initial_limit = max(self.min_limit, self.max_limit // 2)
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial_limit)))
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._successes_in_window = 0
+        self._short_ewma: Optional[float] = None
+        self._long_ewma: Optional[float] = None
+        # 一次减小后，需等到当时在途的请求全部返回才允许再次减小，避免同一波过载被重复惩罚
+        self._cooldown = 0
+        logger.info(
+            "初始化自适应并发：初始 %d，范围 [%d, %d]",
+            self.limit,
+            self.min_limit,
+            self.max_limit,
+        )
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def locked(self) -> bool:
+        """与 asyncio.Semaphore.locked 一致：此时调用 acquire 是否需要等待"""
+        return bool(self._waiters) or self._in_flight >= self.limit
+
+    async def acquire(self) -> None:
+        if not self._waiters and self._in_flight < self.limit:
+            self._in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 已分配到槽位但调用方被取消，归还槽位
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        self._in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    async def __aenter__(self) -> "AdaptiveLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+    def _set_limit(self, new_limit: float, reason: str) -> None:
+        new_limit = min(float(self.max_limit), max(float(self.min_limit), new_limit))
+        old = self.limit
+        self._limit = new_limit
+        if self.limit != old:
+            logger.info("自适应并发：%d → %d（%s）", old, self.limit, reason)
+            self._wake_waiters()
+
+    def record_success(self, latency: float, completion_tokens: Optional[int] = None) -> None:
+        """记录一次成功请求的延迟（秒）及输出 token 数（可选）"""
+        sample = latency / completion_tokens if completion_tokens else latency
+        if self._short_ewma is None or self._long_ewma is None:
+            self._short_ewma = self._long_ewma = sample
+        else:
+            self._short_ewma = _SHORT_EWMA_ALPHA * sample + (1 - _SHORT_EWMA_ALPHA) * self._short_ewma
+            self._long_ewma = _LONG_EWMA_ALPHA * sample + (1 - _LONG_EWMA_ALPHA) * self._long_ewma
+
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return
+
+        if self._short_ewma > self._long_ewma * _LATENCY_TOLERANCE:
+            self._set_limit(
+                self._limit * _LATENCY_BACKOFF,
+                f"延迟升高：短期 {self._short_ewma:.3f} > 基线 {self._long_ewma:.3f} × {_LATENCY_TOLERANCE}",
+            )
+            self._successes_in_window = 0
+            self._cooldown = self._in_flight
+            return
+
+        self._successes_in_window += 1
+        if self._successes_in_window >= self.limit:
+            self._successes_in_window = 0
+            self._set_limit(self._limit + 1, f"延迟正常：短期 {self._short_ewma:.3f}，基线 {self._long_ewma:.3f}")
+
+    def record_overload(self, reason: str) -> None:
+        """记录一次过载信号（5xx、超时或网络错误）"""
+        self._successes_in_window = 0
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return
+        self._set_limit(self._limit * _OVERLOAD_BACKOFF, reason)
+        self._cooldown = self._in_flight
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Sequence
+
 DEFAULT_PROMPT = (
     "你是一个高质量的 OCR + Markdown 排版助手。"
     "请识别图片中的中文和英文文本，保持原有的标题层级、列表、段落结构，"
@@ -15,3 +17,21 @@ PROMPTS = {
 def get_prompt(preset: str = "default") -> str:
     """根据预设名称返回对应的 OCR prompt。"""
     return PROMPTS.get(preset, DEFAULT_PROMPT)
+
+
+# 多页批量请求时追加在提示词之后的分页说明
+BATCH_PROMPT_SUFFIX = (
+    "\n\n本次共有 {count} 张图片，依次为第 {pages} 页，每张图片前有一行 `<<<PAGE 页码>>>` 标记。"
+    "请逐张识别，每页的输出以单独一行的 `<<<PAGE 页码>>>` 开头，按图片顺序输出，不要添加其他说明。"
+)
+
+
+def page_marker(page_number: int) -> str:
+    """批量请求中的分页标记"""
+    return f"<<<PAGE {page_number}>>>"
+
+
+def build_batch_prompt(prompt: str, page_numbers: Sequence[int]) -> str:
+    """在 OCR prompt 后追加多页批量请求的分页说明。"""
+    pages = "、".join(str(n) for n in page_numbers)
+    return prompt + BATCH_PROMPT_SUFFIX.format(count=len(page_numbers), pages=pages)
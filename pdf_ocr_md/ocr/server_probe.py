@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+
+import httpx
+
+from pdf_ocr_md.config import AppConfig, EndpointConfig
+
+logger = logging.getLogger(__name__)
+
+_PROBE_TIMEOUT = 5.0
+# 等待服务就绪时的轮询间隔上限（秒）
+_MAX_POLL_INTERVAL = 5.0
+
+
+@dataclass
+class ServerInfo:
+    """llama-server /props 中与吞吐相关的属性，字段缺失时为 None"""
+    total_slots: Optional[int] = None
+    n_ctx: Optional[int] = None
+    model_path: Optional[str] = None
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float) -> bool:
+    """轮询 /health 直到返回 200（llama-server 加载模型期间返回 503），超时返回 False"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = 0.5
+    last_status = ""
+    while True:
+        try:
+            resp = await client.get("/health", timeout=_PROBE_TIMEOUT)
+            if resp.status_code == 200:
+                return True
+            status = f"HTTP {resp.status_code}"
+        except httpx.HTTPError as exc:
+            status = type(exc).__name__
+        if status != last_status:
+            logger.info("等待 OCR 服务就绪：%s（%s）", client.base_url, status)
+            last_status = status
+        if loop.time() + interval > deadline:
+            return False
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, _MAX_POLL_INTERVAL)
+
+
+async def fetch_server_info(client: httpx.AsyncClient) -> Optional[ServerInfo]:
+    """读取 /props；非 llama-server 或接口不可用时返回 None"""
+    try:
+        resp = await client.get("/props", timeout=_PROBE_TIMEOUT)
+        if resp.status_code != 200:
+            return None
+        data = resp.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    settings = data.get("default_generation_settings") or {}
+    total_slots = data.get("total_slots")
+    n_ctx = settings.get("n_ctx") if isinstance(settings, dict) else None
+    return ServerInfo(
+        total_slots=total_slots if isinstance(total_slots, int) and total_slots > 0 else None,
+        n_ctx=n_ctx if isinstance(n_ctx, int) else None,
+        model_path=data.get("model_path"),
+    )
+
+
+async def _probe_endpoint(endpoint: EndpointConfig, config: AppConfig) -> EndpointConfig:
+    async with httpx.AsyncClient(base_url=endpoint.url.rstrip("/")) as client:
+        if config.server_ready_timeout > 0 and not await wait_until_ready(client, config.server_ready_timeout):
+            logger.warning(
+                "OCR 服务在 %g 秒内未就绪，按配置继续：%s", config.server_ready_timeout, endpoint.url
+            )
+            return endpoint
+        info = await fetch_server_info(client)
+
+    if info is None or info.total_slots is None:
+        logger.info("端点 %s 未提供槽位信息（/props），按配置并发 %d", endpoint.url, endpoint.max_concurrency)
+        return endpoint
+    logger.info(
+        "端点 %s：服务端槽位 %d，上下文 %s，模型 %s",
+        endpoint.url,
+        info.total_slots,
+        info.n_ctx if info.n_ctx is not None else "未知",
+        info.model_path or "未知",
+    )
+    max_concurrency = endpoint.max_concurrency
+    if config.auto_concurrency:
+        # 显式指定的并发数只下调到槽位数（多出的请求只会在服务端排队），未指定时取槽位数
+        if endpoint.concurrency_configured:
+            max_concurrency = min(max_concurrency, info.total_slots)
+        else:
+            max_concurrency = info.total_slots
+    logger.info(
+        "端点 %s：使用并发 %d（%s %d，服务端槽位 %d）",
+        endpoint.url,
+        max_concurrency,
+        "配置" if endpoint.concurrency_configured else "默认",
+        endpoint.max_concurrency,
+        info.total_slots,
+    )
+    return dataclasses.replace(endpoint, max_concurrency=max_concurrency, slots=info.total_slots)
+
+
+async def probe_servers(config: AppConfig) -> AppConfig:
+    """启动时探测各 OCR 端点：等待就绪，读取槽位数并据此调整并发，返回更新后的配置。
+
+    探测结果中的槽位数同时用于槽位绑定（见 Endpoint.take_slot）。
+    """
+    if config.server_ready_timeout <= 0 and not config.auto_concurrency and not config.slot_pinning:
+        return config
+    endpoints: List[EndpointConfig] = await asyncio.gather(
+        *(_probe_endpoint(ep, config) for ep in config.endpoint_configs())
+    )
+    if config.ocr_endpoints:
+        return dataclasses.replace(config, ocr_endpoints=endpoints)
+    return dataclasses.replace(
+        config,
+        max_concurrency=endpoints[0].max_concurrency,
+        server_slots=endpoints[0].slots,
+    )
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 检测的最大重复周期（字符数）
+_MAX_PERIOD = 200
+# 每新增多少字符检查一次重复，避免每个 token 都扫描一遍尾部
+_CHECK_EVERY_CHARS = 64
+
+
+class StreamAborted(Exception):
+    """流式响应在首 token / token 间隔超时时中止，保留已收到的部分文本"""
+
+    def __init__(self, reason: str, partial_text: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.partial_text = partial_text
+
+
+class RepetitionDetector:
+    """检测模型输出尾部的失控重复（复读循环）。
+
+    当文本末尾某个长度不超过 200 字符的片段连续重复至少 min_repeats 次、
+    且重复部分总长度不少于 min_chars 时判定为复读。
+    min_repeats 小于 2（如 0）时关闭检测。
+    """
+
+    def __init__(self, min_repeats: int, min_chars: int) -> None:
+        self.min_repeats = min_repeats
+        self.min_chars = min_chars
+        self._checked_len = 0
+
+    def check(self, text: str) -> Optional[int]:
+        """检查累积文本；判定为复读时返回应保留的长度（保留一次重复片段），否则返回 None"""
+        if self.min_repeats < 2 or len(text) - self._checked_len < _CHECK_EVERY_CHARS:
+            return None
+        self._checked_len = len(text)
+
+        last = text[-1]
+        for period in range(1, min(_MAX_PERIOD, len(text) // self.min_repeats) + 1):
+            if text[-1 - period] != last:
+                continue
+            span = max(period * self.min_repeats, self.min_chars)
+            if span > len(text):
+                continue
+            tail = text[-span:]
+            if tail[:-period] == tail[period:]:
+                # 向前扩展到重复区间的起点，只保留其中一个周期
+                start = len(text) - span
+                while start > 0 and text[start - 1] == text[start - 1 + period]:
+                    start -= 1
+                return start + period
+        return None
+
+
+def parse_sse_line(line: str) -> Optional[Dict[str, Any]]:
+    """解析一行 SSE 数据；非数据行返回 None，流结束标记返回空字典"""
+    if not line.startswith("data:"):
+        return None
+    payload = line[len("data:"):].strip()
+    if not payload:
+        return None
+    if payload == "[DONE]":
+        return {}
+    try:
+        return json.loads(payload)
+    except json.JSONDecodeError:
+        logger.debug("忽略无法解析的 SSE 数据：%s", payload[:200])
+        return None
@@ -3,18 +3,35 @@ from __future__ import annotations
 import asyncio
 import logging
 import time
-from typing import List, Tuple
+from dataclasses import replace
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 from pdf_ocr_md.config import AppConfig
-from pdf_ocr_md.markdown.postprocess import postprocess_markdown
-from pdf_ocr_md.markdown.writer import build_markdown
-from pdf_ocr_md.ocr.client import OcrClient
+from pdf_ocr_md.dedup import DocumentDeduplicator, PageDeduplicator, copy_markdown
+from pdf_ocr_md.distributed import DistributedCoordinator, WorkUnit, default_worker_id
+from pdf_ocr_md.manifest import InputManifest
+from pdf_ocr_md.metrics import RunMetrics, merge_timings, timed
+from pdf_ocr_md.markdown.stitch import stitch_tiles
+from pdf_ocr_md.markdown.writer import StreamingMarkdownWriter
+from pdf_ocr_md.ocr.batching import BatchingOptions, OcrBatcher, estimate_image_tokens
+from pdf_ocr_md.ocr.client import CONTEXT_EXCEEDED_ERROR, OcrClient, PreparedRequest
+from pdf_ocr_md.ocr.limiter import AdaptiveLimiter
 from pdf_ocr_md.ocr.prompts import get_prompt
-from pdf_ocr_md.pdf.loader import get_pdf_page_count
-from pdf_ocr_md.pdf.renderer import render_page_to_png_bytes
-from pdf_ocr_md.pdf.scanner import scan_pdfs
-from pdf_ocr_md.state_manager import load_state, save_state, clear_state, BatchStateManager
-from pdf_ocr_md.types_ import FileConvertResult, PageOcrResult, PdfTask, ConversionState
+from pdf_ocr_md.ocr.server_probe import probe_servers
+from pdf_ocr_md.page_store import PageResultStore, clear_page_store
+from pdf_ocr_md.pdf.blank import BlankPageOptions, numpy_available
+from pdf_ocr_md.pdf.loader import compute_pdf_hash
+from pdf_ocr_md.pdf.probe import PdfMetadataIndex, PdfProber, probe_pdf
+from pdf_ocr_md.pdf.render_pool import RenderedPage, RenderPool
+from pdf_ocr_md.pdf.renderer import RenderOptions, webp_available
+from pdf_ocr_md.pdf.scanner import iter_pdf_tasks
+from pdf_ocr_md.pdf.text_layer import TextLayerOptions
+from pdf_ocr_md.scheduler import PageScheduler, ScheduledGate
+from pdf_ocr_md.state_manager import BatchStateManager, StateStore, worker_state_db_path
+from pdf_ocr_md.tiling import FULL_PAGE, Band, TilingOptions, estimate_tile_count, split_band
+from pdf_ocr_md.types_ import FileConvertResult, PageOcrResult, PdfMetadata, PdfTask, ConversionState
 
 
 logger = logging.getLogger(__name__)
@@ -24,49 +41,98 @@ async def _process_single_pdf(
     pdf_task: PdfTask,
     config: AppConfig,
     client: OcrClient,
-    semaphore: asyncio.Semaphore,
+    render_pool: RenderPool,
+    semaphore: asyncio.Semaphore | AdaptiveLimiter | ScheduledGate,
+    state_store: StateStore,
     force_restart: bool = False,
+    manifest: InputManifest | None = None,
+    page_dedup: PageDeduplicator | None = None,
+    metrics: RunMetrics | None = None,
+    scheduler: PageScheduler | None = None,
+    unit: WorkUnit | None = None,
 ) -> FileConvertResult:
+    """转换单个 PDF。
+
+    分布式模式下传入 unit，只处理其页段：状态与页结果存储以页段为键，
+    不写出 Markdown（由合并进程在全部页段完成后统一写出）。
+    """
     start = time.perf_counter()
-    page_results: List[PageOcrResult] = []
+    page_results: List[PageOcrResult]
     error: str | None = None
 
     prompt = get_prompt(config.ocr_prompt_preset)
 
+    # 元数据通常已由扫描阶段的探测进程池填好；直接调用时在此补探测
+    if pdf_task.metadata is None:
+        try:
+            pdf_task.metadata = await asyncio.to_thread(probe_pdf, pdf_task.pdf_path)
+        except OSError as exc:
+            pdf_task.metadata = PdfMetadata(error=f"无法读取 PDF：{exc}")
+    # 加密或损坏的 PDF 直接失败，不创建状态文件，也不占用渲染与 OCR 槽位
+    if pdf_task.metadata.error is not None:
+        logger.error("跳过无法处理的 PDF：%s：%s", pdf_task.pdf_path, pdf_task.metadata.error)
+        return FileConvertResult(
+            pdf_task=pdf_task,
+            page_results=[],
+            success=False,
+            error=pdf_task.metadata.error,
+            elapsed_seconds=time.perf_counter() - start,
+        )
+    if pdf_task.metadata.repaired:
+        logger.warning("PDF 结构有损坏，已由 PyMuPDF 自动修复：%s", pdf_task.pdf_path)
+
     # 加载或初始化状态
+    state_key = unit.state_path if unit is not None else pdf_task.output_md_path
     if force_restart:
-        clear_state(pdf_task.output_md_path)
-    state = load_state(pdf_task.output_md_path, pdf_path=pdf_task.pdf_path)
+        await state_store.clear(state_key)
+        clear_page_store(state_key)
+    state = await state_store.load(state_key, pdf_task.pdf_path)
 
     # 确保输出目录存在（提前创建，避免状态文件写入失败）
     pdf_task.output_md_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # 获取页数（同步操作，放到线程池）
     batch_manager = None
     try:
-        num_pages = await asyncio.to_thread(get_pdf_page_count, pdf_task.pdf_path)
+        num_pages = pdf_task.metadata.page_count
         pdf_task.num_pages = num_pages
         state.total_pages = num_pages
-        logger.info("开始处理 PDF：%s（%d 页）", pdf_task.pdf_path, num_pages)
-
-        # 如果已完成，直接返回
-        if state.is_complete:
-            logger.info("PDF 已完成，跳过：%s", pdf_task.pdf_path)
-            return FileConvertResult(
-                pdf_task=pdf_task,
-                page_results=[],
-                success=True,
-                error=None,
-                elapsed_seconds=0.0,
-            )
+        if unit is not None:
+            logger.info("开始处理 PDF：%s（%d 页，第 %d~%d 页）", pdf_task.pdf_path, num_pages, unit.first_page, unit.last_page)
+        else:
+            logger.info("开始处理 PDF：%s（%d 页）", pdf_task.pdf_path, num_pages)
+
+        # 加载页级结果存储：以 PDF 内容哈希 + 模型 + 提示词为键
+        if pdf_task.content_hash is None:
+            pdf_task.content_hash = await asyncio.to_thread(compute_pdf_hash, pdf_task.pdf_path)
+        page_store = PageResultStore(
+            state_key,
+            pdf_hash=pdf_task.content_hash,
+            model=config.model,
+            prompt_preset=config.ocr_prompt_preset,
+        )
+        stored_pages = await asyncio.to_thread(page_store.load_index)
+
+        # 以页结果存储为准校正状态：
+        # - 存储中已有文本的页视为已完成（可能在状态批量写入前崩溃）；
+        # - 状态中标记完成但没有文本的页需要重新 OCR，避免输出丢失内容
+        stored_pages = {p for p in stored_pages if 1 <= p <= num_pages}
+        lost_pages = sorted(state.completed_pages - stored_pages)
+        if lost_pages:
+            logger.warning("以下已完成页缺少 OCR 结果，将重新处理：%s", lost_pages)
+        state.completed_pages = set(stored_pages)
+        state.failed_pages -= state.completed_pages
+
+        if state.is_complete and unit is None:
+            logger.info("PDF 所有页面均已有结果，直接重建 Markdown：%s", pdf_task.pdf_path)
 
         # 创建批量状态管理器：根据总页数动态调整批次大小
         batch_size = min(5, max(1, num_pages // 10)) if num_pages else 5
-        batch_manager = BatchStateManager(state, pdf_task.output_md_path, batch_size=batch_size)
+        batch_manager = BatchStateManager(state, state_store, state_key, batch_size=batch_size)
+        state_store.start_document(state_key, pdf_task.pdf_path, num_pages)
         logger.info("PDF %s：总页数 %d，批次大小 %d", pdf_task.pdf_path.name, num_pages, batch_size)
     except Exception as exc:
         error = str(exc)
-        logger.exception("获取 PDF 页数失败：%s", pdf_task.pdf_path)
+        logger.exception("初始化 PDF 处理失败：%s", pdf_task.pdf_path)
         elapsed = time.perf_counter() - start
         return FileConvertResult(
             pdf_task=pdf_task,
@@ -88,66 +154,339 @@ async def _process_single_pdf(
 
     # 只处理待处理的页
     pending_pages = state.pending_pages
+    if unit is not None:
+        pending_pages = [p for p in pending_pages if unit.contains(p)]
     if not pending_pages:
         logger.info("没有待处理的页面：%s", pdf_task.pdf_path)
     else:
         logger.info("待处理页面：%s", pending_pages)
+    if metrics is not None:
+        metrics.expect_pages(len(pending_pages))
+    # 在全局页面调度器中登记：渲染与 OCR 槽位紧张时，按策略决定本文档页面的先后
+    ticket = scheduler.register(pdf_task.pdf_path, len(pending_pages)) if scheduler is not None else None
+    ocr_slot = semaphore.for_document(ticket) if isinstance(semaphore, ScheduledGate) else semaphore
+
+    # 增量写出 Markdown：先提交此前已完成的页与历史失败页，本次处理的页到达后按页序追加
+    # 分布式模式下只保存页结果，Markdown 由合并进程写出
+    writer = StreamingMarkdownWriter(pdf_task, num_pages, page_store) if unit is None else None
+    writer_errors: List[str] = []
+    pending_set = set(pending_pages)
+
+    def prime_writer() -> None:
+        if writer is None:
+            return
+        writer.open()
+        for p in range(1, num_pages + 1):
+            if p in state.completed_pages:
+                writer.add_stored(p)
+            elif p in state.failed_pages and p not in pending_set:
+                writer.add(PageOcrResult(page_number=p, text=None, success=False, error="Failed"))
+
+    async def write_page(result: PageOcrResult) -> None:
+        if writer is None or writer_errors:
+            return
+        try:
+            await asyncio.to_thread(writer.add, result)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("增量写出 Markdown 失败：%s", writer.partial_path)
+            writer_errors.append(str(exc))
 
-    # 创建所有待处理页的 OCR 任务（并发执行，共享全局信号量）
-    async def ocr_one_page(page_number: int) -> PageOcrResult:
-        async with semaphore:  # 全局信号量控制
-            try:
-                logger.info(
-                    "开始 OCR：%s Page %d/%d",
-                    pdf_task.pdf_path,
-                    page_number,
-                    num_pages,
-                )
-                image_bytes = await asyncio.to_thread(
-                    render_page_to_png_bytes,
-                    pdf_task.pdf_path,
-                    page_number,
-                )
-                result = await client.ocr_page(
-                    image_bytes=image_bytes,
-                    page_number=page_number,
-                    prompt=prompt,
+    try:
+        await asyncio.to_thread(prime_writer)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("增量写出 Markdown 失败：%s", pdf_task.output_md_path)
+        writer_errors.append(str(exc))
+
+    # 渲染阶段（生产者）与 OCR 阶段（消费者）通过队列解耦：
+    # 渲染在独立的渲染池中进行，不占用 OCR 并发槽位；队列中的图片数受渲染槽位限制
+    tiling = (
+        TilingOptions(max_tiles=config.tiling_max_tiles, overlap=config.tiling_overlap)
+        if config.tiling_enabled
+        else None
+    )
+
+    batching = (
+        BatchingOptions(
+            max_pages=config.batching_max_pages,
+            max_image_tokens=config.batching_max_image_tokens,
+            pixels_per_token=config.batching_pixels_per_token,
+        )
+        if config.batching_enabled and config.batching_max_pages > 1
+        else None
+    )
+    batcher = (
+        OcrBatcher(client, ocr_slot, prompt, batching)
+        if batching is not None
+        else None
+    )
+
+    def image_tokens(page_number: int) -> int:
+        assert batching is not None and pdf_task.metadata is not None
+        return estimate_image_tokens(
+            pdf_task.metadata.page_sizes[page_number - 1], render_pool.options, batching.pixels_per_token
+        )
+
+    async def ocr_request(request: PreparedRequest, page_number: int) -> PageOcrResult:
+        # 单次 OCR 请求，占用全局 OCR 并发槽位
+        wait_start = time.perf_counter()
+        async with ocr_slot:
+            waited = time.perf_counter() - wait_start
+            result = await client.complete(request, page_number)
+        result.timings["ocr_wait"] = result.timings.get("ocr_wait", 0.0) + waited
+        return result
+
+    async def ocr_tiled(page_number: int, band: Band, failed: PageOcrResult) -> PageOcrResult:
+        # 上下文超限：把条带切成带重叠的水平块并发 OCR，按阅读顺序拼接；块仍超限时继续细分
+        assert tiling is not None
+        bands = split_band(band, estimate_tile_count(failed.raw_response, tiling.max_tiles), tiling)
+        if not bands:
+            logger.warning("页面已达最大分块数仍超出上下文：%s Page %d", pdf_task.pdf_path, page_number)
+            return failed
+        logger.info(
+            "页面超出上下文，切分为 %d 块重新 OCR：%s Page %d（条带 %.2f~%.2f）",
+            len(bands),
+            pdf_task.pdf_path,
+            page_number,
+            band[0],
+            band[1],
+        )
+        timings = dict(failed.timings)
+        with timed(timings, "tile_render"):
+            tiles: List[Optional[bytes]] = list(await render_pool.render_tiles(pdf_task.pdf_path, page_number, bands))
+
+        async def ocr_tile(index: int, tile_band: Band) -> PageOcrResult:
+            request = await client.prepare_page(tiles[index], prompt, render_pool.options.mime_type)
+            # 块图片已编码进请求体，释放原始图片
+            tiles[index] = None
+            tile_result = await ocr_request(request, page_number)
+            del request
+            if tile_result.error == CONTEXT_EXCEEDED_ERROR:
+                tile_result = await ocr_tiled(page_number, tile_band, tile_result)
+            return tile_result
+
+        tile_results = await asyncio.gather(*(ocr_tile(i, b) for i, b in enumerate(bands)))
+        # 各块的耗时与计数累加到整页（含最初超限的整页请求）
+        for r in tile_results:
+            merge_timings(timings, r.timings)
+        counters = {
+            "attempts": failed.attempts + sum(r.attempts for r in tile_results),
+            "timings": timings,
+            "bytes_sent": failed.bytes_sent + sum(r.bytes_sent for r in tile_results),
+        }
+        for key in ("prompt_tokens", "completion_tokens"):
+            values = [v for v in (getattr(r, key) for r in (failed, *tile_results)) if v is not None]
+            counters[key] = sum(values) if values else None
+        failed_tile = next((r for r in tile_results if not r.success), None)
+        if failed_tile is not None:
+            return PageOcrResult(
+                page_number=page_number,
+                text=None,
+                success=False,
+                error=f"分块 OCR 失败: {failed_tile.error}",
+                **counters,
+            )
+        return PageOcrResult(
+            page_number=page_number,
+            text=stitch_tiles([r.text or "" for r in tile_results]),
+            success=True,
+            truncated=next((r.truncated for r in tile_results if r.truncated), None),
+            tiles=sum(r.tiles or 1 for r in tile_results),
+            **counters,
+        )
+
+    async def ocr_image(rendered: RenderedPage) -> PageOcrResult:
+        # 对渲染好的图片执行 OCR，请求期间占用全局 OCR 并发槽位
+        page_number = rendered.page_number
+        try:
+            if batcher is not None:
+                # 批量模式：与同时等待槽位的其他页合并请求，槽位由批量器占用
+                ocr_start = time.perf_counter()
+                image = await client.encode_image(rendered.image_bytes, render_pool.options.mime_type)
+                # 图片已编码，批量器只保留编码结果（供合并请求与退回单页请求复用）
+                rendered.image_bytes = None
+                result = await batcher.ocr(page_number, image, image_tokens(page_number))
+                del image
+                # 批量器内部的排队与槽位等待 = 总耗时 - 请求本身的耗时
+                client_seconds = sum(
+                    result.timings.get(stage, 0.0) for stage in ("request_build", "request", "retry_backoff")
                 )
-                if result.success:
+                result.timings["ocr_wait"] = max(0.0, time.perf_counter() - ocr_start - client_seconds)
+            else:
+                # 在等待槽位前构造好请求体，图片编码进请求体后即释放；各次重试复用同一份请求体
+                request = await client.prepare_page(rendered.image_bytes, prompt, render_pool.options.mime_type)
+                rendered.image_bytes = None
+                wait_start = time.perf_counter()
+                async with ocr_slot:  # 全局 OCR 槽位（按调度策略分配）
                     logger.info(
-                        "完成 OCR：%s Page %d",
+                        "开始 OCR：%s Page %d/%d",
                         pdf_task.pdf_path,
                         page_number,
+                        num_pages,
                     )
-                    # 使用批量管理器更新状态
-                    batch_manager.add_completed(page_number)
-                else:
-                    logger.warning(
-                        "OCR 失败：%s Page %d：%s",
-                        pdf_task.pdf_path,
-                        page_number,
-                        result.error,
+                    ocr_start = time.perf_counter()
+                    result = await client.complete(request, page_number)
+                del request
+                result.timings["ocr_wait"] = ocr_start - wait_start
+            if tiling is not None and result.error == CONTEXT_EXCEEDED_ERROR:
+                # 分块从 PDF 按原缩放比例重新渲染（整页图片在编码后已释放）
+                result = await ocr_tiled(page_number, FULL_PAGE, result)
+            ocr_elapsed = time.perf_counter() - ocr_start
+            if result.success:
+                logger.info(
+                    "完成 OCR：%s Page %d",
+                    pdf_task.pdf_path,
+                    page_number,
+                )
+                if result.truncated:
+                    # 截断结果保留已生成的文本，并在页末注明，便于人工复核
+                    result.text = (
+                        f"{(result.text or '').rstrip()}\n\n"
+                        f"> [OCR TRUNCATED] Page {page_number}: {result.truncated}"
                     )
-                    batch_manager.add_failed(page_number)
-                return result
-            except Exception as exc:  # noqa: BLE001
-                logger.exception(
-                    "处理页面失败：%s Page %d",
+                # 先持久化页文本，再更新状态，保证状态中的完成页一定有结果可用
+                with timed(result.timings, "store"):
+                    await asyncio.to_thread(page_store.put, page_number, result.text or "")
+                # 原始响应不再需要，尽早释放
+                result.raw_response = None
+                # 使用批量管理器更新状态
+                batch_manager.add_completed(
+                    page_number, attempts=result.attempts, elapsed_seconds=ocr_elapsed, source="ocr"
+                )
+            else:
+                logger.warning(
+                    "OCR 失败：%s Page %d：%s",
                     pdf_task.pdf_path,
                     page_number,
+                    result.error,
                 )
-                result = PageOcrResult(
-                    page_number=page_number,
-                    text=None,
-                    success=False,
-                    error=str(exc),
+                batch_manager.add_failed(
+                    page_number, error=result.error, attempts=result.attempts, elapsed_seconds=ocr_elapsed
                 )
-                batch_manager.add_failed(page_number)
+            return result
+        except Exception as exc:  # noqa: BLE001
+            logger.exception(
+                "处理页面失败：%s Page %d",
+                pdf_task.pdf_path,
+                page_number,
+            )
+            result = PageOcrResult(
+                page_number=page_number,
+                text=None,
+                success=False,
+                error=str(exc),
+            )
+            batch_manager.add_failed(page_number, error=str(exc))
+            return result
+
+    async def ocr_rendered_page(rendered: RenderedPage) -> PageOcrResult:
+        page_number = rendered.page_number
+        if rendered.text is not None:
+            # 混合模式：文本层质量达标，直接使用直抽文本，不占用 OCR 槽位
+            logger.info("文本层直抽：%s Page %d", pdf_task.pdf_path, page_number)
+            result = PageOcrResult(page_number=page_number, text=rendered.text, success=True, source="text_layer")
+            with timed(result.timings, "store"):
+                await asyncio.to_thread(page_store.put, page_number, rendered.text)
+            batch_manager.add_completed(page_number, attempts=0, source="text_layer")
+            return result
+
+        if rendered.blank:
+            # 空白页：渲染进程内的像素统计已判定无内容，不送 OCR
+            logger.info("空白页，跳过 OCR：%s Page %d", pdf_task.pdf_path, page_number)
+            blank_text = f"> [BLANK PAGE] Page {page_number}"
+            result = PageOcrResult(page_number=page_number, text=blank_text, success=True, source="blank")
+            with timed(result.timings, "store"):
+                await asyncio.to_thread(page_store.put, page_number, blank_text)
+            batch_manager.add_completed(page_number, attempts=0, source="blank")
+            return result
+
+        if rendered.image_bytes is None:
+            render_error = f"页面渲染失败: {rendered.error}"
+            batch_manager.add_failed(page_number, error=render_error, attempts=0)
+            return PageOcrResult(
+                page_number=page_number,
+                text=None,
+                success=False,
+                error=render_error,
+            )
+
+        image_hash = rendered.image_hash if page_dedup is not None else None
+        if image_hash is not None:
+            # 页面级去重：相同图片只 OCR 一次，重复页直接复用结果
+            dup_text, _ = await page_dedup.claim(image_hash)
+            if dup_text is not None:
+                logger.info("重复页面，复用相同图片的 OCR 结果：%s Page %d", pdf_task.pdf_path, page_number)
+                result = PageOcrResult(page_number=page_number, text=dup_text, success=True, source="dedup")
+                with timed(result.timings, "store"):
+                    await asyncio.to_thread(page_store.put, page_number, dup_text)
+                batch_manager.add_completed(page_number, attempts=0, source="dedup")
                 return result
 
-    # 并发执行待处理页的 OCR 任务
-    page_tasks = [ocr_one_page(p) for p in pending_pages]
-    page_results = await asyncio.gather(*page_tasks)
+        result: PageOcrResult | None = None
+        try:
+            result = await ocr_image(rendered)
+            return result
+        finally:
+            if image_hash is not None:
+                reusable = result is not None and result.success and not result.truncated
+                page_dedup.resolve(image_hash, result.text if reusable else None)
+
+    page_results = []
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce() -> None:
+        # 元数据显示整本没有文本层（纯扫描件）时，跳过逐页的文本层检查
+        await render_pool.feed(
+            pdf_task.pdf_path,
+            pending_pages,
+            queue,
+            use_text_layer=pdf_task.metadata.has_text_layer,
+            ticket=ticket,
+        )
+
+    async def consume() -> None:
+        while True:
+            rendered = await queue.get()
+            if rendered is None:
+                return
+            try:
+                rendered.timings["queue_wait"] = time.perf_counter() - rendered.ready_at
+                result = await ocr_rendered_page(rendered)
+                if ticket is not None:
+                    ticket.page_done()
+                merge_timings(result.timings, rendered.timings)
+                with timed(result.timings, "write"):
+                    await write_page(result)
+                if metrics is not None:
+                    metrics.record_page(pdf_task.pdf_path, result)
+                # 页文本已持久化并交给写出器，释放内存
+                result.text = None
+                page_results.append(result)
+            finally:
+                # 释放图片并归还渲染槽位，让生产者继续预渲染
+                rendered.image_bytes = None
+                render_pool.release()
+
+    if pending_pages:
+        consumer_count = min(config.pages_in_flight, len(pending_pages))
+        consumers = [asyncio.create_task(consume()) for _ in range(consumer_count)]
+        try:
+            await produce()
+            for _ in consumers:
+                await queue.put(None)
+            await asyncio.gather(*consumers)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            raise
+        finally:
+            for task in consumers:
+                task.cancel()
+            # 中途取消时队列中可能还有已渲染的页，归还其渲染槽位
+            while not queue.empty():
+                if queue.get_nowait() is not None:
+                    render_pool.release()
+            # 本 PDF 的页面已全部渲染完毕，释放打开的文档
+            render_pool.close_document(pdf_task.pdf_path)
 
     # 强制写入剩余状态（程序退出前）
     batch_manager.force_flush()
@@ -156,46 +495,68 @@ async def _process_single_pdf(
     # 无需再从磁盘重新读取，直接复用内存对象即可
     final_state = state
 
-    # 构建完整页结果列表（按页号排序）
+    # 构建完整页结果列表（按页号排序，仅含状态信息，页文本已写入 Markdown）
     all_page_results: List[PageOcrResult] = []
-    
-    # 创建页号到结果的映射
     page_result_map = {result.page_number: result for result in page_results}
-    
-    for p in range(1, num_pages + 1):
-        if p in final_state.completed_pages:
-            # 已完成的页，使用本次运行的 OCR 结果
-            if p in page_result_map:
-                all_page_results.append(page_result_map[p])
-            else:
-                # 如果是之前完成的页，创建一个空的成功结果（这种情况应该很少见）
-                all_page_results.append(PageOcrResult(page_number=p, text="", success=True))
+    page_range = range(unit.first_page, unit.last_page + 1) if unit is not None else range(1, num_pages + 1)
+    for p in page_range:
+        if p in page_result_map:
+            all_page_results.append(page_result_map[p])
+        elif p in final_state.completed_pages:
+            all_page_results.append(PageOcrResult(page_number=p, text=None, success=True))
         elif p in final_state.failed_pages:
             all_page_results.append(PageOcrResult(page_number=p, text=None, success=False, error="Failed"))
         else:
-            # 在本次运行中处理的结果
-            if p in page_result_map:
-                all_page_results.append(page_result_map[p])
-            else:
-                # 未处理的页
-                all_page_results.append(PageOcrResult(page_number=p, text=None, success=False, error="Not processed"))
+            all_page_results.append(PageOcrResult(page_number=p, text=None, success=False, error="Not processed"))
 
     elapsed = time.perf_counter() - start
-    success = error is None and final_state.is_complete
-
-    try:
-        markdown = build_markdown(pdf_task, all_page_results)
-        markdown = postprocess_markdown(markdown)
-        pdf_task.output_md_path.parent.mkdir(parents=True, exist_ok=True)
-        pdf_task.output_md_path.write_text(markdown, encoding="utf-8")
-        logger.info("写入 Markdown：%s", pdf_task.output_md_path)
-        # 完成后清理状态文件
-        if final_state.is_complete:
-            clear_state(pdf_task.output_md_path)
-    except Exception as exc:  # noqa: BLE001
-        logger.exception("写入 Markdown 失败：%s", pdf_task.output_md_path)
-        error = (error or "") + f"; markdown 写入失败: {exc}"
-        success = False
+    if unit is not None:
+        success = error is None and all(p in final_state.completed_pages for p in page_range)
+    else:
+        success = error is None and final_state.is_complete
+    text_layer_page_count = sum(1 for r in page_results if r.source == "text_layer")
+    dedup_page_count = sum(1 for r in page_results if r.source == "dedup")
+    blank_page_count = sum(1 for r in page_results if r.source == "blank")
+    tiled_page_count = sum(1 for r in page_results if r.tiles)
+    batched_page_count = sum(1 for r in page_results if r.batch_size > 1)
+    ocr_page_count = len(page_results) - text_layer_page_count - dedup_page_count - blank_page_count
+    truncated_page_count = sum(1 for r in page_results if r.truncated)
+
+    file_timings: Dict[str, float] = {}
+    if ticket is not None:
+        for gate, seconds in ticket.waits.items():
+            file_timings[f"{gate}_queue_wait"] = seconds
+        if ticket.waits:
+            logger.info(
+                "排队等待（各页累计）：%s 渲染槽位 %.2f 秒，OCR 槽位 %.2f 秒（单页最长 %.2f / %.2f 秒）",
+                pdf_task.pdf_path,
+                ticket.waits.get("render", 0.0),
+                ticket.waits.get("ocr", 0.0),
+                ticket.max_waits.get("render", 0.0),
+                ticket.max_waits.get("ocr", 0.0),
+            )
+    if writer is None:
+        # 分布式模式：页段的页结果存储保留到合并完成
+        if success:
+            state_store.complete_document(state_key)
+    else:
+        try:
+            if writer_errors:
+                raise RuntimeError(writer_errors[0])
+            with timed(file_timings, "finalize"):
+                await asyncio.to_thread(writer.finalize)
+            logger.info("写入 Markdown：%s", pdf_task.output_md_path)
+            # 完成后在状态库中标记完成，并清理页结果存储
+            if final_state.is_complete:
+                state_store.complete_document(pdf_task.output_md_path)
+                page_store.clear()
+                if manifest is not None:
+                    manifest.record(pdf_task.pdf_path, pdf_task.content_hash)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("写入 Markdown 失败：%s", pdf_task.output_md_path)
+            error = (error or "") + f"; markdown 写入失败: {exc}"
+            success = False
+            writer.close()
 
     return FileConvertResult(
         pdf_task=pdf_task,
@@ -203,46 +564,406 @@ async def _process_single_pdf(
         success=success,
         error=error,
         elapsed_seconds=elapsed,
+        ocr_page_count=ocr_page_count,
+        text_layer_page_count=text_layer_page_count,
+        truncated_page_count=truncated_page_count,
+        dedup_page_count=dedup_page_count,
+        blank_page_count=blank_page_count,
+        tiled_page_count=tiled_page_count,
+        batched_page_count=batched_page_count,
+        timings=file_timings,
+    )
+
+
+async def _reuse_duplicate_pdf(
+    pdf_task: PdfTask,
+    doc_dedup: DocumentDeduplicator,
+    manifest: InputManifest | None = None,
+) -> FileConvertResult | None:
+    """整本去重：内容相同的 PDF 已转换过时直接复制其 Markdown。
+
+    返回 None 表示需要正常转换，此时调用方负责在转换结束后调用 doc_dedup.finish()。
+    """
+    if pdf_task.metadata is None or pdf_task.metadata.error is not None:
+        return None
+    start = time.perf_counter()
+    if pdf_task.content_hash is None:
+        pdf_task.content_hash = await asyncio.to_thread(compute_pdf_hash, pdf_task.pdf_path)
+    source = await doc_dedup.find_source(pdf_task)
+    if source is None:
+        return None
+
+    num_pages = pdf_task.metadata.page_count
+    try:
+        await asyncio.to_thread(copy_markdown, source, pdf_task)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("复制重复 PDF 的 Markdown 失败：%s → %s", source, pdf_task.output_md_path)
+        return FileConvertResult(
+            pdf_task=pdf_task,
+            success=False,
+            error=f"复制重复 PDF 的 Markdown 失败: {exc}",
+            elapsed_seconds=time.perf_counter() - start,
+        )
+    logger.info("PDF 内容重复，复用已有转换结果：%s ← %s（省去 %d 页 OCR）", pdf_task.output_md_path, source, num_pages)
+    if manifest is not None:
+        manifest.record(pdf_task.pdf_path, pdf_task.content_hash)
+    return FileConvertResult(
+        pdf_task=pdf_task,
+        success=True,
+        elapsed_seconds=time.perf_counter() - start,
+        dedup_page_count=num_pages,
+        duplicate_of=source,
+    )
+
+
+def _report_paths(config: AppConfig) -> Tuple[Path | None, Path | None, Path | None, Path | None]:
+    """运行报告路径 (JSON, 逐页 CSV, 逐文件 CSV, Prometheus)：JSON/CSV 默认写入输出目录，Prometheus 需显式配置"""
+    if not config.report_enabled:
+        return None, None, None, None
+    # 分布式模式下各工作进程共享输出目录，默认报告文件名带上工作进程标识
+    tag = f".{config.distributed_worker_id}" if config.distributed_enabled else ""
+    json_path = (
+        Path(config.report_json_path) if config.report_json_path else config.output_dir / f".convert_report{tag}.json"
+    )
+    csv_path = Path(config.report_csv_path) if config.report_csv_path else config.output_dir / f".convert_pages{tag}.csv"
+    files_csv_path = (
+        Path(config.report_files_csv_path)
+        if config.report_files_csv_path
+        else config.output_dir / f".convert_files{tag}.csv"
+    )
+    prometheus_path = Path(config.report_prometheus_path) if config.report_prometheus_path else None
+    return json_path, csv_path, files_csv_path, prometheus_path
+
+
+def _log_schedule_summary(results: List[FileConvertResult], policy: str) -> None:
+    """按文档统计完成用时与排队等待，用于比较不同调度策略的效果"""
+    scheduled = [r for r in results if r.duplicate_of is None and r.timings]
+    if not scheduled:
+        return
+    elapsed = sorted(r.elapsed_seconds for r in scheduled)
+    waits = [r.timings.get("render_queue_wait", 0.0) + r.timings.get("ocr_queue_wait", 0.0) for r in scheduled]
+    logger.info(
+        "页面调度（%s）：%d 个文档平均完成用时 %.1f 秒（中位数 %.1f，最长 %.1f），各页排队累计平均 %.1f 秒/文档（最多 %.1f 秒）",
+        policy,
+        len(scheduled),
+        sum(elapsed) / len(elapsed),
+        elapsed[len(elapsed) // 2],
+        elapsed[-1],
+        sum(waits) / len(waits),
+        max(waits),
+    )
+
+
+def _log_stage_summary(metrics: RunMetrics) -> None:
+    """按累计耗时从高到低输出各阶段耗时，便于定位吞吐瓶颈"""
+    summary = metrics.summary()
+    stages = sorted(summary["stages"].items(), key=lambda item: item[1]["total_s"], reverse=True)
+    if not stages:
+        return
+    logger.info(
+        "阶段耗时（累计秒 / p50 / p95 毫秒）：%s",
+        "，".join(f"{name} {s['total_s']:.1f}/{s['p50_ms']:.0f}/{s['p95_ms']:.0f}" for name, s in stages),
+    )
+    counters = summary["counters"]
+    logger.info(
+        "请求体 %.1f MB，重试 %d 次，提示词 token %d，生成 token %d",
+        counters["bytes_sent"] / 1e6,
+        counters["retries"],
+        counters["prompt_tokens"],
+        counters["completion_tokens"],
     )
 
 
 async def run(config: AppConfig, force_restart: bool = False) -> Tuple[List[FileConvertResult], dict]:
     """运行完整的 PDF → Markdown 转换流程。"""
 
-    pdf_tasks = scan_pdfs(config.input_dir, config.output_dir)
-    if not pdf_tasks:
-        logger.warning("在目录 %s 下未发现任何 PDF 文件", config.input_dir)
-        return [], {
-            "total_files": 0,
-            "success_count": 0,
-            "failed_count": 0,
-            "total_seconds": 0.0,
-            "avg_seconds_per_file": 0.0,
-        }
+    distributed = config.distributed_enabled
+    if distributed:
+        config = replace(config, distributed_worker_id=config.distributed_worker_id or default_worker_id())
+        if force_restart:
+            # 其他工作进程可能正在使用共享的页结果，不能由单个进程清除
+            logger.warning("分布式模式不支持 --force-restart，已忽略")
+            force_restart = False
+    if config.blank_enabled and not numpy_available():
+        logger.warning("未安装 NumPy（pip install numpy），已关闭空白页检测")
+        config = replace(config, blank_enabled=False)
+    if config.image_format == "webp" and not webp_available():
+        logger.warning("未安装 Pillow 或其不支持 WebP（pip install Pillow），页面图片改用 PNG 编码")
+        config = replace(config, image_format="png")
+    manifest: InputManifest | None = None
+    if config.incremental:
+        manifest = InputManifest.load(
+            config.input_dir, config.output_dir, config.model, config.ocr_prompt_preset
+        )
 
-    logger.info("共发现 %d 个 PDF 文件", len(pdf_tasks))
+    prober = PdfProber(PdfMetadataIndex.load(config.output_dir), workers=config.probe_workers)
+    with prober:
+        # 惰性扫描：PDF 任务由工作协程按需拉取，不会一次性为整棵目录树创建协程
+        # --force-restart 时仍记录清单，但不用它跳过文件
+        # 扫描出的任务分批交给探测进程池补充元数据（页数、加密/损坏状态），结果缓存在元数据索引中
+        task_iter = prober.iter_probed(
+            iter_pdf_tasks(config.input_dir, config.output_dir, None if force_restart else manifest)
+        )
+        scan_lock = asyncio.Lock()
+
+        async def next_pdf_task() -> PdfTask | None:
+            # 目录遍历与清单比对涉及磁盘 I/O，放到线程池；加锁保证生成器不被并发推进
+            async with scan_lock:
+                return await asyncio.to_thread(next, task_iter, None)
+
+        first_task = await next_pdf_task()
+        if first_task is None:
+            skipped_count = manifest.skipped_count if manifest is not None else 0
+            logger.warning("在目录 %s 下未发现任何需要处理的 PDF 文件", config.input_dir)
+            if manifest is not None:
+                manifest.save()
+            return [], {
+                "total_files": 0,
+                "success_count": 0,
+                "failed_count": 0,
+                "skipped_count": skipped_count,
+                "total_seconds": 0.0,
+                "avg_seconds_per_file": 0.0,
+                "ocr_pages": 0,
+                "text_layer_pages": 0,
+                "blank_pages": 0,
+                "tiled_pages": 0,
+                "batched_pages": 0,
+                "truncated_pages": 0,
+                "dedup_documents": 0,
+                "dedup_pages": 0,
+            }
+        pending_first: List[PdfTask] = [first_task]
+
+        # 确认有待处理文件后再探测 OCR 服务：等待就绪，并按服务端槽位数确定并发
+        config = await probe_servers(config)
+
+        limiter: AdaptiveLimiter | None = None
+        if config.adaptive_concurrency:
+            limiter = AdaptiveLimiter(config.min_concurrency, config.total_concurrency)
+            semaphore: asyncio.Semaphore | AdaptiveLimiter = limiter
+        else:
+            semaphore = asyncio.Semaphore(config.total_concurrency)
+        # 全局页面调度：渲染槽位与 OCR 槽位按策略在各 PDF 之间分配，避免大部头长期占满槽位
+        scheduler = PageScheduler(config.scheduler_policy, config.scheduler_priority_patterns, config.input_dir)
+        ocr_gate = scheduler.gate(semaphore, "ocr")
+        start_all = time.perf_counter()
+
+        # 渲染槽位 = OCR 在途页数 + 预渲染（look-ahead）页数
+        lookahead = config.render_lookahead or config.pages_in_flight
+        render_pool = RenderPool(
+            workers=config.render_workers,
+            capacity=config.pages_in_flight + lookahead,
+            max_open_documents=config.max_open_documents,
+            text_layer=(
+                TextLayerOptions(
+                    min_chars=config.text_layer_min_chars,
+                    min_quality=config.text_layer_min_quality,
+                )
+                if config.text_layer_enabled
+                else None
+            ),
+            blank=(
+                BlankPageOptions(
+                    max_ink_ratio=config.blank_max_ink_ratio,
+                    max_std=config.blank_max_std,
+                )
+                if config.blank_enabled
+                else None
+            ),
+            options=RenderOptions(
+                dpi=config.render_dpi,
+                max_pixels=config.render_max_pixels,
+                grayscale=config.render_grayscale,
+                image_format=config.image_format,
+                quality=config.image_quality,
+            ),
+            scheduler=scheduler,
+        )
 
-    semaphore = asyncio.Semaphore(config.max_concurrency)
-    start_all = time.perf_counter()
+        results: List[FileConvertResult] = []
+        max_open_pdfs = max(1, config.max_open_pdfs)
+        logger.info("文件级调度：同时处理的 PDF 上限 %d", max_open_pdfs)
 
-    async with OcrClient(config) as client:
-        tasks = [
-            _process_single_pdf(pdf_task, config, client, semaphore, force_restart)
-            for pdf_task in pdf_tasks
-        ]
-        results = await asyncio.gather(*tasks)
+        # 整个输出目录共用一个状态库，所有写入都在其专用线程中完成；
+        # 分布式模式下 SQLite 不适合多机并发写，每个工作进程使用自己的状态库
+        state_store = (
+            StateStore(config.output_dir, worker_state_db_path(config.output_dir, config.distributed_worker_id))
+            if distributed
+            else StateStore(config.output_dir)
+        )
+        # 去重：整本 PDF 按内容哈希复用往次/本次的转换结果，页面按渲染图片哈希复用 OCR 结果
+        # 分布式模式下各进程看到的已完成文档不一致，不做整本去重
+        doc_dedup = (
+            DocumentDeduplicator(config.output_dir, None if force_restart else manifest)
+            if config.dedup_documents and not distributed
+            else None
+        )
+        page_dedup = PageDeduplicator(config.dedup_page_cache_size) if config.dedup_pages else None
+
+        async def take_pdf_task() -> PdfTask | None:
+            return pending_first.pop() if pending_first else await next_pdf_task()
+
+        # 分布式模式：PDF 切成页段工作单元，通过输出目录中的租约文件与其他工作进程分工
+        coordinator = DistributedCoordinator(config, take_pdf_task, manifest) if distributed else None
+
+        # 运行指标：页级阶段耗时与计数，结束时写出报告；运行中定期输出滚动吞吐与预计剩余时间
+        report_json, report_csv, report_files_csv, report_prometheus = _report_paths(config)
+        metrics = RunMetrics(
+            csv_path=report_csv,
+            files_csv_path=report_files_csv,
+            run_info={
+                "input_dir": str(config.input_dir),
+                "output_dir": str(config.output_dir),
+                "model": config.model,
+                "prompt_preset": config.ocr_prompt_preset,
+                "total_concurrency": config.total_concurrency,
+                "render_dpi": config.render_dpi,
+                "image_format": config.image_format,
+                "stream": config.stream_enabled,
+                "batching": config.batching_enabled,
+                "tiling": config.tiling_enabled,
+                "scheduler_policy": config.scheduler_policy,
+                "distributed_worker_id": config.distributed_worker_id if distributed else None,
+            },
+        )
+        metrics.open()
+
+        async def report_progress() -> None:
+            while True:
+                await asyncio.sleep(config.report_progress_interval)
+                logger.info(metrics.progress_line())
+                if report_prometheus is not None:
+                    # 指标文本在事件循环线程中生成，写文件放到线程池
+                    await asyncio.to_thread(metrics.write_prometheus, report_prometheus, metrics.prometheus_text())
+
+        progress_task = (
+            asyncio.create_task(report_progress()) if config.report_progress_interval > 0 else None
+        )
 
+        async with render_pool:
+            async with OcrClient(config, limiter=limiter) as client:
+
+                def record(result: FileConvertResult) -> None:
+                    # Markdown 已写入磁盘，指标记录完成后释放逐页数据（页结果与页尺寸），
+                    # 结果列表只保留每个文件的计数与耗时，内存不随总页数增长
+                    metrics.record_file(result)
+                    result.page_results = []
+                    if result.pdf_task.metadata is not None:
+                        result.pdf_task.metadata.page_sizes = []
+                    results.append(result)
+
+                async def pdf_worker() -> None:
+                    while True:
+                        pdf_task = await take_pdf_task()
+                        if pdf_task is None:
+                            return
+                        result = None
+                        if doc_dedup is not None:
+                            result = await _reuse_duplicate_pdf(pdf_task, doc_dedup, manifest)
+                        if result is None:
+                            try:
+                                result = await _process_single_pdf(
+                                    pdf_task,
+                                    config,
+                                    client,
+                                    render_pool,
+                                    ocr_gate,
+                                    state_store,
+                                    force_restart,
+                                    manifest,
+                                    page_dedup,
+                                    metrics,
+                                    scheduler,
+                                )
+                            finally:
+                                if doc_dedup is not None:
+                                    doc_dedup.finish(pdf_task, success=result is not None and result.success)
+                        record(result)
+
+                async def unit_worker() -> None:
+                    assert coordinator is not None
+                    while True:
+                        unit = await coordinator.next_unit()
+                        if unit is None:
+                            return
+                        result = await coordinator.run_unit(
+                            unit,
+                            partial(
+                                _process_single_pdf,
+                                unit.pdf_task,
+                                config,
+                                client,
+                                render_pool,
+                                ocr_gate,
+                                state_store,
+                                page_dedup=page_dedup,
+                                metrics=metrics,
+                                scheduler=scheduler,
+                                unit=unit,
+                            ),
+                        )
+                        # 租约被其他进程接管时放弃本单元的结果
+                        if result is not None:
+                            record(result)
+
+                if coordinator is not None:
+                    coordinator.start()
+                worker_fn = unit_worker if coordinator is not None else pdf_worker
+                workers = [asyncio.create_task(worker_fn()) for _ in range(max_open_pdfs)]
+                try:
+                    await asyncio.gather(*workers)
+                    if coordinator is not None:
+                        # 合并剩余文档；无法合并的文档计入失败结果
+                        await coordinator.drain()
+                        for result in coordinator.failed_results:
+                            record(result)
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+                    if coordinator is not None:
+                        coordinator.close()
+                    if progress_task is not None:
+                        progress_task.cancel()
+                    scheduler.close()
+                    metrics.close()
+                    # 分布式模式下各进程在清单租约下合并写盘，不会覆盖其他进程的记录
+                    if coordinator is not None:
+                        await coordinator.save_manifest()
+                    elif manifest is not None:
+                        manifest.save()
+                    # 等待剩余状态写入完成
+                    await asyncio.to_thread(state_store.close)
+
+    skipped_count = manifest.skipped_count if manifest is not None else 0
     total_elapsed = time.perf_counter() - start_all
     success_count = sum(1 for r in results if r.success)
     failed_count = len(results) - success_count
     avg_seconds = total_elapsed / len(results) if results else 0.0
+    ocr_pages = sum(r.ocr_page_count for r in results)
+    text_layer_pages = sum(r.text_layer_page_count for r in results)
+    blank_pages = sum(r.blank_page_count for r in results)
+    tiled_pages = sum(r.tiled_page_count for r in results)
+    batched_pages = sum(r.batched_page_count for r in results)
+    truncated_pages = sum(r.truncated_page_count for r in results)
+    dedup_documents = sum(1 for r in results if r.duplicate_of is not None)
+    dedup_pages = sum(r.dedup_page_count for r in results)
 
     stats = {
         "total_files": len(results),
         "success_count": success_count,
         "failed_count": failed_count,
+        "skipped_count": skipped_count,
         "total_seconds": total_elapsed,
         "avg_seconds_per_file": avg_seconds,
+        "ocr_pages": ocr_pages,
+        "text_layer_pages": text_layer_pages,
+        "blank_pages": blank_pages,
+        "tiled_pages": tiled_pages,
+        "batched_pages": batched_pages,
+        "truncated_pages": truncated_pages,
+        "dedup_documents": dedup_documents,
+        "dedup_pages": dedup_pages,
     }
 
     logger.info(
@@ -252,5 +973,39 @@ async def run(config: AppConfig, force_restart: bool = False) -> Tuple[List[File
         total_elapsed,
         avg_seconds,
     )
+    logger.info(
+        "页面来源：OCR %d 页，文本层直抽 %d 页，空白页跳过 %d 页", ocr_pages, text_layer_pages, blank_pages
+    )
+    if dedup_pages:
+        dedup_document_pages = sum(r.dedup_page_count for r in results if r.duplicate_of is not None)
+        logger.info(
+            "去重节省 OCR 调用 %d 次：整本复用 %d 个 PDF（%d 页），重复页面 %d 页",
+            dedup_pages,
+            dedup_documents,
+            dedup_document_pages,
+            dedup_pages - dedup_document_pages,
+        )
+    if batched_pages:
+        logger.info("共有 %d 页通过多页批量请求完成 OCR", batched_pages)
+    if tiled_pages:
+        logger.info("共有 %d 页因超出上下文改为分块 OCR", tiled_pages)
+    if truncated_pages:
+        logger.warning("共有 %d 页 OCR 输出被提前截断（已在 Markdown 中标注 [OCR TRUNCATED]）", truncated_pages)
+    if coordinator is not None:
+        logger.info(
+            "分布式（%s）：完成页段 %d 个，合并文档 %d 个，跳过已合并文档 %d 个",
+            coordinator.worker_id,
+            coordinator.units_done,
+            coordinator.documents_merged,
+            coordinator.documents_skipped,
+        )
+    _log_schedule_summary(results, config.scheduler_policy)
+    _log_stage_summary(metrics)
+    try:
+        await asyncio.to_thread(
+            metrics.write_reports, report_json, report_prometheus, stats, metrics.prometheus_text()
+        )
+    except OSError as exc:
+        logger.warning("写出运行报告失败：%s", exc)
 
     return results, stats
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_PAGE_STORE_SUFFIX = ".pages.jsonl"
+
+
+def _page_store_path(output_md_path: Path) -> Path:
+    """返回页级结果存储文件路径（与 file.md 同目录）"""
+    return output_md_path.with_suffix(_PAGE_STORE_SUFFIX)
+
+
+class PageResultStore:
+    """页级 OCR 结果持久化存储（追加写 JSONL）。
+
+    每条记录以 (PDF 内容哈希, 页号, 模型, 提示词模板) 为键，
+    页面完成后立即追加写入并落盘；续传时只读取键匹配的记录，
+    因此 PDF 内容、模型或提示词变化后旧结果会被自动忽略。
+    内存中只保存页号到文件偏移的索引，页文本按需读取。
+    """
+
+    def __init__(self, output_md_path: Path, pdf_hash: str, model: str, prompt_preset: str) -> None:
+        self.output_md_path = output_md_path
+        self.path = _page_store_path(output_md_path)
+        self.pdf_hash = pdf_hash
+        self.model = model
+        self.prompt_preset = prompt_preset
+        self._lock = threading.Lock()
+        self._offsets: Dict[int, int] = {}
+
+    def _matches(self, record: dict) -> bool:
+        return (
+            record.get("pdf_hash") == self.pdf_hash
+            and record.get("model") == self.model
+            and record.get("prompt_preset") == self.prompt_preset
+        )
+
+    def load_index(self) -> Set[int]:
+        """扫描存储文件，建立 {页号: 文件偏移} 索引并返回已保存的页号集合。
+
+        只在内存中保留偏移量，页文本在需要时通过 get() 按偏移读取；
+        同一页以最后一条记录为准。崩溃遗留的不完整末行会被截断。
+        """
+        self._offsets = {}
+        if not self.path.exists():
+            return set()
+
+        with self._lock:
+            with self.path.open("r+b") as f:
+                offset = 0
+                good_end = 0
+                for line_no, raw in enumerate(f, start=1):
+                    line_offset = offset
+                    offset += len(raw)
+                    if not raw.endswith(b"\n"):
+                        # 崩溃时可能留下半行，截断后续追加才不会与之粘连
+                        logger.warning("页结果存储第 %d 行不完整，已截断：%s", line_no, self.path)
+                        break
+                    good_end = offset
+                    if not raw.strip():
+                        continue
+                    try:
+                        record = json.loads(raw)
+                    except json.JSONDecodeError:
+                        logger.warning("页结果存储第 %d 行损坏，已忽略：%s", line_no, self.path)
+                        continue
+                    if self._matches(record) and isinstance(record.get("text"), str):
+                        self._offsets[int(record["page"])] = line_offset
+                if good_end < offset:
+                    f.truncate(good_end)
+
+        logger.info("加载页结果存储：%s，可复用 %d 页", self.path, len(self._offsets))
+        return set(self._offsets)
+
+    def get(self, page_number: int) -> Optional[str]:
+        """按索引读取单页文本；页不存在时返回 None"""
+        offset = self._offsets.get(page_number)
+        if offset is None:
+            return None
+        with self._lock:
+            with self.path.open("rb") as f:
+                f.seek(offset)
+                record = json.loads(f.readline())
+        return record["text"]
+
+    def put(self, page_number: int, text: str) -> None:
+        """追加写入单页结果并立即落盘"""
+        record = {
+            "pdf_hash": self.pdf_hash,
+            "model": self.model,
+            "prompt_preset": self.prompt_preset,
+            "page": page_number,
+            "text": text,
+        }
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("ab") as f:
+                offset = f.tell()
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._offsets[page_number] = offset
+
+    def clear(self) -> None:
+        """删除页结果存储文件并清空偏移索引，之后的 get 返回 None，put 从新文件开头写起"""
+        with self._lock:
+            clear_page_store(self.output_md_path)
+            self._offsets = {}
+
+
+def clear_page_store(output_md_path: Path) -> None:
+    """删除页结果存储文件，用于强制重新开始或转换完成后清理"""
+    store_path = _page_store_path(output_md_path)
+    if store_path.exists():
+        store_path.unlink()
+        logger.info("已删除页结果存储：%s", store_path)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Tuple
+
+import fitz  # PyMuPDF
+
+# 与页面背景（平均亮度）相差超过该值的像素视为“墨迹”
+_INK_DELTA = 64
+# 统计时最多采样的像素数；高分辨率页面按行列等间隔抽样，比例统计不受影响
+_MAX_SAMPLED_PIXELS = 1_000_000
+
+
+@dataclass
+class BlankPageOptions:
+    """空白页判定阈值：墨迹覆盖率与亮度标准差均不超过阈值时视为空白页"""
+    # 墨迹像素占比上限（0~1），默认 0.05%，可容忍扫描噪点与细小污渍
+    max_ink_ratio: float = 0.0005
+    # 亮度标准差上限（0~255）
+    max_std: float = 8.0
+
+
+def _import_numpy():
+    try:
+        import numpy as np
+    except ImportError as exc:  # pragma: no cover - 取决于运行环境
+        raise RuntimeError("空白页检测需要安装 NumPy：pip install numpy") from exc
+    return np
+
+
+def numpy_available() -> bool:
+    """当前环境能否导入 NumPy（启动时检查一次，避免每页渲染时才失败）"""
+    try:
+        _import_numpy()
+    except RuntimeError:
+        return False
+    return True
+
+
+def pixmap_ink_stats(pix: fitz.Pixmap) -> Tuple[float, float]:
+    """直接在 Pixmap 像素缓冲区上统计 (墨迹覆盖率, 亮度标准差)，不做图片编码。
+
+    彩色页面取各通道最小值作为亮度，彩色墨迹同样计入；
+    墨迹以页面平均亮度为背景判定，偏灰的纸张与深色底浅色字的页面都适用。
+    """
+    np = _import_numpy()
+    if pix.width == 0 or pix.height == 0:
+        return 0.0, 0.0
+    channels = pix.n - pix.alpha
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    pixels = samples[:, : pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+    step = max(1, int((pix.width * pix.height / _MAX_SAMPLED_PIXELS) ** 0.5))
+    if step > 1:
+        pixels = pixels[::step, ::step]
+    # 按通道逐个取最小值（沿末轴的 min 归约在大图上明显更慢）
+    luminance = np.minimum.reduce([pixels[:, :, c] for c in range(channels)])
+    # 一次遍历得到 256 级亮度直方图，均值、方差与墨迹像素数都在直方图上计算
+    histogram = np.bincount(luminance.ravel(), minlength=256)
+    total = luminance.size
+    levels = np.arange(256, dtype=np.float64)
+    mean = float(histogram @ levels) / total
+    variance = float(histogram @ (levels - mean) ** 2) / total
+    ink = int(histogram[np.abs(levels - mean) > _INK_DELTA].sum())
+    return ink / total, variance ** 0.5
+
+
+def is_blank_pixmap(pix: fitz.Pixmap, options: BlankPageOptions) -> bool:
+    """判断渲染结果是否为空白/近空白页"""
+    ink_ratio, std = pixmap_ink_stats(pix)
+    return ink_ratio <= options.max_ink_ratio and std <= options.max_std
@@ -1,11 +1,26 @@
 from __future__ import annotations
 
+import hashlib
 from pathlib import Path
 
-from pypdf import PdfReader
+import fitz  # PyMuPDF
+
+_HASH_CHUNK_SIZE = 1024 * 1024
 
 
 def get_pdf_page_count(pdf_path: Path) -> int:
-    """返回 PDF 总页数。"""
-    reader = PdfReader(str(pdf_path))
-    return len(reader.pages)
+    """返回 PDF 总页数（只读取文档结构，不解析页面内容）。
+
+    批量处理请使用 pdf/probe.py 中的 PdfProber，结果会缓存到元数据索引。
+    """
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def compute_pdf_hash(pdf_path: Path) -> str:
+    """分块读取 PDF 并返回内容的 SHA-256 十六进制摘要。"""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import fitz  # PyMuPDF
+
+from pdf_ocr_md.types_ import PdfMetadata, PdfTask
+
+logger = logging.getLogger(__name__)
+
+_INDEX_FILE_NAME = ".pdf_metadata_index.json"
+_SAVE_EVERY = 50
+
+
+def probe_pdf(pdf_path: Path) -> PdfMetadata:
+    """单次打开 PDF，收集页数、各页尺寸、加密/损坏状态与文本层情况。
+
+    只读取文档结构与页面资源（字体），不解析页面内容流，也不渲染。
+    打开失败、需要密码或没有页面的文件在 error 中记录原因，调用方据此快速失败。
+    """
+    stat = pdf_path.stat()
+    meta = PdfMetadata(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    try:
+        with fitz.open(pdf_path) as doc:
+            meta.encrypted = bool(doc.needs_pass)
+            meta.repaired = bool(doc.is_repaired)
+            if meta.encrypted:
+                meta.error = "PDF 已加密，需要密码才能打开"
+                return meta
+            meta.page_count = doc.page_count
+            if meta.page_count == 0:
+                meta.error = "PDF 没有任何页面（文件可能已损坏）"
+                return meta
+            for index in range(doc.page_count):
+                rect = doc.page_cropbox(index)
+                meta.page_sizes.append((round(rect.width, 1), round(rect.height, 1)))
+                # 页面引用了字体即认为带文本层（扫描件通常只有图片资源）
+                if doc.get_page_fonts(index):
+                    meta.text_layer_pages += 1
+    except Exception as exc:  # noqa: BLE001
+        meta.error = f"无法打开 PDF（文件可能已损坏）：{exc}"
+    return meta
+
+
+def _probe_in_worker(pdf_path: Path) -> PdfMetadata:
+    try:
+        return probe_pdf(pdf_path)
+    except OSError as exc:
+        return PdfMetadata(error=f"无法读取 PDF：{exc}")
+
+
+class PdfMetadataIndex:
+    """PDF 元数据缓存，保存在输出根目录下的 `.pdf_metadata_index.json`。
+
+    以 PDF 路径为键，记录探测时的 (大小, mtime)；二者均未变化时直接复用缓存，
+    重复运行不再解析 PDF。
+    """
+
+    def __init__(self, output_root: Path) -> None:
+        self.path = output_root / _INDEX_FILE_NAME
+        self.entries: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self._unsaved = 0
+
+    @classmethod
+    def load(cls, output_root: Path) -> "PdfMetadataIndex":
+        """从输出根目录加载索引，不存在或损坏时返回空索引"""
+        index = cls(output_root)
+        if index.path.exists():
+            try:
+                data = json.loads(index.path.read_text(encoding="utf-8"))
+                index.entries = dict(data.get("files", {}))
+                logger.info("加载 PDF 元数据索引：%s，共 %d 条记录", index.path, len(index.entries))
+            except Exception as exc:
+                logger.warning("读取 PDF 元数据索引失败，将重新探测：%s", exc)
+        return index
+
+    @staticmethod
+    def _key(pdf_path: Path) -> str:
+        return pdf_path.resolve().as_posix()
+
+    def get(self, pdf_path: Path) -> Optional[PdfMetadata]:
+        """返回缓存的元数据；文件大小或 mtime 变化时返回 None"""
+        entry = self.entries.get(self._key(pdf_path))
+        if entry is None:
+            return None
+        try:
+            stat = pdf_path.stat()
+        except OSError:
+            return None
+        if stat.st_size != entry.get("size") or stat.st_mtime_ns != entry.get("mtime_ns"):
+            return None
+        return PdfMetadata.from_dict(entry)
+
+    def put(self, pdf_path: Path, meta: PdfMetadata) -> None:
+        """记录探测结果，累计一定数量后自动写盘。读取失败（无大小信息）的结果不缓存"""
+        if meta.size is None:
+            return
+        self.entries[self._key(pdf_path)] = meta.to_dict()
+        self._unsaved += 1
+        if self._unsaved >= _SAVE_EVERY:
+            self.save()
+
+    def save(self) -> None:
+        """保存索引（原子写入）"""
+        if self._unsaved == 0:
+            return
+        data = {"files": self.entries}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(self.path)
+            self._unsaved = 0
+        except Exception as exc:
+            logger.warning("保存 PDF 元数据索引失败：%s", exc)
+
+
+class PdfProber:
+    """批量探测 PDF 元数据：优先命中索引，未命中的文件分批交给进程池并行探测。
+
+    workers == 0 时在调用线程内逐个探测。需作为上下文管理器使用以释放进程池。
+    """
+
+    def __init__(self, index: PdfMetadataIndex, workers: int = 2) -> None:
+        self.index = index
+        self.workers = max(0, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "PdfProber":
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self.index.save()
+        if self.index.hits or self.index.misses:
+            logger.info("PDF 元数据：索引命中 %d 个，新探测 %d 个", self.index.hits, self.index.misses)
+
+    def probe_many(self, pdf_paths: List[Path]) -> List[PdfMetadata]:
+        """探测一批 PDF，按输入顺序返回元数据"""
+        results: List[Optional[PdfMetadata]] = [self.index.get(path) for path in pdf_paths]
+        missing = [i for i, meta in enumerate(results) if meta is None]
+        self.index.hits += len(pdf_paths) - len(missing)
+        self.index.misses += len(missing)
+        if missing:
+            paths = [pdf_paths[i] for i in missing]
+            if self._executor is not None:
+                probed = list(self._executor.map(_probe_in_worker, paths))
+            else:
+                probed = [_probe_in_worker(path) for path in paths]
+            for i, meta in zip(missing, probed):
+                results[i] = meta
+                self.index.put(pdf_paths[i], meta)
+        return [meta for meta in results if meta is not None]
+
+    def iter_probed(self, tasks: Iterable[PdfTask], batch_size: int = 0) -> Iterator[PdfTask]:
+        """为惰性任务流补充元数据：每攒满一批就并行探测一次，逐个产出带 metadata 的任务"""
+        batch_size = batch_size or max(1, self.workers) * 8
+        batch: List[PdfTask] = []
+
+        def flush() -> Iterator[PdfTask]:
+            for task, meta in zip(batch, self.probe_many([t.pdf_path for t in batch])):
+                task.metadata = meta
+                if meta.error is None:
+                    task.num_pages = meta.page_count
+                yield task
+            batch.clear()
+
+        for task in tasks:
+            batch.append(task)
+            if len(batch) >= batch_size:
+                yield from flush()
+        if batch:
+            yield from flush()
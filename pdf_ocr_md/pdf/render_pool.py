@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pdf_ocr_md.metrics import timed
+from pdf_ocr_md.pdf.blank import BlankPageOptions
+from pdf_ocr_md.pdf.renderer import PdfRenderer, RenderOptions
+from pdf_ocr_md.pdf.text_layer import TextLayerOptions
+from pdf_ocr_md.scheduler import DocumentTicket, PageScheduler, ScheduledGate
+
+logger = logging.getLogger(__name__)
+
+# 渲染进程内的文档缓存（每个工作进程一份）
+_worker_renderer: Optional[PdfRenderer] = None
+
+
+def _init_worker(max_open_documents: int, options: RenderOptions) -> None:
+    global _worker_renderer
+    _worker_renderer = PdfRenderer(max_open_documents, options)
+
+
+def _prepare_with_hash(
+    renderer: PdfRenderer,
+    pdf_path: Path,
+    page_number: int,
+    text_layer: Optional[TextLayerOptions],
+    blank: Optional[BlankPageOptions],
+) -> Tuple[Optional[str], Optional[bytes], Optional[str], Dict[str, float]]:
+    """准备单页并计算图片内容哈希（用于页面级去重），在渲染进程/线程中执行；同时返回各步骤耗时"""
+    timings: Dict[str, float] = {}
+    text, image_bytes = renderer.prepare_page(pdf_path, page_number, text_layer, blank, timings)
+    image_hash = None
+    if image_bytes is not None:
+        with timed(timings, "hash"):
+            image_hash = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+    return text, image_bytes, image_hash, timings
+
+
+def _prepare_in_worker(
+    pdf_path: Path, page_number: int, text_layer: Optional[TextLayerOptions], blank: Optional[BlankPageOptions]
+) -> Tuple[Optional[str], Optional[bytes], Optional[str], Dict[str, float]]:
+    assert _worker_renderer is not None, "渲染进程未初始化"
+    return _prepare_with_hash(_worker_renderer, pdf_path, page_number, text_layer, blank)
+
+
+def _render_tiles_in_worker(
+    pdf_path: Path, page_number: int, bands: Sequence[Tuple[float, float]]
+) -> List[bytes]:
+    assert _worker_renderer is not None, "渲染进程未初始化"
+    return _worker_renderer.render_tiles(pdf_path, page_number, bands)
+
+
+@dataclass
+class RenderedPage:
+    """渲染阶段的产出：已就绪的页面图片、文本层直抽结果或渲染错误"""
+    page_number: int
+    image_bytes: Optional[bytes]
+    error: Optional[str] = None
+    text: Optional[str] = None
+    # 图片内容哈希（blake2b-128），用于页面级去重
+    image_hash: Optional[str] = None
+    # 像素统计判定为空白页，无需 OCR
+    blank: bool = False
+    # 渲染阶段各步骤耗时（秒），见 metrics.STAGES
+    timings: Dict[str, float] = field(default_factory=dict)
+    # 放入队列的时刻（perf_counter），用于统计排队等待时间
+    ready_at: float = 0.0
+
+
+class RenderPool:
+    """独立的页面渲染阶段（生产者），与 OCR 并发槽位解耦。
+
+    - workers > 0 时使用进程池渲染，workers == 0 时退化为单个专用线程；
+    - 传入 text_layer 时启用混合模式：文本层质量达标的页直接产出文本，不渲染图片；
+    - 传入 blank 时在渲染进程内检测空白页，空白页不编码图片；
+    - 全局渲染槽位 capacity 限制“已渲染但尚未完成 OCR”的图片数量，
+      从而把渲染内存控制在固定上限内。消费者处理完一页后必须调用 release()；
+    - 传入 scheduler 时渲染槽位按其调度策略在各 PDF 之间分配，而不是按请求先后。
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        capacity: int,
+        max_open_documents: int,
+        text_layer: Optional[TextLayerOptions] = None,
+        options: Optional[RenderOptions] = None,
+        blank: Optional[BlankPageOptions] = None,
+        scheduler: Optional[PageScheduler] = None,
+    ) -> None:
+        self.workers = max(0, workers)
+        self.capacity = max(1, capacity)
+        self.max_open_documents = max_open_documents
+        self.text_layer = text_layer
+        self.options = options or RenderOptions()
+        self.blank = blank
+        self.scheduler = scheduler
+        self._executor: Optional[Executor] = None
+        self._local_renderer: Optional[PdfRenderer] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._gate: Optional[ScheduledGate] = None
+
+    async def __aenter__(self) -> "RenderPool":
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.max_open_documents, self.options),
+            )
+        else:
+            self._local_renderer = PdfRenderer(self.max_open_documents, self.options)
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-render")
+        self._slots = asyncio.Semaphore(self.capacity)
+        if self.scheduler is not None:
+            self._gate = self.scheduler.gate(self._slots, "render")
+        logger.info("初始化渲染池：工作进程 %d，渲染槽位 %d", self.workers, self.capacity)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._local_renderer is not None:
+            self._local_renderer.close()
+            self._local_renderer = None
+
+    async def prepare(
+        self, pdf_path: Path, page_number: int, use_text_layer: bool = True
+    ) -> Tuple[Optional[str], Optional[bytes], Optional[str], Dict[str, float]]:
+        """在渲染执行器中准备单页：返回 (直抽文本, 图片数据, 图片哈希, 各步骤耗时)，不占用渲染槽位。
+
+        空白页的直抽文本与图片数据均为 None。
+        """
+        assert self._executor is not None, "RenderPool 未初始化，请使用 async with RenderPool(...)"
+        loop = asyncio.get_running_loop()
+        text_layer = self.text_layer if use_text_layer else None
+        if self._local_renderer is not None:
+            return await loop.run_in_executor(
+                self._executor,
+                _prepare_with_hash,
+                self._local_renderer,
+                pdf_path,
+                page_number,
+                text_layer,
+                self.blank,
+            )
+        return await loop.run_in_executor(
+            self._executor, _prepare_in_worker, pdf_path, page_number, text_layer, self.blank
+        )
+
+    async def render_tiles(
+        self, pdf_path: Path, page_number: int, bands: Sequence[Tuple[float, float]]
+    ) -> List[bytes]:
+        """在渲染执行器中把单页按水平条带分块渲染（上下文超限时的分块 OCR），不占用渲染槽位"""
+        assert self._executor is not None, "RenderPool 未初始化，请使用 async with RenderPool(...)"
+        loop = asyncio.get_running_loop()
+        if self._local_renderer is not None:
+            return await loop.run_in_executor(
+                self._executor, self._local_renderer.render_tiles, pdf_path, page_number, bands
+            )
+        return await loop.run_in_executor(self._executor, _render_tiles_in_worker, pdf_path, page_number, bands)
+
+    async def feed(
+        self,
+        pdf_path: Path,
+        page_numbers: Iterable[int],
+        queue: "asyncio.Queue[RenderedPage]",
+        use_text_layer: bool = True,
+        ticket: Optional[DocumentTicket] = None,
+    ) -> None:
+        """生产者：按页序提交渲染，图片就绪后放入队列。
+
+        每页在提交渲染前先占用一个渲染槽位，槽位由消费者在 OCR 结束后释放。
+        use_text_layer=False 时跳过文本层检查（如元数据显示文档没有文本层）。
+        ticket 为本 PDF 在调度器中的登记，决定槽位紧张时本文档页面的先后。
+        """
+        assert self._slots is not None, "RenderPool 未初始化，请使用 async with RenderPool(...)"
+
+        async def render_one(page_number: int, slot_wait: float) -> None:
+            start = time.perf_counter()
+            try:
+                text, image_bytes, image_hash, timings = await self.prepare(pdf_path, page_number, use_text_layer)
+                # 执行器排队与进程间传输的耗时 = 事件循环侧观测的总耗时 - 渲染进程内各步骤耗时
+                timings["render_overhead"] = max(0.0, time.perf_counter() - start - sum(timings.values()))
+                rendered = RenderedPage(
+                    page_number=page_number,
+                    image_bytes=image_bytes,
+                    text=text,
+                    image_hash=image_hash,
+                    blank=text is None and image_bytes is None,
+                    timings=timings,
+                )
+            except asyncio.CancelledError:
+                # 尚未放入队列，槽位不会再由消费者归还
+                self.release()
+                raise
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("渲染页面失败：%s Page %d", pdf_path, page_number)
+                rendered = RenderedPage(page_number=page_number, image_bytes=None, error=str(exc))
+            rendered.timings["render_wait"] = slot_wait
+            rendered.ready_at = time.perf_counter()
+            await queue.put(rendered)
+
+        tasks = []
+        try:
+            for page_number in page_numbers:
+                if self._gate is not None:
+                    slot_wait = await self._gate.acquire(ticket)
+                else:
+                    wait_start = time.perf_counter()
+                    await self._slots.acquire()
+                    slot_wait = time.perf_counter() - wait_start
+                tasks.append(asyncio.create_task(render_one(page_number, slot_wait)))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def release(self) -> None:
+        """释放一个渲染槽位（消费者处理完一页后调用）"""
+        assert self._slots is not None
+        self._slots.release()
+
+    def close_document(self, pdf_path: Path) -> None:
+        """关闭本进程内缓存的文档；进程池模式下由各工作进程的 LRU 自行淘汰"""
+        if self._local_renderer is not None:
+            self._local_renderer.close_document(pdf_path)
@@ -1,21 +1,239 @@
 from __future__ import annotations
 
+import io
+import logging
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import fitz  # PyMuPDF
 
+from pdf_ocr_md.metrics import timed
+from pdf_ocr_md.pdf.blank import BlankPageOptions, is_blank_pixmap
+from pdf_ocr_md.pdf.text_layer import TextLayerOptions, extract_good_text_layer
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_MAX_OPEN_DOCUMENTS = 8
+
+IMAGE_MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+
+@dataclass
+class RenderOptions:
+    """页面渲染与图片编码参数（默认值与 PyMuPDF 默认渲染一致：72 dpi、RGB、PNG）"""
+    dpi: int = 72
+    # 单页最大像素数（宽 × 高），超出时按比例降低分辨率；0 表示不限制
+    max_pixels: int = 0
+    grayscale: bool = False
+    image_format: str = "png"
+    # JPEG/WebP 编码质量（1~100），PNG 忽略
+    quality: int = 85
+
+    def __post_init__(self) -> None:
+        self.image_format = self.image_format.lower()
+        if self.image_format == "jpg":
+            self.image_format = "jpeg"
+        if self.image_format not in IMAGE_MIME_TYPES:
+            raise ValueError(f"不支持的图片格式：{self.image_format}（可选 png/jpeg/webp）")
+        if self.dpi <= 0:
+            raise ValueError("dpi 必须为正数")
+
+    @property
+    def mime_type(self) -> str:
+        return IMAGE_MIME_TYPES[self.image_format]
+
+
+def _load_page(doc: fitz.Document, page_number: int) -> fitz.Page:
+    """加载指定页面（page_number 从 1 开始）。"""
+    if page_number < 1:
+        raise ValueError("page_number 从 1 开始")
+    if page_number > doc.page_count:
+        raise ValueError(f"页面号 {page_number} 超过总页数 {doc.page_count}")
+    return doc.load_page(page_number - 1)
+
+
+def _rasterize(page: fitz.Page, options: RenderOptions, clip: Optional[fitz.Rect] = None) -> fitz.Pixmap:
+    """按 dpi 渲染页面，超过 max_pixels 时等比缩小。
+
+    传入 clip 时只渲染页面的该区域，缩放比例仍按整页计算，与整页渲染的文字大小一致。
+    """
+    zoom = options.dpi / 72.0
+    if options.max_pixels > 0:
+        pixels = page.rect.width * page.rect.height * zoom * zoom
+        if pixels > options.max_pixels:
+            zoom *= math.sqrt(options.max_pixels / pixels)
+    colorspace = fitz.csGRAY if options.grayscale else fitz.csRGB
+    return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=colorspace, alpha=False, clip=clip)
+
+
+def _import_pil_image():
+    try:
+        from PIL import Image
+    except ImportError as exc:  # pragma: no cover - 取决于运行环境
+        raise RuntimeError("WebP 编码需要安装 Pillow：pip install Pillow") from exc
+    return Image
+
+
+def webp_available() -> bool:
+    """当前环境能否编码 WebP（需要 Pillow 且编译了 libwebp 支持；启动时检查一次）"""
+    try:
+        _import_pil_image()
+        from PIL import features
+    except (RuntimeError, ImportError):
+        return False
+    return bool(features.check("webp"))
+
+
+def _encode_pixmap(pix: fitz.Pixmap, options: RenderOptions) -> bytes:
+    """将 Pixmap 编码为目标格式。WebP 需要额外安装 Pillow。"""
+    if options.image_format == "png":
+        return pix.tobytes("png")
+    if options.image_format == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=options.quality)
+
+    Image = _import_pil_image()
+    mode = "L" if pix.n == 1 else "RGB"
+    image = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=options.quality)
+    return buffer.getvalue()
+
+
+def _render_loaded_page(doc: fitz.Document, page_number: int, options: Optional[RenderOptions] = None) -> bytes:
+    """从已打开的文档中渲染指定页面并编码（page_number 从 1 开始）。"""
+    page = _load_page(doc, page_number)
+    options = options or RenderOptions()
+    return _encode_pixmap(_rasterize(page, options), options)
+
 
 def render_page_to_png_bytes(pdf_path: Path, page_number: int) -> bytes:
     """将指定页面渲染为 PNG 格式的二进制数据。
 
-    page_number 从 1 开始计数。
+    page_number 从 1 开始计数。每次调用都会重新打开文档，
+    批量渲染请使用 PdfRenderer。
     """
     if page_number < 1:
         raise ValueError("page_number 从 1 开始")
 
     with fitz.open(pdf_path) as doc:
-        if page_number > doc.page_count:
-            raise ValueError(f"页面号 {page_number} 超过总页数 {doc.page_count}")
-        page = doc.load_page(page_number - 1)
-        pix = page.get_pixmap()
-        return pix.tobytes("png")
+        return _render_loaded_page(doc, page_number)
+
+
+class PdfRenderer:
+    """持有已打开的 PyMuPDF 文档并按页渲染。
+
+    每个 PDF 只打开一次，后续页面直接复用文档对象；
+    同时打开的文档数由 LRU 淘汰限制在 max_open_documents 以内。
+    PyMuPDF 不支持多线程并发访问，所有文档操作都在同一把锁内完成。
+    """
+
+    def __init__(
+        self,
+        max_open_documents: int = _DEFAULT_MAX_OPEN_DOCUMENTS,
+        options: Optional[RenderOptions] = None,
+    ) -> None:
+        self.max_open_documents = max(1, max_open_documents)
+        self.options = options or RenderOptions()
+        self._documents: "OrderedDict[Path, fitz.Document]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "PdfRenderer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _get_document_unlocked(self, pdf_path: Path) -> fitz.Document:
+        """内部方法：获取（必要时打开）文档并更新 LRU 顺序（调用者已加锁）"""
+        doc = self._documents.get(pdf_path)
+        if doc is not None:
+            self._documents.move_to_end(pdf_path)
+            return doc
+
+        doc = fitz.open(pdf_path)
+        self._documents[pdf_path] = doc
+        while len(self._documents) > self.max_open_documents:
+            evicted_path, evicted_doc = self._documents.popitem(last=False)
+            evicted_doc.close()
+            logger.debug("LRU 淘汰已打开的 PDF：%s", evicted_path)
+        return doc
+
+    def render_page(self, pdf_path: Path, page_number: int) -> bytes:
+        """按渲染参数渲染单页并编码（page_number 从 1 开始）"""
+        with self._lock:
+            doc = self._get_document_unlocked(pdf_path)
+            return _render_loaded_page(doc, page_number, self.options)
+
+    def prepare_page(
+        self,
+        pdf_path: Path,
+        page_number: int,
+        text_layer: Optional[TextLayerOptions] = None,
+        blank: Optional[BlankPageOptions] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Tuple[Optional[str], Optional[bytes]]:
+        """准备单页的 OCR 输入，返回 (直抽文本, 图片数据) 二者之一。
+
+        传入 text_layer 时先检查文本层，质量达标则直接返回文本、不再渲染；
+        否则按渲染参数渲染并编码后交给 OCR。传入 blank 时在编码前检查像素，
+        空白页返回 (None, None)，不编码也不送 OCR。传入 timings 时记录各步骤耗时。
+        """
+        with self._lock:
+            with timed(timings, "open"):
+                doc = self._get_document_unlocked(pdf_path)
+                page = _load_page(doc, page_number)
+            if text_layer is not None:
+                with timed(timings, "text_layer"):
+                    text = extract_good_text_layer(page, text_layer)
+                if text is not None:
+                    return text, None
+            with timed(timings, "rasterize"):
+                pix = _rasterize(page, self.options)
+            if blank is not None:
+                with timed(timings, "blank_check"):
+                    is_blank = is_blank_pixmap(pix, blank)
+                if is_blank:
+                    return None, None
+            with timed(timings, "encode"):
+                return None, _encode_pixmap(pix, self.options)
+
+    def render_tiles(
+        self, pdf_path: Path, page_number: int, bands: Sequence[Tuple[float, float]]
+    ) -> List[bytes]:
+        """把单页按水平条带分块渲染并编码；条带以页面高度的比例 (上, 下) 表示"""
+        with self._lock:
+            doc = self._get_document_unlocked(pdf_path)
+            page = _load_page(doc, page_number)
+            rect = page.rect
+            tiles = []
+            for top, bottom in bands:
+                clip = fitz.Rect(rect.x0, rect.y0 + top * rect.height, rect.x1, rect.y0 + bottom * rect.height)
+                tiles.append(_encode_pixmap(_rasterize(page, self.options, clip), self.options))
+            return tiles
+
+    def render_pages(self, pdf_path: Path, page_numbers: Iterable[int]) -> Iterator[Tuple[int, bytes]]:
+        """按顺序渲染多页，逐页产出 (页号, 图片数据)"""
+        for page_number in page_numbers:
+            yield page_number, self.render_page(pdf_path, page_number)
+
+    def close_document(self, pdf_path: Path) -> None:
+        """关闭指定 PDF（处理完成后调用）"""
+        with self._lock:
+            doc = self._documents.pop(pdf_path, None)
+            if doc is not None:
+                doc.close()
+
+    def close(self) -> None:
+        """关闭所有已打开的文档"""
+        with self._lock:
+            while self._documents:
+                _, doc = self._documents.popitem(last=False)
+                doc.close()
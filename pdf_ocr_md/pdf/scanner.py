@@ -1,24 +1,55 @@
 from __future__ import annotations
 
+import logging
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Iterator, List, Optional
 
 from pdf_ocr_md.types_ import PdfTask
 
+if TYPE_CHECKING:
+    from pdf_ocr_md.manifest import InputManifest
 
-def scan_pdfs(input_root: Path, output_root: Path) -> List[PdfTask]:
-    """递归扫描 input_root 下的所有 PDF 文件，并生成对应的输出任务。
+logger = logging.getLogger(__name__)
+
+
+def iter_pdf_tasks(
+    input_root: Path, output_root: Path, manifest: Optional["InputManifest"] = None
+) -> Iterator[PdfTask]:
+    """递归扫描 input_root 下的所有 PDF 文件，逐个产出对应的输出任务（惰性）。
 
     输出结构：
     - input_root/sub/file.pdf → output_root/sub/file/file.md
     - 即每个 PDF 在输出目录下生成一个同名目录，Markdown 文件放在其中
+
+    传入 manifest 时启用增量模式：清单中记录且未变化的 PDF 直接跳过，
+    不做任何 PDF 解析或 OCR；跳过数量累计到 manifest.skipped_count。
     """
-    tasks: List[PdfTask] = []
+    found = 0
+    skipped = 0
+    if manifest is not None:
+        manifest.skipped_count = 0
     for pdf_path in input_root.rglob("*.pdf"):
         if pdf_path.is_file():
             relative = pdf_path.relative_to(input_root)
             # 输出目录：去掉 .pdf 后缀，作为目录名；Markdown 文件名为 file.md
             output_dir = output_root / relative.with_suffix("")
             output_md_path = output_dir / "file.md"
-            tasks.append(PdfTask(pdf_path=pdf_path, output_md_path=output_md_path))
-    return tasks
+            if manifest is not None and manifest.is_unchanged(pdf_path, output_md_path):
+                skipped += 1
+                manifest.skipped_count = skipped
+                continue
+            found += 1
+            yield PdfTask(pdf_path=pdf_path, output_md_path=output_md_path)
+
+    if manifest is not None:
+        logger.info("增量模式：跳过 %d 个未变化的 PDF，待处理 %d 个", skipped, found)
+    else:
+        logger.info("扫描完成：共发现 %d 个 PDF 文件", found)
+
+
+def scan_pdfs(input_root: Path, output_root: Path, manifest: Optional["InputManifest"] = None) -> List[PdfTask]:
+    """递归扫描 input_root 下的所有 PDF 文件，并生成对应的输出任务列表。
+
+    大目录请使用 iter_pdf_tasks 惰性遍历，避免一次性构造全部任务。
+    """
+    return list(iter_pdf_tasks(input_root, output_root, manifest))
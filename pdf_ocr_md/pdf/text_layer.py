@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Optional
+
+import fitz  # PyMuPDF
+
+# 图片覆盖页面面积超过该比例时视为扫描页（文本层多为旧 OCR 结果，不可靠）
+_SCANNED_IMAGE_COVERAGE = 0.5
+
+# 部分 PDF 用康熙部首（U+2F00–U+2FDF）代替常用汉字字形，如“⼯”→“工”
+_KANGXI_RADICALS = re.compile("[\u2f00-\u2fdf]")
+
+
+@dataclass
+class TextLayerOptions:
+    """文本层直抽阈值"""
+    min_chars: int = 50
+    min_quality: float = 0.9
+
+
+def text_layer_quality(text: str) -> float:
+    """返回文本层中“正常字符”所占比例（0~1）。
+
+    替换字符 U+FFFD、控制字符、私有区与未分配码位均视为乱码。
+    """
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return 0.0
+    bad = 0
+    for c in chars:
+        if c == "\ufffd" or unicodedata.category(c) in ("Cc", "Co", "Cn", "Cs"):
+            bad += 1
+    return 1.0 - bad / len(chars)
+
+
+def _image_coverage(page: fitz.Page) -> float:
+    """返回页面中图片覆盖面积占页面面积的比例（粗略值，不扣除重叠）"""
+    page_area = abs(page.rect)
+    if page_area <= 0:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        covered += abs(fitz.Rect(info["bbox"]) & page.rect)
+    return min(1.0, covered / page_area)
+
+
+def page_text_to_markdown(page: fitz.Page) -> str:
+    """按阅读顺序提取文本块，块之间以空行分隔，生成简单 Markdown。"""
+    paragraphs = []
+    for block in page.get_text("blocks", sort=True):
+        # block: (x0, y0, x1, y1, text, block_no, block_type)，block_type 为 0 表示文本
+        if block[6] != 0:
+            continue
+        text = block[4].strip()
+        if text:
+            paragraphs.append(text)
+    markdown = "\n\n".join(paragraphs)
+    return _KANGXI_RADICALS.sub(lambda m: unicodedata.normalize("NFKC", m.group()), markdown)
+
+
+def extract_good_text_layer(page: fitz.Page, options: TextLayerOptions) -> Optional[str]:
+    """文本层足够好时返回提取出的 Markdown，否则返回 None（需走 OCR）。"""
+    if _image_coverage(page) >= _SCANNED_IMAGE_COVERAGE:
+        return None
+    text = page_text_to_markdown(page)
+    if len("".join(text.split())) < options.min_chars:
+        return None
+    if text_layer_quality(text) < options.min_quality:
+        return None
+    return text
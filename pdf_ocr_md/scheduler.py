@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from pdf_ocr_md.ocr.limiter import AdaptiveLimiter
+
+logger = logging.getLogger(__name__)
+
+# 调度策略：
+# - fifo：按请求槽位的先后顺序（与直接使用信号量相同）；
+# - srpt：剩余页数最少的文档优先（shortest remaining processing time），降低文档平均完成时间；
+# - round_robin：在有页面等待的文档之间轮转，每次分配给最久未获得槽位的文档
+SCHEDULER_POLICIES: Tuple[str, ...] = ("fifo", "srpt", "round_robin")
+
+
+@dataclass
+class DocumentTicket:
+    """调度器中登记的单个 PDF：剩余页数、优先级与各闸门的排队等待统计"""
+    pdf_path: Path
+    # 尚未完成的待处理页数（srpt 策略的排序依据）
+    remaining: int
+    # 路径模式优先级：匹配的第一个模式的序号，越小越优先；未匹配时排在所有模式之后
+    rank: int
+    # 登记顺序，同等条件下先登记的文档优先
+    order: int
+    # 最近一次获得槽位时的全局分配序号（round_robin 策略的排序依据）
+    last_served: int = 0
+    # 各闸门的累计等待时间与单次最长等待时间（秒）
+    waits: Dict[str, float] = field(default_factory=dict)
+    max_waits: Dict[str, float] = field(default_factory=dict)
+
+    def page_done(self) -> None:
+        self.remaining = max(0, self.remaining - 1)
+
+    def record_wait(self, gate: str, seconds: float) -> None:
+        self.waits[gate] = self.waits.get(gate, 0.0) + seconds
+        self.max_waits[gate] = max(self.max_waits.get(gate, 0.0), seconds)
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    ticket: Optional[DocumentTicket]
+    seq: int
+
+
+class ScheduledGate:
+    """按调度策略分配底层信号量 / 自适应限制器槽位的闸门。
+
+    没有页面排队且底层有空闲槽位时直接占用；否则进入等待列表，由分派协程在底层槽位空出后
+    按策略挑选下一个页面。槽位在分配的那一刻才选择页面，因此策略总是基于最新的剩余页数，
+    且只要有页面等待就不会让槽位空闲。底层为自适应限制器时，上限的调整照常生效。
+    """
+
+    def __init__(
+        self, scheduler: "PageScheduler", inner: Union[asyncio.Semaphore, AdaptiveLimiter], name: str
+    ) -> None:
+        self._scheduler = scheduler
+        self._inner = inner
+        self.name = name
+        self._waiters: List[_Waiter] = []
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def acquire(self, ticket: Optional[DocumentTicket] = None) -> float:
+        """为 ticket 对应文档的一个页面占用槽位，返回排队等待的秒数"""
+        start = time.perf_counter()
+        if not self._waiters and not self._inner.locked():
+            await self._inner.acquire()
+            self._scheduler.served(ticket)
+        else:
+            waiter = _Waiter(asyncio.get_running_loop().create_future(), ticket, next(self._scheduler.sequence))
+            self._waiters.append(waiter)
+            if self._dispatcher is None:
+                self._dispatcher = asyncio.create_task(self._dispatch())
+            self._wakeup.set()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # 已分配到槽位但调用方被取消，归还槽位
+                    self._inner.release()
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                raise
+        waited = time.perf_counter() - start
+        if ticket is not None:
+            ticket.record_wait(self.name, waited)
+        return waited
+
+    def release(self) -> None:
+        self._inner.release()
+
+    def for_document(self, ticket: Optional[DocumentTicket]) -> "DocumentSlot":
+        """绑定到单个文档的视图，可像信号量一样用于 async with"""
+        return DocumentSlot(self, ticket)
+
+    async def _dispatch(self) -> None:
+        while True:
+            while not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await self._inner.acquire()
+            # 调用方可能已被取消（其 future 已完成但尚未从列表移除）
+            live = [w for w in self._waiters if not w.future.done()]
+            if not live:
+                self._waiters.clear()
+                self._inner.release()
+                continue
+            waiter = min(live, key=self._scheduler.sort_key)
+            self._waiters.remove(waiter)
+            # 在分配时即更新轮转序号：被唤醒的协程恢复运行前，分派协程可能已在分配下一个槽位
+            self._scheduler.served(waiter.ticket)
+            waiter.future.set_result(None)
+
+    def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+
+class DocumentSlot:
+    """ScheduledGate 的单文档视图，接口与 asyncio.Semaphore 一致（供批量器等组件直接使用）"""
+
+    def __init__(self, gate: ScheduledGate, ticket: Optional[DocumentTicket]) -> None:
+        self._gate = gate
+        self._ticket = ticket
+
+    async def acquire(self) -> float:
+        return await self._gate.acquire(self._ticket)
+
+    def release(self) -> None:
+        self._gate.release()
+
+    async def __aenter__(self) -> "DocumentSlot":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+class PageScheduler:
+    """跨 PDF 的全局页面调度器。
+
+    渲染槽位与 OCR 槽位各包一层 ScheduledGate，两处都按同一策略在排队的页面之间选择：
+    先比较路径模式优先级（priority_patterns 中越靠前越优先），再按 policy 排序，
+    最后按请求先后。每个文档的排队等待时间记录在其 DocumentTicket 中。
+    """
+
+    def __init__(
+        self,
+        policy: str = "srpt",
+        priority_patterns: Sequence[str] = (),
+        root: Optional[Path] = None,
+    ) -> None:
+        if policy not in SCHEDULER_POLICIES:
+            raise ValueError(f"不支持的调度策略：{policy}（可选 {'/'.join(SCHEDULER_POLICIES)}）")
+        self.policy = policy
+        self.priority_patterns = list(priority_patterns)
+        self.root = root
+        self.sequence = itertools.count(1)
+        self._order = itertools.count()
+        self._gates: List[ScheduledGate] = []
+        logger.info(
+            "页面调度策略：%s%s",
+            policy,
+            f"，优先路径模式：{self.priority_patterns}" if self.priority_patterns else "",
+        )
+
+    def gate(self, inner: Union[asyncio.Semaphore, AdaptiveLimiter], name: str) -> ScheduledGate:
+        gate = ScheduledGate(self, inner, name)
+        self._gates.append(gate)
+        return gate
+
+    def register(self, pdf_path: Path, pending_pages: int) -> DocumentTicket:
+        return DocumentTicket(
+            pdf_path=pdf_path, remaining=pending_pages, rank=self._rank(pdf_path), order=next(self._order)
+        )
+
+    def _rank(self, pdf_path: Path) -> int:
+        """路径（相对输入目录，以 / 分隔）匹配的第一个模式的序号"""
+        try:
+            relative = pdf_path.relative_to(self.root).as_posix() if self.root is not None else pdf_path.as_posix()
+        except ValueError:
+            relative = pdf_path.as_posix()
+        for index, pattern in enumerate(self.priority_patterns):
+            if fnmatch(relative, pattern):
+                return index
+        return len(self.priority_patterns)
+
+    def served(self, ticket: Optional[DocumentTicket]) -> None:
+        if ticket is not None:
+            ticket.last_served = next(self.sequence)
+
+    def sort_key(self, waiter: _Waiter) -> Tuple[int, ...]:
+        ticket = waiter.ticket
+        if ticket is None:
+            return (-1, 0, 0, waiter.seq)
+        if self.policy == "srpt":
+            return (ticket.rank, ticket.remaining, ticket.order, waiter.seq)
+        if self.policy == "round_robin":
+            return (ticket.rank, ticket.last_served, ticket.order, waiter.seq)
+        return (ticket.rank, 0, 0, waiter.seq)
+
+    def close(self) -> None:
+        for gate in self._gates:
+            gate.close()
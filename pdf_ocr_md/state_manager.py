@@ -1,163 +1,445 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-import threading
+import re
+import sqlite3
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from pdf_ocr_md.types_ import ConversionState
 
 logger = logging.getLogger(__name__)
 
-_STATE_FILE_SUFFIX = ".convert_state.json"
+_STATE_DB_FILE_NAME = ".convert_state.db"
+# 旧版本为每个 PDF 写一个 JSON 状态文件，首次加载时迁移进数据库
+_LEGACY_STATE_FILE_SUFFIX = ".convert_state.json"
 _DEFAULT_BATCH_SIZE = 5
+# 分布式模式下页段的状态键：<PDF 输出目录>/.work/pages-<起始页>-<结束页>.md（见 distributed.WorkUnit）
+_WORK_UNIT_KEY = re.compile(r"^(?:(?P<doc>.*)/)?\.work/pages-\d+-\d+\.md$")
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    output_path TEXT PRIMARY KEY,
+    pdf_path TEXT NOT NULL,
+    total_pages INTEGER,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status);
+CREATE TABLE IF NOT EXISTS pages (
+    output_path TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    elapsed_seconds REAL,
+    error TEXT,
+    source TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (output_path, page)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_pages_status ON pages(status, output_path);
+"""
 
-def _state_file_path(output_md_path: Path) -> Path:
-    """返回对应的状态文件路径"""
-    return output_md_path.with_suffix(_STATE_FILE_SUFFIX)
+_DOC_IN_PROGRESS = "in_progress"
+_DOC_COMPLETED = "completed"
+_PAGE_COMPLETED = "completed"
+_PAGE_FAILED = "failed"
 
 
-def load_state(output_md_path: Path, pdf_path: Path | None = None) -> ConversionState:
-    """从状态文件加载转换进度，如果不存在则返回空状态
-    
-    Args:
-        output_md_path: Markdown 文件路径
-        pdf_path: 原始 PDF 文件路径（用于新状态初始化）
-    """
-    state_path = _state_file_path(output_md_path)
-    if not state_path.exists():
-        # 使用传入的 pdf_path 或默认推导
-        default_pdf_path = pdf_path or output_md_path.with_suffix(".pdf")
-        return ConversionState(pdf_path=default_pdf_path)
+def state_db_path(output_root: Path) -> Path:
+    """返回状态数据库路径（输出根目录下的 .convert_state.db）"""
+    return output_root / _STATE_DB_FILE_NAME
+
+
+def worker_state_db_path(output_root: Path, worker_id: str) -> Path:
+    """分布式模式下单个工作进程的状态数据库路径（各进程独立，避免多机共用同一 SQLite 文件）"""
+    return output_root / f".convert_state.{worker_id}.db"
+
 
+def _legacy_state_file_path(output_md_path: Path) -> Path:
+    return output_md_path.with_suffix(_LEGACY_STATE_FILE_SUFFIX)
+
+
+def _load_legacy_state(output_md_path: Path, pdf_path: Path) -> Optional[ConversionState]:
+    """读取旧版 JSON 状态文件，不存在或损坏时返回 None"""
+    state_path = _legacy_state_file_path(output_md_path)
+    if not state_path.exists():
+        return None
     try:
         data = json.loads(state_path.read_text(encoding="utf-8"))
-        state = ConversionState(
-            pdf_path=Path(data["pdf_path"]),
+        return ConversionState(
+            pdf_path=pdf_path,
             completed_pages=set(data.get("completed_pages", [])),
             failed_pages=set(data.get("failed_pages", [])),
             total_pages=data.get("total_pages"),
         )
+    except Exception as exc:
+        logger.warning("读取旧版状态文件失败，将重新开始：%s", exc)
+        return None
+
+
+@dataclass
+class PageStatusUpdate:
+    """一页的状态变更：完成或失败，附带本次尝试次数、耗时与错误信息"""
+    page_number: int
+    status: str
+    attempts: int = 1
+    elapsed_seconds: Optional[float] = None
+    error: Optional[str] = None
+    source: Optional[str] = None
+
+
+class StateStore:
+    """整个输出目录共用的转换状态库（SQLite，WAL 模式）。
+
+    documents 表记录每个 PDF 的总页数与整体状态，pages 表记录每页的状态、累计尝试次数、
+    最近一次耗时与错误。所有数据库操作都在一个专用线程中串行执行：
+    写入接口只提交任务、不等待，事件循环不做任何文件 I/O；读取接口为协程，等待专用线程返回结果。
+    由于同一线程按提交顺序执行，之后的读取总能看到之前提交的写入。
+    """
+
+    def __init__(self, output_root: Path, path: Optional[Path] = None) -> None:
+        self.output_root = output_root
+        self.path = path or state_db_path(output_root)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-db")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # ---- 专用线程内执行的同步操作 ----
+
+    def _key(self, output_md_path: Path) -> str:
+        """以相对输出根目录的路径为键，输出目录整体移动后状态仍然有效"""
+        try:
+            return output_md_path.relative_to(self.output_root).as_posix()
+        except ValueError:
+            return output_md_path.as_posix()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _load_sync(self, output_md_path: Path, pdf_path: Path) -> ConversionState:
+        conn = self._connection()
+        key = self._key(output_md_path)
+        row = conn.execute(
+            "SELECT total_pages, status FROM documents WHERE output_path = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            legacy = _load_legacy_state(output_md_path, pdf_path)
+            if legacy is None:
+                return ConversionState(pdf_path=pdf_path)
+            updates = [PageStatusUpdate(p, _PAGE_COMPLETED, attempts=0) for p in legacy.completed_pages]
+            updates += [PageStatusUpdate(p, _PAGE_FAILED, attempts=0) for p in legacy.failed_pages]
+            self._start_sync(output_md_path, pdf_path, legacy.total_pages)
+            self._write_pages_sync(output_md_path, updates)
+            _legacy_state_file_path(output_md_path).unlink(missing_ok=True)
+            logger.info("已将旧版状态文件迁移到状态库：%s", _legacy_state_file_path(output_md_path))
+            return legacy
+
+        total_pages, status = row
+        if status == _DOC_COMPLETED:
+            # 已完成的 PDF 再次被处理（内容变化或强制重跑），从头开始
+            self._clear_sync(output_md_path)
+            return ConversionState(pdf_path=pdf_path)
+
+        state = ConversionState(pdf_path=pdf_path, total_pages=total_pages)
+        for page, page_status in conn.execute(
+            "SELECT page, status FROM pages WHERE output_path = ?", (key,)
+        ):
+            if page_status == _PAGE_COMPLETED:
+                state.completed_pages.add(page)
+            elif page_status == _PAGE_FAILED:
+                state.failed_pages.add(page)
         logger.info(
             "加载转换状态：%s，已完成 %d 页，失败 %d 页",
-            state_path,
+            output_md_path,
             len(state.completed_pages),
             len(state.failed_pages),
         )
         return state
-    except Exception as exc:
-        logger.warning("读取状态文件失败，将重新开始：%s", exc)
-        default_pdf_path = pdf_path or output_md_path.with_suffix(".pdf")
-        return ConversionState(pdf_path=default_pdf_path)
-
-
-def save_state(state: ConversionState, output_md_path: Path) -> None:
-    """保存转换进度到状态文件（原子写入）"""
-    state_path = _state_file_path(output_md_path)
-    data = {
-        "pdf_path": str(state.pdf_path),
-        "completed_pages": sorted(state.completed_pages),
-        "failed_pages": sorted(state.failed_pages),
-        "total_pages": state.total_pages,
-    }
-    try:
-        # 确保目录存在
-        state_path.parent.mkdir(parents=True, exist_ok=True)
-        # 先写临时文件，再原子重命名
-        tmp_path = state_path.with_suffix(".tmp")
-        tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-        tmp_path.replace(state_path)
-    except Exception as exc:
-        logger.warning("保存状态文件失败：%s", exc)
 
+    def _start_sync(self, output_md_path: Path, pdf_path: Path, total_pages: Optional[int]) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO documents (output_path, pdf_path, total_pages, status, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(output_path) DO UPDATE SET
+                    pdf_path = excluded.pdf_path,
+                    total_pages = excluded.total_pages,
+                    status = excluded.status,
+                    updated_at = excluded.updated_at
+                """,
+                (self._key(output_md_path), str(pdf_path), total_pages, _DOC_IN_PROGRESS, time.time()),
+            )
 
-def clear_state(output_md_path: Path) -> None:
-    """删除状态文件，用于强制重新开始"""
-    state_path = _state_file_path(output_md_path)
-    if state_path.exists():
-        state_path.unlink()
-        logger.info("已删除状态文件：%s", state_path)
+    def _write_pages_sync(self, output_md_path: Path, updates: List[PageStatusUpdate]) -> None:
+        if not updates:
+            return
+        conn = self._connection()
+        key = self._key(output_md_path)
+        now = time.time()
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO pages (output_path, page, status, attempts, elapsed_seconds, error, source, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(output_path, page) DO UPDATE SET
+                    status = excluded.status,
+                    attempts = pages.attempts + excluded.attempts,
+                    elapsed_seconds = COALESCE(excluded.elapsed_seconds, pages.elapsed_seconds),
+                    error = excluded.error,
+                    source = COALESCE(excluded.source, pages.source),
+                    updated_at = excluded.updated_at
+                """,
+                [
+                    (key, u.page_number, u.status, u.attempts, u.elapsed_seconds, u.error, u.source, now)
+                    for u in updates
+                ],
+            )
 
+    def _complete_sync(self, output_md_path: Path) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "UPDATE documents SET status = ?, updated_at = ? WHERE output_path = ?",
+                (_DOC_COMPLETED, time.time(), self._key(output_md_path)),
+            )
 
-def list_states_with_progress(output_dir: Path) -> Dict[str, ConversionState]:
-    """列出输出目录下所有状态文件及其进度（用于调试）"""
-    states = {}
-    for state_file in output_dir.rglob(_STATE_FILE_SUFFIX):
+    def _clear_sync(self, output_md_path: Path) -> None:
+        conn = self._connection()
+        key = self._key(output_md_path)
+        with conn:
+            conn.execute("DELETE FROM pages WHERE output_path = ?", (key,))
+            conn.execute("DELETE FROM documents WHERE output_path = ?", (key,))
+        _legacy_state_file_path(output_md_path).unlink(missing_ok=True)
+
+    # ---- 对外接口 ----
+
+    def _submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("写入状态库失败：%s", future.exception())
+
+    async def load(self, output_md_path: Path, pdf_path: Path) -> ConversionState:
+        """加载 PDF 的转换进度，不存在时返回空状态（兼容迁移旧版 JSON 状态文件）"""
+        return await asyncio.wrap_future(self._executor.submit(self._load_sync, output_md_path, pdf_path))
+
+    async def clear(self, output_md_path: Path) -> None:
+        """删除 PDF 的全部状态，用于强制重新开始"""
+        await asyncio.wrap_future(self._executor.submit(self._clear_sync, output_md_path))
+
+    def start_document(self, output_md_path: Path, pdf_path: Path, total_pages: int) -> None:
+        """登记开始处理的 PDF（不等待写入完成）"""
+        self._submit(self._start_sync, output_md_path, pdf_path, total_pages)
+
+    def write_pages(self, output_md_path: Path, updates: List[PageStatusUpdate]) -> None:
+        """在一个事务中批量写入页状态（不等待写入完成）"""
+        self._submit(self._write_pages_sync, output_md_path, list(updates))
+
+    def complete_document(self, output_md_path: Path) -> None:
+        """标记 PDF 已全部完成（不等待写入完成）"""
+        self._submit(self._complete_sync, output_md_path)
+
+    def close(self) -> None:
+        """等待已提交的写入全部完成并关闭数据库"""
+
+        def close_sync() -> None:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        self._executor.submit(close_sync)
+        self._executor.shutdown(wait=True)
+
+
+def _progress_db_paths(output_root: Path) -> List[Path]:
+    """输出根目录下的全部状态库：单进程模式的 .convert_state.db 与分布式模式各工作进程的状态库"""
+    paths = [state_db_path(output_root)]
+    paths.extend(sorted(output_root.glob(".convert_state.*.db")))
+    return [path for path in paths if path.exists()]
+
+
+def _document_key(output_path: str) -> Tuple[str, bool]:
+    """分布式模式下页段的状态键（<目录>/.work/pages-x-y.md）映射为所属文档的键（<目录>/file.md）；
+    第二个返回值表示该键是否为页段"""
+    match = _WORK_UNIT_KEY.match(output_path)
+    if match is None:
+        return output_path, False
+    doc = match.group("doc")
+    return (f"{doc}/file.md" if doc else "file.md"), True
+
+
+def query_progress(output_root: Path) -> List[Dict[str, Any]]:
+    """返回输出目录下所有 PDF 的进度（只读，可在转换运行时调用）。
+
+    汇总全部状态库：分布式模式下同一 PDF 的各页段（可能由不同工作进程处理）合并为一条记录，
+    同一页在多个状态库中出现时（租约被接管后重做）以完成为准。
+    """
+    documents: Dict[str, Dict[str, Any]] = {}
+    pages: Dict[str, Dict[int, Tuple[str, int, float]]] = {}
+    for path in _progress_db_paths(output_root):
+        conn = sqlite3.connect(f"file:{path.as_posix()}?mode=ro", uri=True)
         try:
-            state = load_state(state_file.with_suffix(""))  # 去掉 .json 后缀
-            states[str(state.pdf_path.relative_to(output_dir))] = state
-        except Exception:
+            document_rows = conn.execute(
+                "SELECT output_path, pdf_path, total_pages, status FROM documents"
+            ).fetchall()
+            page_rows = conn.execute(
+                "SELECT output_path, page, status, attempts, elapsed_seconds FROM pages"
+            ).fetchall()
+        except sqlite3.DatabaseError as exc:
+            # 工作进程刚启动、尚未建表时跳过
+            logger.warning("读取状态库失败，已跳过：%s：%s", path, exc)
             continue
+        finally:
+            conn.close()
+        for output_path, pdf_path, total_pages, status in document_rows:
+            key, is_unit = _document_key(output_path)
+            document = documents.setdefault(
+                key,
+                {"pdf_path": pdf_path, "total_pages": None, "statuses": {}, "unit": False},
+            )
+            if total_pages is not None:
+                document["total_pages"] = max(document["total_pages"] or 0, total_pages)
+            # 同一页段在多个状态库中出现（被接管的进程留下未完成的记录）时以完成为准
+            if document["statuses"].get(output_path) != _DOC_COMPLETED:
+                document["statuses"][output_path] = status
+            document["unit"] = document["unit"] or is_unit
+        for output_path, page, status, attempts, elapsed in page_rows:
+            by_page = pages.setdefault(_document_key(output_path)[0], {})
+            previous = by_page.get(page)
+            if previous is None:
+                by_page[page] = (status, attempts, elapsed or 0.0)
+            else:
+                merged_status = _PAGE_COMPLETED if _PAGE_COMPLETED in (status, previous[0]) else status
+                by_page[page] = (merged_status, previous[1] + attempts, previous[2] + (elapsed or 0.0))
+
+    results = []
+    for key in sorted(documents):
+        document = documents[key]
+        by_page = pages.get(key, {})
+        completed = sum(1 for status, _, _ in by_page.values() if status == _PAGE_COMPLETED)
+        failed = sum(1 for status, _, _ in by_page.values() if status == _PAGE_FAILED)
+        status = _DOC_COMPLETED if set(document["statuses"].values()) == {_DOC_COMPLETED} else _DOC_IN_PROGRESS
+        total_pages = document["total_pages"]
+        # 页段各自完成不代表整本完成：仍有页段未开始时，已有的页段状态只覆盖部分页面
+        if status == _DOC_COMPLETED and document["unit"] and (total_pages is None or completed + failed < total_pages):
+            status = _DOC_IN_PROGRESS
+        results.append(
+            {
+                "output_path": key,
+                "pdf_path": document["pdf_path"],
+                "total_pages": total_pages,
+                "status": status,
+                "completed_pages": completed,
+                "failed_pages": failed,
+                "attempts": sum(attempts for _, attempts, _ in by_page.values()),
+                "elapsed_seconds": sum(elapsed for _, _, elapsed in by_page.values()),
+            }
+        )
+    return results
+
+
+def list_states_with_progress(output_dir: Path) -> Dict[str, ConversionState]:
+    """列出输出目录下所有 PDF 的转换进度（用于调试），以 PDF 路径为键"""
+    path = state_db_path(output_dir)
+    if not path.exists():
+        return {}
+    states: Dict[str, ConversionState] = {}
+    conn = sqlite3.connect(f"file:{path.as_posix()}?mode=ro", uri=True)
+    try:
+        for pdf_path, total_pages, page, page_status in conn.execute(
+            """
+            SELECT d.pdf_path, d.total_pages, p.page, p.status
+            FROM documents AS d
+            LEFT JOIN pages AS p ON p.output_path = d.output_path
+            """
+        ):
+            state = states.get(pdf_path)
+            if state is None:
+                state = states[pdf_path] = ConversionState(pdf_path=Path(pdf_path), total_pages=total_pages)
+            if page_status == _PAGE_COMPLETED:
+                state.completed_pages.add(page)
+            elif page_status == _PAGE_FAILED:
+                state.failed_pages.add(page)
+    finally:
+        conn.close()
     return states
 
 
-class GlobalBatchStateManager:
-    """全局批量状态管理器：所有 PDF 共享同一个计数器"""
-    
-    def __init__(self, batch_size: int = _DEFAULT_BATCH_SIZE):
-        self.batch_size = batch_size
-        self._pending_writes = 0
-        self._lock = threading.Lock()  # 线程安全
-        logger.info("初始化全局批量状态管理器：批次大小=%d", batch_size)
-    
-    def add_completed(self, state: ConversionState, output_md_path: Path, page_number: int) -> None:
-        """标记页面完成，并根据批次大小决定是否写入"""
-        with self._lock:
-            state.add_completed(page_number)
-            self._pending_writes += 1
-            logger.debug("页面 %d 完成，待写入计数=%d", page_number, self._pending_writes)
-            if self._pending_writes >= self.batch_size:
-                logger.info("达到批次大小 %d，写入状态文件", self.batch_size)
-                self._flush_unlocked(state, output_md_path)
-    
-    def add_failed(self, state: ConversionState, output_md_path: Path, page_number: int) -> None:
-        """标记页面失败，立即写入（失败页较少，优先保存）"""
-        with self._lock:
-            logger.info("页面 %d 失败，立即写入状态", page_number)
-            state.add_failed(page_number)
-            self._flush_unlocked(state, output_md_path)
-    
-    def _flush_unlocked(self, state: ConversionState, output_md_path: Path) -> None:
-        """内部方法：不加锁的刷新（调用者已加锁）"""
-        if self._pending_writes > 0:
-            logger.info("写入状态文件，已完成 %d 页", len(state.completed_pages))
-            save_state(state, output_md_path)
-            self._pending_writes = 0
-    
-    def flush(self, state: ConversionState, output_md_path: Path) -> None:
-        """立即写入状态文件"""
-        with self._lock:
-            self._flush_unlocked(state, output_md_path)
-    
-    def force_flush(self, state: ConversionState, output_md_path: Path) -> None:
-        """强制写入（程序退出时调用）"""
-        with self._lock:
-            logger.info("强制写入剩余状态，待写入计数=%d", self._pending_writes)
-            self._flush_unlocked(state, output_md_path)
-
-
-# 保持原有类以兼容现有代码
-class BatchStateManager(GlobalBatchStateManager):
-    """批量状态管理器：减少 I/O 次数（向后兼容）"""
-    def __init__(self, state: ConversionState, output_md_path: Path, batch_size: int = _DEFAULT_BATCH_SIZE):
-        super().__init__(batch_size)
+class BatchStateManager:
+    """单个 PDF 的批量状态管理器：在内存中更新进度，按批次把页状态提交给状态库。
+
+    完成页攒满 batch_size 个后在一个事务中写入；失败页立即提交。
+    提交不阻塞事件循环，实际写入在状态库的专用线程中完成。
+    """
+
+    def __init__(
+        self,
+        state: ConversionState,
+        store: StateStore,
+        output_md_path: Path,
+        batch_size: int = _DEFAULT_BATCH_SIZE,
+    ) -> None:
         self.state = state
+        self.store = store
         self.output_md_path = output_md_path
-    
-    def add_completed(self, page_number: int) -> None:
+        self.batch_size = batch_size
+        self._pending: List[PageStatusUpdate] = []
+
+    def add_completed(
+        self,
+        page_number: int,
+        attempts: int = 1,
+        elapsed_seconds: Optional[float] = None,
+        source: Optional[str] = None,
+    ) -> None:
         """标记页面完成，并根据批次大小决定是否写入"""
-        super().add_completed(self.state, self.output_md_path, page_number)
-    
-    def add_failed(self, page_number: int) -> None:
+        self.state.add_completed(page_number)
+        self._pending.append(
+            PageStatusUpdate(page_number, _PAGE_COMPLETED, attempts, elapsed_seconds, None, source)
+        )
+        logger.debug("页面 %d 完成，待写入计数=%d", page_number, len(self._pending))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def add_failed(
+        self,
+        page_number: int,
+        error: Optional[str] = None,
+        attempts: int = 1,
+        elapsed_seconds: Optional[float] = None,
+    ) -> None:
         """标记页面失败，立即写入（失败页较少，优先保存）"""
-        super().add_failed(self.state, self.output_md_path, page_number)
-    
+        logger.info("页面 %d 失败，立即写入状态", page_number)
+        self.state.add_failed(page_number)
+        self._pending.append(PageStatusUpdate(page_number, _PAGE_FAILED, attempts, elapsed_seconds, error))
+        self.flush()
+
     def flush(self) -> None:
-        """立即写入状态文件"""
-        super().flush(self.state, self.output_md_path)
-    
+        """把待写入的页状态作为一个事务提交给状态库"""
+        if self._pending:
+            self.store.write_pages(self.output_md_path, self._pending)
+            self._pending = []
+
     def force_flush(self) -> None:
-        """强制写入（程序退出时调用）"""
-        super().force_flush(self.state, self.output_md_path)
+        """强制写入（PDF 处理结束时调用）"""
+        logger.debug("强制写入剩余状态，待写入计数=%d", len(self._pending))
+        self.flush()
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# 页面上的水平条带：(上边界, 下边界)，以页面高度的比例表示（0~1）
+Band = Tuple[float, float]
+
+FULL_PAGE: Band = (0.0, 1.0)
+
+# 分块后每块提示词最多占用的上下文比例，其余留给生成的文本
+_PROMPT_CONTEXT_SHARE = 0.5
+
+
+@dataclass
+class TilingOptions:
+    """上下文超限时的分块 OCR 参数"""
+    # 单页最多切分的块数（决定最小块高 = 页高 / max_tiles）
+    max_tiles: int = 8
+    # 相邻块的重叠高度（页面高度的比例），需大于一行文字的高度
+    overlap: float = 0.05
+
+
+def estimate_tile_count(error_body: Optional[dict], max_tiles: int) -> int:
+    """按服务端报告的提示词 token 数与上下文长度估算需要切分的块数（至少 2 块）。
+
+    llama-server 的上下文超限错误体形如
+    {"error": {"n_prompt_tokens": 5120, "n_ctx": 4096, ...}}；缺少这些字段时按 2 块切分，
+    块仍超限时由调用方继续细分。
+    """
+    count = 2
+    error = (error_body or {}).get("error")
+    if isinstance(error, dict):
+        n_prompt = error.get("n_prompt_tokens")
+        n_ctx = error.get("n_ctx")
+        if isinstance(n_prompt, int) and isinstance(n_ctx, int) and n_ctx > 0:
+            count = math.ceil(n_prompt / (n_ctx * _PROMPT_CONTEXT_SHARE))
+    return max(2, min(count, max_tiles))
+
+
+def split_band(band: Band, count: int, options: TilingOptions) -> List[Band]:
+    """把条带等分为 count 个带重叠的子条带（自上而下）。
+
+    子条带高度不低于页高 / max_tiles；条带已无法继续切分时返回空列表。
+    """
+    top, bottom = band
+    height = bottom - top
+    min_height = 1.0 / max(1, options.max_tiles)
+    count = min(count, math.floor(height / min_height + 1e-9))
+    if count < 2:
+        return []
+    overlap = min(options.overlap, height / count / 2)
+    tile_height = (height + (count - 1) * overlap) / count
+    step = tile_height - overlap
+    bands = [(top + i * step, top + i * step + tile_height) for i in range(count)]
+    bands[-1] = (bands[-1][0], bottom)
+    return bands
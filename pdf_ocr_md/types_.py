@@ -2,7 +2,54 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+@dataclass
+class PdfMetadata:
+    """PDF 元数据探测结果（见 pdf/probe.py），可序列化到元数据索引"""
+    page_count: int = 0
+    # 各页裁剪框尺寸（宽, 高），单位为点（1/72 英寸）
+    page_sizes: List[Tuple[float, float]] = field(default_factory=list)
+    # 需要密码才能打开
+    encrypted: bool = False
+    # 打开时 PyMuPDF 做过结构修复（文件有轻微损坏）
+    repaired: bool = False
+    # 引用了字体（带文本层）的页数
+    text_layer_pages: int = 0
+    # 无法处理的原因（加密、损坏、无页面），None 表示可以处理
+    error: Optional[str] = None
+    size: Optional[int] = None
+    mtime_ns: Optional[int] = None
+
+    @property
+    def has_text_layer(self) -> bool:
+        return self.text_layer_pages > 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "page_count": self.page_count,
+            "page_sizes": [list(size) for size in self.page_sizes],
+            "encrypted": self.encrypted,
+            "repaired": self.repaired,
+            "text_layer_pages": self.text_layer_pages,
+            "error": self.error,
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PdfMetadata":
+        return cls(
+            page_count=data.get("page_count", 0),
+            page_sizes=[(w, h) for w, h in data.get("page_sizes", [])],
+            encrypted=data.get("encrypted", False),
+            repaired=data.get("repaired", False),
+            text_layer_pages=data.get("text_layer_pages", 0),
+            error=data.get("error"),
+            size=data.get("size"),
+            mtime_ns=data.get("mtime_ns"),
+        )
 
 
 @dataclass
@@ -10,6 +57,8 @@ class PdfTask:
     pdf_path: Path
     output_md_path: Path
     num_pages: Optional[int] = None
+    content_hash: Optional[str] = None
+    metadata: Optional[PdfMetadata] = None
 
 
 @dataclass
@@ -25,6 +74,24 @@ class PageOcrResult:
     success: bool
     error: Optional[str] = None
     raw_response: Optional[dict] = None
+    # 结果来源："ocr" 为模型识别，"text_layer" 为 PDF 文本层直抽，
+    # "dedup" 为复用相同图片的识别结果，"blank" 为本地判定的空白页
+    source: str = "ocr"
+    # 输出被提前截断的原因（复读、超出 token 预算、流式中止），None 表示完整结果
+    truncated: Optional[str] = None
+    # 本页 OCR 实际发出的请求次数（含重试）
+    attempts: int = 1
+    # 上下文超限后分块 OCR 的块数，0 表示整页识别
+    tiles: int = 0
+    # 与本页合并在同一次请求中的页数（含本页），1 表示单页请求
+    batch_size: int = 1
+    # 各阶段耗时（秒），阶段名见 metrics.STAGES
+    timings: Dict[str, float] = field(default_factory=dict)
+    # 发送的请求体字节数（含重试）
+    bytes_sent: int = 0
+    # 服务端 usage 报告的 token 数，未返回时为 None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
 
 
 @dataclass
@@ -34,6 +101,21 @@ class FileConvertResult:
     success: bool = False
     error: Optional[str] = None
     elapsed_seconds: float = 0.0
+    ocr_page_count: int = 0
+    text_layer_page_count: int = 0
+    truncated_page_count: int = 0
+    # 因去重而省去 OCR 的页数（整本复用时为全部页数）
+    dedup_page_count: int = 0
+    # 整本复用时，被复制的 Markdown 路径
+    duplicate_of: Optional[Path] = None
+    # 本地判定为空白而跳过 OCR 的页数
+    blank_page_count: int = 0
+    # 超出上下文后改为分块 OCR 的页数
+    tiled_page_count: int = 0
+    # 通过多页批量请求完成 OCR 的页数
+    batched_page_count: int = 0
+    # 文件级阶段耗时（秒），如 finalize（Markdown 后处理与原子替换）
+    timings: Dict[str, float] = field(default_factory=dict)
 
 
 @dataclass
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 直接运行 pytest 时也能导入仓库根目录下的 pdf_ocr_md
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
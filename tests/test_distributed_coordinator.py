@@ -0,0 +1,86 @@
+"""分布式协调器：页段反复出错或合并反复出错时不会无限等待，文档记为失败"""
+import asyncio
+from pathlib import Path
+from typing import Dict, List
+
+from pdf_ocr_md import distributed
+from pdf_ocr_md.config import AppConfig
+from pdf_ocr_md.distributed import DistributedCoordinator, WorkUnit
+from pdf_ocr_md.types_ import FileConvertResult, PageOcrResult, PdfMetadata, PdfTask
+
+
+def _coordinator(tmp_path: Path) -> DistributedCoordinator:
+    config = AppConfig(
+        input_dir=tmp_path / "in",
+        output_dir=tmp_path / "out",
+        distributed_enabled=True,
+        distributed_worker_id="w1",
+        distributed_range_pages=2,
+        distributed_lease_ttl=1.0,
+        distributed_heartbeat_interval=0.05,
+    )
+    pdf_task = PdfTask(
+        pdf_path=tmp_path / "in" / "doc.pdf",
+        output_md_path=tmp_path / "out" / "doc" / "file.md",
+        content_hash="hash",
+        metadata=PdfMetadata(page_count=4),
+    )
+    tasks = [pdf_task]
+
+    async def next_task():
+        return tasks.pop() if tasks else None
+
+    return DistributedCoordinator(config, next_task)
+
+
+def _run(coordinator: DistributedCoordinator, failing_first_page: int) -> Dict[int, int]:
+    """处理全部工作单元；first_page 为 failing_first_page 的页段总是出错。返回各页段的处理次数"""
+    calls: Dict[int, int] = {}
+    results: List[FileConvertResult] = []
+
+    async def process(unit: WorkUnit) -> FileConvertResult:
+        calls[unit.first_page] = calls.get(unit.first_page, 0) + 1
+        if unit.first_page == failing_first_page:
+            return FileConvertResult(pdf_task=unit.pdf_task, error="状态库初始化失败")
+        pages = [
+            PageOcrResult(page_number=p, text=None, success=False, error="Failed")
+            for p in range(unit.first_page, unit.last_page + 1)
+        ]
+        return FileConvertResult(pdf_task=unit.pdf_task, page_results=pages)
+
+    async def main():
+        coordinator.start()
+        try:
+            while (unit := await coordinator.next_unit()) is not None:
+                result = await coordinator.run_unit(unit, lambda unit=unit: process(unit))
+                if result is not None:
+                    results.append(result)
+            await coordinator.drain()
+        finally:
+            coordinator.close()
+
+    asyncio.run(asyncio.wait_for(main(), timeout=10.0))
+    return calls
+
+
+def test_failing_unit_is_retried_then_merged_as_failed(tmp_path: Path):
+    coordinator = _coordinator(tmp_path)
+    calls = _run(coordinator, failing_first_page=1)
+    assert calls == {1: distributed._MAX_UNIT_ATTEMPTS, 3: 1}
+    assert coordinator.documents_merged == 1
+    markdown = (tmp_path / "out" / "doc" / "file.md").read_text(encoding="utf-8")
+    assert "状态库初始化失败" in markdown
+
+
+def test_repeated_merge_errors_are_reported_as_failed(tmp_path: Path, monkeypatch):
+    coordinator = _coordinator(tmp_path)
+
+    def broken_merge(plan):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(coordinator, "_merge_sync", broken_merge)
+    _run(coordinator, failing_first_page=0)
+    assert coordinator.documents_merged == 0
+    assert [(r.success, r.error) for r in coordinator.failed_results] == [
+        (False, "合并 Markdown 失败: No space left on device")
+    ]
@@ -0,0 +1,85 @@
+"""分布式模式的租约文件：获取、过期接管、同一工作进程标识的会话区分与续期"""
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from pdf_ocr_md.distributed import DocumentPlan, LeaseFiles
+
+
+def _expire(lease_path: Path) -> None:
+    info = json.loads(lease_path.read_text(encoding="utf-8"))
+    info["expires_at"] = time.time() - 1.0
+    lease_path.write_text(json.dumps(info), encoding="utf-8")
+
+
+def test_acquire_creates_first_generation(tmp_path: Path):
+    lease = LeaseFiles("w1", ttl=60.0).acquire(tmp_path, "unit")
+    assert lease is not None
+    assert lease.generation == 1
+    assert lease.path == tmp_path / "unit.lease.1"
+    assert json.loads(lease.path.read_text(encoding="utf-8"))["worker"] == "w1"
+
+
+def test_live_lease_blocks_other_worker(tmp_path: Path):
+    assert LeaseFiles("w1", ttl=60.0).acquire(tmp_path, "unit") is not None
+    assert LeaseFiles("w2", ttl=60.0).acquire(tmp_path, "unit") is None
+
+
+def test_expired_lease_is_taken_over(tmp_path: Path):
+    first = LeaseFiles("w1", ttl=60.0).acquire(tmp_path, "unit")
+    _expire(first.path)
+    second = LeaseFiles("w2", ttl=60.0).acquire(tmp_path, "unit")
+    assert second is not None
+    assert second.generation == 2
+    assert not first.path.exists()
+
+
+def test_own_live_lease_is_not_reacquired(tmp_path: Path):
+    leases = LeaseFiles("w1", ttl=60.0)
+    assert leases.acquire(tmp_path, "merge") is not None
+    assert leases.acquire(tmp_path, "merge") is None
+
+
+def test_own_lease_from_previous_run_is_reclaimed(tmp_path: Path):
+    assert LeaseFiles("w1", ttl=60.0).acquire(tmp_path, "unit") is not None
+    # 同一工作进程标识重启后（新的会话）可以直接接管遗留的租约
+    restarted = LeaseFiles("w1", ttl=60.0).acquire(tmp_path, "unit")
+    assert restarted is not None
+    assert restarted.generation == 2
+
+
+def test_renew_fails_after_takeover(tmp_path: Path):
+    owner = LeaseFiles("w1", ttl=60.0)
+    lease = owner.acquire(tmp_path, "unit")
+    assert owner.renew(lease)
+    _expire(lease.path)
+    assert LeaseFiles("w2", ttl=60.0).acquire(tmp_path, "unit") is not None
+    assert not owner.renew(lease)
+
+
+def test_is_held_detects_takeover(tmp_path: Path):
+    owner = LeaseFiles("w1", ttl=60.0)
+    lease = owner.acquire(tmp_path, "merge")
+    assert owner.is_held(lease)
+    _expire(lease.path)
+    assert not owner.is_held(lease)
+    assert LeaseFiles("w2", ttl=60.0).acquire(tmp_path, "merge") is not None
+    assert not owner.is_held(lease)
+
+
+def test_release_allows_reacquire(tmp_path: Path):
+    leases = LeaseFiles("w1", ttl=60.0)
+    lease = leases.acquire(tmp_path, "unit")
+    leases.release(lease)
+    assert LeaseFiles("w2", ttl=60.0).acquire(tmp_path, "unit") is not None
+
+
+def test_plans_have_independent_merge_locks():
+    async def main():
+        first, second = DocumentPlan(pdf_task=None), DocumentPlan(pdf_task=None)
+        async with first.merge_lock:
+            assert first.merge_lock.locked()
+            assert not second.merge_lock.locked()
+
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""分布式模式下多个进程共享的输入清单与进度汇总"""
+from pathlib import Path
+
+from pdf_ocr_md.manifest import InputManifest
+from pdf_ocr_md.state_manager import PageStatusUpdate, StateStore, query_progress, worker_state_db_path
+
+
+def _pdf(root: Path, name: str) -> Path:
+    path = root / name
+    path.write_bytes(b"%PDF-1.4 " + name.encode())
+    return path
+
+
+def test_manifest_save_keeps_other_processes_entries(tmp_path: Path):
+    input_root, output_root = tmp_path / "in", tmp_path / "out"
+    input_root.mkdir()
+    first = InputManifest.load(input_root, output_root, "model", "preset")
+    second = InputManifest.load(input_root, output_root, "model", "preset")
+    first.record(_pdf(input_root, "a.pdf"), "hash-a")
+    second.record(_pdf(input_root, "b.pdf"), "hash-b")
+    first.save()
+    second.save()
+    reloaded = InputManifest.load(input_root, output_root, "model", "preset")
+    assert set(reloaded.entries) == {"a.pdf", "b.pdf"}
+    assert reloaded.entries["a.pdf"]["sha256"] == "hash-a"
+
+
+def test_manifest_auto_save_can_be_deferred(tmp_path: Path):
+    input_root, output_root = tmp_path / "in", tmp_path / "out"
+    input_root.mkdir()
+    manifest = InputManifest.load(input_root, output_root, "model", "preset")
+    manifest.auto_save = False
+    for index in range(12):
+        manifest.record(_pdf(input_root, f"{index}.pdf"), f"hash-{index}")
+    assert manifest.save_due
+    assert not manifest.path.exists()
+    manifest.save()
+    assert not manifest.save_due
+    assert len(InputManifest.load(input_root, output_root, "model", "preset").entries) == 12
+
+
+def _write(store: StateStore, key: Path, total_pages: int, pages, complete: bool) -> None:
+    store.start_document(key, Path("/in/doc.pdf"), total_pages)
+    store.write_pages(key, [PageStatusUpdate(page, status) for page, status in pages])
+    if complete:
+        store.complete_document(key)
+
+
+def test_query_progress_aggregates_worker_databases(tmp_path: Path):
+    doc_dir = tmp_path / "doc"
+    first = StateStore(tmp_path, worker_state_db_path(tmp_path, "w1"))
+    second = StateStore(tmp_path, worker_state_db_path(tmp_path, "w2"))
+    _write(first, doc_dir / ".work" / "pages-00001-00002.md", 4, [(1, "completed"), (2, "failed")], True)
+    _write(second, doc_dir / ".work" / "pages-00003-00004.md", 4, [(3, "completed")], False)
+    # 租约被接管后同一页段由另一个进程重做：同一页以完成为准
+    _write(second, doc_dir / ".work" / "pages-00001-00002.md", 4, [(2, "completed")], False)
+    first.close()
+    second.close()
+
+    rows = query_progress(tmp_path)
+    assert len(rows) == 1
+    row = rows[0]
+    assert row["output_path"] == "doc/file.md"
+    assert row["total_pages"] == 4
+    assert row["status"] == "in_progress"
+    assert (row["completed_pages"], row["failed_pages"], row["attempts"]) == (3, 0, 4)
+
+    # 剩余页段完成后整本完成，w2 中被接管页段的未完成记录不影响结果
+    third = StateStore(tmp_path, worker_state_db_path(tmp_path, "w3"))
+    _write(third, doc_dir / ".work" / "pages-00003-00004.md", 4, [(4, "completed")], True)
+    third.close()
+    row = query_progress(tmp_path)[0]
+    assert (row["status"], row["completed_pages"]) == ("completed", 4)
+
+
+def test_query_progress_single_database(tmp_path: Path):
+    store = StateStore(tmp_path)
+    _write(store, tmp_path / "a" / "file.md", 2, [(1, "completed"), (2, "completed")], True)
+    _write(store, tmp_path / "b" / "file.md", 3, [(1, "completed")], False)
+    store.close()
+    rows = query_progress(tmp_path)
+    assert [(row["output_path"], row["status"], row["completed_pages"]) for row in rows] == [
+        ("a/file.md", "completed", 2),
+        ("b/file.md", "in_progress", 1),
+    ]
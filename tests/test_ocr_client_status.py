@@ -0,0 +1,96 @@
+"""OcrClient 对各类 HTTP 状态码的处理：只有 2xx 记为成功，408/429/5xx 重试，其余 4xx 直接失败"""
+import asyncio
+import json
+from pathlib import Path
+from typing import List
+
+import httpx
+import pytest
+
+from pdf_ocr_md.config import AppConfig
+from pdf_ocr_md.ocr import client as client_module
+from pdf_ocr_md.ocr.client import CONTEXT_EXCEEDED_ERROR, OcrClient, _parse_retry_after
+
+
+def _ok(text: str = "page text") -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"message": {"content": text}, "finish_reason": "stop"}]})
+
+
+def _run(responses: List[httpx.Response], monkeypatch, max_retries: int = 3):
+    """按顺序返回 responses 中的响应，返回 (OCR 结果, 请求次数, 重试等待秒数列表)"""
+    config = AppConfig(
+        input_dir=Path("in"), output_dir=Path("out"), max_retries=max_retries, health_check_interval=0.0
+    )
+    requests: List[httpx.Request] = []
+    delays: List[float] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses[len(requests) - 1]
+
+    async def fake_sleep(delay: float) -> None:
+        delays.append(delay)
+
+    monkeypatch.setattr(client_module.asyncio, "sleep", fake_sleep)
+
+    async def main():
+        async with OcrClient(config) as client:
+            for endpoint in client._pool.endpoints:
+                await endpoint.client.aclose()
+                endpoint.client = httpx.AsyncClient(base_url=endpoint.url, transport=httpx.MockTransport(handler))
+            return await client.ocr_page(b"\x89PNG fake", 1, "prompt")
+
+    return asyncio.run(main()), len(requests), delays
+
+
+def test_success_on_200(monkeypatch):
+    result, calls, delays = _run([_ok("hello")], monkeypatch)
+    assert result.success and result.text == "hello"
+    assert (calls, delays, result.attempts) == (1, [], 1)
+
+
+@pytest.mark.parametrize("status", [404, 413, 401, 422])
+def test_other_4xx_fails_without_retry(status, monkeypatch):
+    result, calls, delays = _run([httpx.Response(status, text="nope")], monkeypatch)
+    assert not result.success
+    assert result.text is None
+    assert result.error == f"HTTP {status}: nope"
+    assert calls == 1 and delays == []
+
+
+def test_context_exceeded_is_reported(monkeypatch):
+    body = {"error": {"message": "the request exceeds the available context size", "n_prompt_tokens": 9000}}
+    result, calls, _ = _run([httpx.Response(400, text=json.dumps(body))], monkeypatch)
+    assert result.error == CONTEXT_EXCEEDED_ERROR
+    assert result.raw_response["error"]["n_prompt_tokens"] == 9000
+    assert calls == 1
+
+
+@pytest.mark.parametrize("status", [500, 503, 408])
+def test_retryable_status_then_success(status, monkeypatch):
+    result, calls, delays = _run([httpx.Response(status), httpx.Response(status), _ok()], monkeypatch)
+    assert result.success and result.attempts == 3
+    assert calls == 3
+    assert delays == [1, 2]
+
+
+def test_429_honours_retry_after(monkeypatch):
+    responses = [httpx.Response(429, headers={"Retry-After": "7"}), _ok()]
+    result, calls, delays = _run(responses, monkeypatch)
+    assert result.success and calls == 2
+    assert delays == [7.0]
+
+
+def test_retries_exhausted_fails(monkeypatch):
+    result, calls, delays = _run([httpx.Response(503)] * 3, monkeypatch, max_retries=2)
+    assert not result.success and result.error.startswith("HTTP 503")
+    assert calls == 3 and delays == [1, 2]
+
+
+def test_parse_retry_after():
+    assert _parse_retry_after(None) is None
+    assert _parse_retry_after("garbage") is None
+    assert _parse_retry_after("3.5") == 3.5
+    assert _parse_retry_after("-1") == 0.0
+    assert _parse_retry_after("100000") == 60.0
+    assert _parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
@@ -0,0 +1,88 @@
+"""页结果存储：追加写入、续传时重建索引、截断崩溃遗留的半行、忽略键不匹配的旧记录"""
+from pathlib import Path
+
+from pdf_ocr_md.page_store import PageResultStore, clear_page_store
+
+
+def _store(tmp_path: Path, pdf_hash: str = "hash", model: str = "model", prompt: str = "default") -> PageResultStore:
+    return PageResultStore(tmp_path / "doc" / "file.md", pdf_hash, model, prompt)
+
+
+def test_put_and_get(tmp_path: Path):
+    store = _store(tmp_path)
+    store.put(1, "第一页")
+    store.put(2, "page two\nwith newline")
+    assert store.get(1) == "第一页"
+    assert store.get(2) == "page two\nwith newline"
+    assert store.get(3) is None
+
+
+def test_resume_rebuilds_index_and_last_record_wins(tmp_path: Path):
+    first = _store(tmp_path)
+    first.put(1, "old")
+    first.put(2, "two")
+    first.put(1, "new")
+
+    resumed = _store(tmp_path)
+    assert resumed.load_index() == {1, 2}
+    assert resumed.get(1) == "new"
+    assert resumed.get(2) == "two"
+
+
+def test_truncated_trailing_line_is_cut_off(tmp_path: Path):
+    store = _store(tmp_path)
+    store.put(1, "complete")
+    size = store.path.stat().st_size
+    with store.path.open("ab") as f:
+        f.write(b'{"pdf_hash": "hash", "page": 2, "te')
+
+    resumed = _store(tmp_path)
+    assert resumed.load_index() == {1}
+    assert store.path.stat().st_size == size
+    # 截断后追加的记录不会与半行粘连
+    resumed.put(2, "after crash")
+    again = _store(tmp_path)
+    assert again.load_index() == {1, 2}
+    assert again.get(2) == "after crash"
+
+
+def test_corrupt_line_is_skipped(tmp_path: Path):
+    store = _store(tmp_path)
+    store.put(1, "one")
+    with store.path.open("ab") as f:
+        f.write(b"not json\n")
+    store.put(2, "two")
+    assert _store(tmp_path).load_index() == {1, 2}
+
+
+def test_records_with_other_identity_are_ignored(tmp_path: Path):
+    _store(tmp_path).put(1, "one")
+    assert _store(tmp_path, pdf_hash="changed").load_index() == set()
+    assert _store(tmp_path, model="other-model").load_index() == set()
+    assert _store(tmp_path, prompt="other-prompt").load_index() == set()
+    assert _store(tmp_path).load_index() == {1}
+
+
+def test_missing_file_and_clear(tmp_path: Path):
+    store = _store(tmp_path)
+    assert store.load_index() == set()
+    store.put(1, "one")
+    clear_page_store(store.output_md_path)
+    assert not store.path.exists()
+    assert _store(tmp_path).load_index() == set()
+
+
+def test_clear_resets_index(tmp_path: Path):
+    store = _store(tmp_path)
+    store.put(1, "one")
+    store.put(2, "two")
+    store.clear()
+    assert not store.path.exists()
+    assert store.get(1) is None
+    assert store.get(2) is None
+
+    # 清空后重新写入：偏移从新文件开头计算，旧页不会被读到
+    store.put(2, "新的第二页")
+    assert store.get(1) is None
+    assert store.get(2) == "新的第二页"
+    assert _store(tmp_path).load_index() == {2}
@@ -0,0 +1,103 @@
+"""逐片段后处理（postprocess_fragment + finish_markdown）与整篇 postprocess_markdown 的输出一致"""
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pytest
+
+from pdf_ocr_md.markdown.postprocess import finish_markdown, postprocess_fragment, postprocess_markdown
+from pdf_ocr_md.markdown.writer import StreamingMarkdownWriter, build_markdown
+from pdf_ocr_md.types_ import PageOcrResult, PdfTask
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+# 仓库中的真实 OCR 输出：test_output/ 下按页组织的 file.md 与 test/ 下的单页 Markdown
+_FIXTURES = sorted(_REPO_ROOT.glob("test_output/*/file.md")) + sorted(_REPO_ROOT.glob("test/*.md"))
+_PAGE_HEADING = re.compile(r"^## Page (\d+)$", re.MULTILINE)
+_FAILED_SUMMARY = "## OCR 失败页列表"
+
+
+def _page_results(markdown: str) -> List[PageOcrResult]:
+    """把输出文件还原为页结果：按 `## Page N` 切分；没有分页标题的文件整体视为第 1 页"""
+    markdown = markdown.split(_FAILED_SUMMARY, 1)[0]
+    headings = list(_PAGE_HEADING.finditer(markdown))
+    if not headings:
+        return [PageOcrResult(page_number=1, text=markdown, success=True)]
+    results = []
+    for index, heading in enumerate(headings):
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(markdown)
+        text = markdown[heading.end():end].strip("\n")
+        page_number = int(heading.group(1))
+        if text.startswith("> [OCR FAILED]"):
+            results.append(PageOcrResult(page_number=page_number, text=None, success=False, error="Failed"))
+        else:
+            results.append(PageOcrResult(page_number=page_number, text=text, success=True))
+    return results
+
+
+def _fragments(markdown: str) -> List[str]:
+    """按 StreamingMarkdownWriter 的分块方式切分 build_markdown 的输出：标题块、各页、失败页汇总"""
+    blocks: List[str] = []
+    for line in (markdown + "\n").splitlines(keepends=True):
+        if not blocks or line.startswith(("## Page ", _FAILED_SUMMARY)):
+            blocks.append("")
+        blocks[-1] += line
+    return blocks
+
+
+class _Store:
+    def __init__(self, texts: Dict[int, str]) -> None:
+        self._texts = texts
+
+    def get(self, page_number: int) -> Optional[str]:
+        return self._texts.get(page_number)
+
+
+def _task(root: Path, fixture: Path) -> PdfTask:
+    name = fixture.parent.name if fixture.name == "file.md" else fixture.stem
+    return PdfTask(pdf_path=root / f"{name}.pdf", output_md_path=root / name / "file.md")
+
+
+@pytest.fixture(params=_FIXTURES, ids=lambda path: path.parent.name if path.name == "file.md" else path.stem)
+def fixture_results(request) -> tuple:
+    path = request.param
+    return path, _page_results(path.read_text(encoding="utf-8"))
+
+
+def test_fixtures_found():
+    assert _FIXTURES
+
+
+def test_fragments_match_whole_document(tmp_path: Path, fixture_results):
+    path, results = fixture_results
+    markdown = build_markdown(_task(tmp_path, path), results)
+    fragments = _fragments(markdown)
+    assert "".join(fragments) == markdown + "\n"
+    converted = [postprocess_fragment(f, last=i == len(fragments) - 1) for i, f in enumerate(fragments)]
+    # 样例中的 HTML 都在页内闭合，每一块都应能单独转换
+    assert None not in converted
+    assert finish_markdown("".join(converted)) == postprocess_markdown(markdown)
+
+
+def test_streaming_writer_matches_build_markdown(tmp_path: Path, fixture_results):
+    path, results = fixture_results
+    task = _task(tmp_path, path)
+    writer = StreamingMarkdownWriter(task, len(results), _Store({r.page_number: r.text for r in results if r.success}))
+    writer.open()
+    # 页面乱序到达：倒序提交
+    for result in reversed(results):
+        if result.success:
+            writer.add_stored(result.page_number)
+        else:
+            writer.add(result)
+    writer.finalize()
+    assert task.output_md_path.read_text(encoding="utf-8") == postprocess_markdown(build_markdown(task, results))
+    assert not writer.partial_path.exists()
+    assert not writer.formatted_path.exists()
+
+
+def test_plain_fragment_skips_html_conversion():
+    assert postprocess_fragment("a_b  x*y\n") == "a\\_b x\\*y\n"
+
+
+def test_unclosed_html_requires_fallback():
+    assert postprocess_fragment("## Page 1\n\n<div>open\n\n") is None